@@ -0,0 +1,62 @@
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache
+
+CENT = Decimal('0.01')
+
+Installment = namedtuple('Installment', ['number', 'amount_due', 'principal', 'interest', 'balance'])
+
+
+def to_cents(value):
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def monthly_emi(loan_amount, annual_rate, term):
+    # EMI formula: P * r * (1+r)^n / ((1+r)^n - 1)
+    monthly_rate = Decimal(annual_rate) / Decimal('1200')
+    if monthly_rate == 0:
+        return to_cents(Decimal(loan_amount) / term)
+    growth = (1 + monthly_rate) ** term  # computed once, not per term of the formula
+    return to_cents(Decimal(loan_amount) * monthly_rate * growth / (growth - 1))
+
+
+@lru_cache(maxsize=1024)
+def amortization_schedule(loan_amount, annual_rate, term):
+    """Return the installments for a loan as a tuple of Installment rows.
+
+    Interest is charged on the remaining balance each month and rounded to
+    the cent; the final installment absorbs the rounding difference so the
+    balance ends at exactly zero. Results are cached on
+    ``(loan_amount, annual_rate, term)``, which repeat across applications
+    for the same product.
+    """
+    loan_amount = Decimal(loan_amount)
+    monthly_rate = Decimal(annual_rate) / Decimal('1200')
+    emi = monthly_emi(loan_amount, annual_rate, term)
+
+    installments = []
+    balance = loan_amount
+    for number in range(1, term + 1):
+        interest = to_cents(balance * monthly_rate)
+        if number == term:
+            principal = balance
+        else:
+            principal = min(emi - interest, balance)
+        balance -= principal
+        installments.append(Installment(number, principal + interest, principal, interest, balance))
+    return tuple(installments)
+
+
+def quote_schedules(configurations):
+    """Quote many ``(loan_amount, annual_rate, term)`` configurations at once.
+
+    Identical configurations are computed once and share the cached result.
+    """
+    quotes = {}
+    schedules = []
+    for loan_amount, annual_rate, term in configurations:
+        key = (Decimal(loan_amount), Decimal(annual_rate), int(term))
+        if key not in quotes:
+            quotes[key] = amortization_schedule(*key)
+        schedules.append(quotes[key])
+    return schedules
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CreditAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'credit_app'
+
+    def ready(self):
+        from . import checks  # noqa: F401
@@ -0,0 +1,53 @@
+from asgiref.sync import sync_to_async
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+import logging
+from .metrics import track_queries
+
+logger = logging.getLogger(__name__)
+
+# Each pool thread holds its own database connection, so the pool size caps
+# the connections one ASGI process opens. Size it to the connection budget and
+# set CONN_MAX_AGE so the threads keep their connections between requests.
+db_pool = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'ASYNC_DB_POOL_SIZE', 8),
+    thread_name_prefix='async-db'
+)
+publish_pool = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'ASYNC_PUBLISH_POOL_SIZE', 2),
+    thread_name_prefix='async-publish'
+)
+
+
+def resize_db_pool(size):
+    """Replace the DB pool with one of ``size`` threads (used by benchmarks)."""
+    global db_pool
+    old, db_pool = db_pool, ThreadPoolExecutor(max_workers=size, thread_name_prefix='async-db')
+    old.shutdown(wait=True)
+
+
+def call_in_pool(func, *args, **kwargs):
+    try:
+        # Queries on the pool thread still count towards the request's timing
+        with track_queries():
+            return func(*args, **kwargs)
+    finally:
+        # Honour CONN_MAX_AGE and drop broken connections, as the request
+        # signals do for the threads of a sync server
+        close_old_connections()
+
+
+async def run_db(func, *args, **kwargs):
+    """Run blocking ORM code from an async view on the bounded DB pool."""
+    return await sync_to_async(call_in_pool, thread_sensitive=False, executor=db_pool)(func, *args, **kwargs)
+
+
+def log_failure(future):
+    if future.exception() is not None:
+        logger.error('Background publish failed', exc_info=future.exception())
+
+
+def publish(func, *args):
+    """Run a broker publish in the background; the caller does not wait for it."""
+    publish_pool.submit(func, *args).add_done_callback(log_failure)
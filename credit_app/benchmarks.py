@@ -0,0 +1,37 @@
+from contextlib import contextmanager
+from django.db import DEFAULT_DB_ALIAS, connections
+import os
+import tempfile
+from .routers import replica_aliases
+from .sharding import shard_aliases
+
+
+@contextmanager
+def throwaway_databases(label):
+    """Run the block against fresh test databases instead of the configured ones.
+
+    Benchmarks create and delete their fixtures in bulk, so they get their own
+    migrated copy of the default database and of every transaction shard;
+    replicas read from the default copy. Everything is dropped on exit.
+    """
+    created = []
+    mirrored = {}
+    try:
+        for alias in dict.fromkeys((DEFAULT_DB_ALIAS, *shard_aliases())):
+            connection = connections[alias]
+            if connection.vendor == 'sqlite' and not connection.settings_dict['TEST']['NAME']:
+                # Client threads need a file to share; SQLite's in-memory
+                # test database locks whole tables instead of waiting
+                connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.mkdtemp(), f'{label}-{alias}.sqlite3')
+            created.append((connection, connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)))
+        for alias in replica_aliases():
+            mirrored[alias] = dict(connections[alias].settings_dict)
+            connections[alias].close()
+            connections[alias].creation.set_as_test_mirror(connections[DEFAULT_DB_ALIAS].settings_dict)
+        yield
+    finally:
+        for alias, settings_dict in mirrored.items():
+            connections[alias].close()
+            connections[alias].settings_dict.update(settings_dict)
+        for connection, old_name in reversed(created):
+            connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,302 @@
+from django.db import models, transaction
+from django.db.models import Q
+from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
+import logging
+import time
+import uuid
+from .models import Loan, BillingCycle, BillingRun, ScheduledInstallment
+from .statement_cache import invalidate_statements
+
+logger = logging.getLogger(__name__)
+
+BILLING_PERIOD = timedelta(days=30)
+GRACE_PERIOD = timedelta(days=15)
+LEASE_DURATION = timedelta(minutes=5)
+
+
+class BillingRunLocked(Exception):
+    pass
+
+
+class LeaseLost(Exception):
+    pass
+
+
+def build_billing_cycle(loan, today, installments=None):
+    """Return the unsaved BillingCycle due on ``loan.next_billing_date``, accrued to ``today``.
+
+    The amounts come from the loan's stored installment for that date when
+    ``installments`` (from ``due_installments``) has one; loans without a
+    stored schedule fall back to accruing interest on the principal balance.
+    The loan's ``next_billing_date`` is advanced in memory; the caller saves it.
+    """
+    billing_date = loan.next_billing_date
+    installment = (installments or {}).get((loan.id, billing_date))
+    if installment is not None:
+        loan.next_billing_date = billing_date + BILLING_PERIOD
+        return BillingCycle(
+            loan=loan,
+            billing_date=billing_date,
+            due_date=billing_date + GRACE_PERIOD,
+            min_due=installment.amount_due,
+            principal_portion=installment.principal,
+            interest_portion=installment.interest
+        )
+    
+    # The previous cycle (or disbursement) is always one period before the next one
+    days_since_last_billing = (today - (billing_date - BILLING_PERIOD)).days
+    
+    # Calculate daily interest
+    daily_interest_rate = round(loan.interest_rate / Decimal('365'), 3)
+    daily_interest_accrued = (loan.principal_balance * daily_interest_rate) / Decimal('100')
+    
+    # Calculate interest for the billing cycle
+    interest_accrued = daily_interest_accrued * days_since_last_billing
+    
+    # Calculate min due (3% of principal + interest)
+    principal_portion = loan.principal_balance * Decimal('0.03')
+    min_due = principal_portion + interest_accrued
+    
+    loan.next_billing_date = billing_date + BILLING_PERIOD
+    return BillingCycle(
+        loan=loan,
+        billing_date=billing_date,
+        due_date=billing_date + GRACE_PERIOD,
+        min_due=min_due,
+        principal_portion=principal_portion,
+        interest_portion=interest_accrued
+    )
+
+
+def due_installments(loans, today):
+    """Map ``(loan id, due date)`` to the unbilled stored installments of ``loans`` due by ``today``."""
+    return {
+        (installment.loan_id, installment.due_date): installment
+        for installment in ScheduledInstallment.objects.filter(
+            loan_id__in=[loan.id for loan in loans],
+            is_billed=False,
+            due_date__lte=today
+        )
+    }
+
+
+def loans_to_bill(today):
+    # Range scan on the partial index of active loans: only loans due by today
+    return Loan.objects.filter(
+        is_active=True,
+        next_billing_date__lte=today
+    )
+
+
+def shard_loans(loans, shard_index, shard_count):
+    # Loan ids are random uuid4s, so equal slices of the id space behave like
+    # a hash partition while still being a range scan on the primary key
+    if shard_count == 1:
+        return loans
+    lower = (1 << 128) * shard_index // shard_count
+    upper = (1 << 128) * (shard_index + 1) // shard_count
+    loans = loans.filter(id__gte=uuid.UUID(int=lower))
+    if shard_index + 1 < shard_count:
+        loans = loans.filter(id__lt=uuid.UUID(int=upper))
+    return loans
+
+
+def start_billing_run(billing_date, shard_index, shard_count, owner, lease=LEASE_DURATION, mode='BILLING'):
+    """Get or create the run record for this shard and take its lease.
+
+    A billing date has one run per mode, split into the shards it was started
+    with; a backfill can follow a regular run of the same date, as billing
+    each loan is guarded by its next_billing_date. Raises BillingRunLocked if
+    another live process holds the lease, or if the date's run in this mode
+    was started with another shard count.
+    """
+    run, _ = BillingRun.objects.get_or_create(
+        billing_date=billing_date,
+        mode=mode,
+        shard_index=shard_index,
+        defaults={'shard_count': shard_count}
+    )
+    other = BillingRun.objects.filter(billing_date=billing_date, mode=mode).exclude(shard_count=shard_count).first()
+    if other:
+        raise BillingRunLocked(
+            f'Billing for {billing_date} was started as {other}; '
+            f'finish it with --shard N/{other.shard_count}{" --backfill" if other.mode == "BACKFILL" else ""}'
+        )
+    now = timezone.now()
+    acquired = BillingRun.objects.filter(pk=run.pk).filter(
+        Q(lease_owner=owner) | Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lt=now)
+    ).update(lease_owner=owner, lease_expires_at=now + lease)
+    if not acquired:
+        run.refresh_from_db()
+        raise BillingRunLocked(
+            f'{run} is held by {run.lease_owner} until {run.lease_expires_at:%Y-%m-%d %H:%M:%S}'
+        )
+    run.refresh_from_db()
+    return run
+
+
+class RunCheckpoint:
+    """Advances a BillingRun checkpoint inside the transaction that billed the loans.
+
+    Every save also renews the lease; if another process took the lease over,
+    LeaseLost is raised so the surrounding transaction rolls back.
+    """
+
+    def __init__(self, run, owner, lease=LEASE_DURATION):
+        self.run = run
+        self.owner = owner
+        self.lease = lease
+
+    def save(self, last_loan_id, loans, cycles):
+        updated = BillingRun.objects.filter(pk=self.run.pk, lease_owner=self.owner).update(
+            last_loan_id=last_loan_id,
+            loans_processed=models.F('loans_processed') + loans,
+            cycles_created=models.F('cycles_created') + cycles,
+            lease_expires_at=timezone.now() + self.lease
+        )
+        if not updated:
+            raise LeaseLost(f'Lease on {self.run} was taken over by another process')
+
+    def finish(self):
+        BillingRun.objects.filter(pk=self.run.pk, lease_owner=self.owner).update(
+            status='COMPLETED',
+            finished_at=timezone.now(),
+            lease_owner='',
+            lease_expires_at=None
+        )
+
+
+def claim_billing(loan, billing_date):
+    """Move the loan's stored next_billing_date from ``billing_date`` to its in-memory value.
+
+    Returns False if another process billed the loan since it was read; its
+    cycles must then be dropped.
+    """
+    return Loan.objects.filter(pk=loan.pk, next_billing_date=billing_date).update(
+        next_billing_date=loan.next_billing_date
+    ) == 1
+
+
+def unbilled_loans(loans, cycles_by_loan):
+    # Lock the chunk and keep the loans whose next_billing_date is still the
+    # one their cycles were built from; the rest were billed meanwhile by
+    # another shard layout or by per-loan mode
+    current = dict(Loan.objects.select_for_update().filter(
+        id__in=[loan.id for loan in loans if cycles_by_loan.get(loan.id)]
+    ).values_list('id', 'next_billing_date'))
+    return [
+        loan for loan in loans
+        if cycles_by_loan.get(loan.id) and current.get(loan.id) == cycles_by_loan[loan.id][0].billing_date
+    ]
+
+
+def loan_chunks(loans, chunk_size, last_id=None):
+    # Keyset pagination over the primary key keeps each chunk query cheap
+    while True:
+        page = loans.order_by('id')
+        if last_id is not None:
+            page = page.filter(id__gt=last_id)
+        chunk = list(page[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1].id
+
+
+def build_missed_cycles(loan, until, installments=None):
+    """Return every cycle the loan should have had up to ``until``, oldest first.
+
+    Each cycle accrues interest from the previous cycle to its own billing
+    date, as if billing had run on schedule.
+    """
+    cycles = []
+    while loan.next_billing_date <= until:
+        cycles.append(build_billing_cycle(loan, loan.next_billing_date, installments))
+    return cycles
+
+
+def bill_chunk(loans, today, checkpoint=None, backfill=False):
+    """Create the billing cycles due for every loan in ``loans``.
+
+    Normally each loan gets its next cycle; with ``backfill`` every missed
+    cycle up to ``today`` is generated. The whole chunk is written with one
+    bulk insert; if that fails, each loan is retried in its own transaction
+    so one bad loan cannot block the rest. ``checkpoint`` (a RunCheckpoint)
+    is advanced in the same transactions.
+    Returns ``(cycles, errors)`` where errors maps loan id to the exception.
+    """
+    cycles_by_loan = {}
+    errors = {}
+    installments = due_installments(loans, today)
+    for loan in loans:
+        try:
+            if backfill:
+                cycles_by_loan[loan.id] = build_missed_cycles(loan, today, installments)
+            else:
+                cycles_by_loan[loan.id] = [build_billing_cycle(loan, today, installments)]
+        except Exception as e:
+            errors[loan.id] = e
+    
+    try:
+        with transaction.atomic():
+            billable = unbilled_loans(loans, cycles_by_loan)
+            cycles = [cycle for loan in billable for cycle in cycles_by_loan[loan.id]]
+            BillingCycle.objects.bulk_create(cycles)
+            ScheduledInstallment.objects.mark_billed(cycles)
+            invalidate_statements(cycle.loan_id for cycle in cycles)
+            Loan.objects.bulk_update(billable, ['next_billing_date'])
+            if checkpoint:
+                checkpoint.save(loans[-1].id, len(loans), len(cycles))
+        return cycles, errors
+    except LeaseLost:
+        raise
+    except Exception:
+        logger.exception('Bulk billing of %d loans failed; billing them one at a time', len(loans))
+    
+    created = []
+    for loan in loans:
+        loan_cycles = cycles_by_loan.get(loan.id, [])
+        try:
+            with transaction.atomic():
+                if loan_cycles and not claim_billing(loan, loan_cycles[0].billing_date):
+                    loan_cycles = []
+                if loan_cycles:
+                    BillingCycle.objects.bulk_create(loan_cycles)
+                    ScheduledInstallment.objects.mark_billed(loan_cycles)
+                    invalidate_statements([loan.id])
+                if checkpoint:
+                    checkpoint.save(loan.id, 1, len(loan_cycles))
+            created.extend(loan_cycles)
+        except LeaseLost:
+            raise
+        except Exception as e:
+            errors[loan.id] = e
+    return created, errors
+
+
+def run_batch_billing(today, chunk_size=1000, on_chunk=None, shard=(0, 1), run=None, checkpoint=None,
+                      backfill=False):
+    """Bill every due loan chunk by chunk; ``on_chunk(stats)`` runs after each chunk.
+
+    With a ``run`` and its ``checkpoint``, billing resumes after the run's
+    last checkpointed loan and the run is marked completed at the end.
+    With ``backfill``, all missed cycles up to ``today`` are created.
+    """
+    started = time.monotonic()
+    stats = {'loans': 0, 'cycles': 0, 'errors': {}, 'seconds': 0.0}
+    loans = shard_loans(loans_to_bill(today), *shard)
+    last_id = run.last_loan_id if run else None
+    for chunk in loan_chunks(loans, chunk_size, last_id):
+        cycles, errors = bill_chunk(chunk, today, checkpoint, backfill)
+        stats['loans'] += len(chunk)
+        stats['cycles'] += len(cycles)
+        stats['errors'].update(errors)
+        stats['seconds'] = time.monotonic() - started
+        if on_chunk:
+            on_chunk(stats)
+    if checkpoint:
+        checkpoint.finish()
+    stats['seconds'] = time.monotonic() - started
+    return stats
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, Warning, register
+
+# Cache aliases whose entries must be seen by every web process, Celery
+# worker and management command: (check id, setting naming the alias, its
+# default, what goes wrong on a per-process cache)
+SHARED_CACHES = (
+    ('credit_app.E001', 'STATEMENT_CACHE_ALIAS', 'statements',
+     'statement versions invalidated by process_billing and import_payments are never dropped in the web processes'),
+)
+
+
+def process_local(alias):
+    """Whether cache ``alias`` lives in this process's memory, out of reach of other processes."""
+    return isinstance(caches[alias], LocMemCache)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_caches(app_configs, **kwargs):
+    errors = []
+    for check_id, name, default, problem in SHARED_CACHES:
+        alias = getattr(settings, name, default)
+        if process_local(alias):
+            errors.append(Error(
+                f"The '{alias}' cache ({name}) is a LocMemCache: {problem}.",
+                hint='Point it at a cache shared between processes, e.g. django_redis.cache.RedisCache.',
+                id=check_id,
+            ))
+    # Without a shared pin cache every per-loan read stays on the primary
+    if getattr(settings, 'DATABASE_REPLICAS', ()):
+        alias = getattr(settings, 'REPLICA_PIN_CACHE_ALIAS', 'default')
+        if process_local(alias):
+            errors.append(Warning(
+                f"The '{alias}' cache (REPLICA_PIN_CACHE_ALIAS) is a LocMemCache: loans written by other "
+                "processes can't be pinned to the primary, so statement reads never use the replicas.",
+                hint='Point it at a cache shared between processes, e.g. django_redis.cache.RedisCache.',
+                id='credit_app.W001',
+            ))
+    return errors
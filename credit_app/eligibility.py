@@ -0,0 +1,157 @@
+from collections import OrderedDict, namedtuple
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+import threading
+import time
+from .checks import process_local
+
+MIN_CREDIT_SCORE = 450
+MIN_ANNUAL_INCOME = Decimal('150000')
+SCORE_PENDING = 'Credit score not calculated yet'
+
+# error is None when the user passes every rule
+Verdict = namedtuple('Verdict', ['user_id', 'aadhar_id', 'error'])
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+def eligibility_cache():
+    """The shared verdict cache, or None when it is a per-process cache.
+
+    Verdicts in a process-local cache would outlive invalidations made by
+    other processes for the whole cache TIMEOUT, so then only the short-lived
+    local tier is used.
+    """
+    alias = setting('ELIGIBILITY_CACHE_ALIAS', 'default')
+    return None if process_local(alias) else caches[alias]
+
+
+def verdict_key(user_id):
+    return f'eligibility:{user_id}'
+
+
+class LocalVerdictCache:
+    """Bounded LRU of verdicts in front of the shared cache.
+
+    Entries expire after ELIGIBILITY_LOCAL_TTL seconds, which bounds how long
+    an invalidation made by another process can go unnoticed here.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.stats[name] += amount
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            verdict, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self.entries[user_id]
+                return None
+            self.entries.move_to_end(user_id)
+            self.stats['local_hits'] += 1
+            return verdict
+
+    def set(self, user_id, verdict):
+        with self.lock:
+            self.entries[user_id] = (verdict, time.monotonic() + self.ttl)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def discard(self, user_ids):
+        with self.lock:
+            for user_id in user_ids:
+                self.entries.pop(user_id, None)
+            self.stats['invalidations'] += len(user_ids)
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats, size=len(self.entries), max_entries=self.max_entries)
+        lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['local_hits'] + stats['shared_hits']) / lookups if lookups else 0.0
+        return stats
+
+
+local_verdicts = LocalVerdictCache(
+    setting('ELIGIBILITY_LOCAL_MAX_ENTRIES', 10000),
+    setting('ELIGIBILITY_LOCAL_TTL', 5)
+)
+
+
+def evaluate(user):
+    if user.credit_score is None:
+        error = SCORE_PENDING
+    elif user.credit_score < MIN_CREDIT_SCORE:
+        error = 'Credit score too low'
+    elif user.annual_income < MIN_ANNUAL_INCOME:
+        error = 'Annual income too low'
+    else:
+        error = None
+    return Verdict(user.id, user.aadhar_id, error)
+
+
+def eligibility_verdict(user_id):
+    """Return the cached underwriting verdict for a user, evaluating it on a miss.
+
+    Raises ``User.DoesNotExist`` for unknown users. Verdicts for users without
+    a credit score yet are not cached, since scoring is about to change them.
+    """
+    # The API sends user ids as UUIDs; key the caches by the integer pk
+    user_id = int(user_id)
+    verdict = local_verdicts.get(user_id)
+    if verdict is not None:
+        return verdict
+
+    shared = eligibility_cache()
+    verdict = shared.get(verdict_key(user_id)) if shared is not None else None
+    if verdict is not None:
+        local_verdicts.count('shared_hits')
+        local_verdicts.set(user_id, verdict)
+        return verdict
+
+    local_verdicts.count('misses')
+    user = get_user_model().objects.only('id', 'aadhar_id', 'credit_score', 'annual_income').get(id=user_id)
+    verdict = evaluate(user)
+    if user.credit_score is not None:
+        if shared is not None:
+            shared.set(verdict_key(user_id), verdict)
+        local_verdicts.set(user_id, verdict)
+    return verdict
+
+
+def invalidate_eligibility(user_ids):
+    """Drop the cached verdicts of ``user_ids`` once the current transaction commits.
+
+    Call this from every code path that changes a user's credit score or income.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+
+    def invalidate():
+        local_verdicts.discard(user_ids)
+        shared = eligibility_cache()
+        if shared is not None:
+            shared.delete_many([verdict_key(user_id) for user_id in user_ids])
+    transaction.on_commit(invalidate)
+
+
+def eligibility_stats():
+    """Hit, miss and eviction counts of this process's verdict cache."""
+    return local_verdicts.snapshot()
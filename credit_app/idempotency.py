@@ -0,0 +1,202 @@
+from collections import OrderedDict, namedtuple
+from datetime import timedelta
+from functools import wraps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+import hashlib
+import random
+import threading
+import time
+from .models import IdempotencyKey
+
+StoredResponse = namedtuple('StoredResponse', ['request_hash', 'status', 'body', 'expires_at'])
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+class LocalResponseStore:
+    """Bounded LRU of completed responses with per-entry expiry, shared by the threads of one process."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            stored = self.entries.get(key)
+            if stored is None:
+                return None
+            if stored.expires_at <= timezone.now():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return stored
+
+    def set(self, key, stored):
+        with self.lock:
+            self.entries[key] = stored
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+local_store = LocalResponseStore(setting('IDEMPOTENCY_LOCAL_MAX_ENTRIES', 10000))
+
+# Requests currently running in this process, so duplicates can wait on them
+in_flight = {}
+in_flight_lock = threading.Lock()
+
+
+def replay(stored, request_hash):
+    if stored.request_hash != request_hash:
+        return Response({
+            'error': 'Idempotency-Key was already used for a different request'
+        }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    response = HttpResponse(stored.body, status=stored.status, content_type='application/json')
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def load_completed(scope, key):
+    record = IdempotencyKey.objects.filter(
+        scope=scope, key=key, status='DONE', expires_at__gt=timezone.now()
+    ).first()
+    if record is None:
+        return None
+    stored = StoredResponse(record.request_hash, record.response_status, record.response_body, record.expires_at)
+    local_store.set((scope, key), stored)
+    return stored
+
+
+def claim(scope, key, request_hash):
+    """Insert a PENDING row for the key; return True if this request owns it."""
+    now = timezone.now()
+    if random.random() < 0.01:
+        IdempotencyKey.objects.filter(expires_at__lte=now).delete()
+
+    # Expired keys, and pending keys whose owner died, can be taken over
+    stale_pending = now - timedelta(seconds=setting('IDEMPOTENCY_PENDING_TIMEOUT', 60))
+    IdempotencyKey.objects.filter(scope=scope, key=key, expires_at__lte=now).delete()
+    IdempotencyKey.objects.filter(scope=scope, key=key, status='PENDING', created_at__lte=stale_pending).delete()
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(
+                scope=scope,
+                key=key,
+                request_hash=request_hash,
+                expires_at=now + timedelta(seconds=setting('IDEMPOTENCY_TTL', 24 * 3600))
+            )
+        return True
+    except IntegrityError:
+        return False
+
+
+def wait_for_original(scope, key):
+    # Wake immediately for duplicates in this process; poll for other processes
+    deadline = time.monotonic() + setting('IDEMPOTENCY_WAIT_SECONDS', 10)
+    with in_flight_lock:
+        event = in_flight.get((scope, key))
+    if event is not None:
+        event.wait(max(deadline - time.monotonic(), 0))
+        stored = local_store.get((scope, key))
+        if stored is not None:
+            return stored
+    while time.monotonic() < deadline:
+        stored = load_completed(scope, key)
+        if stored is not None:
+            return stored
+        if not IdempotencyKey.objects.filter(scope=scope, key=key).exists():
+            return None  # the original failed and released the key
+        time.sleep(0.05)
+    return None
+
+
+def storable(response):
+    return isinstance(response, Response) and 200 <= response.status_code < 300
+
+
+def store_response(request, response):
+    """Mark the request's Idempotency-Key DONE with ``response`` and return it.
+
+    Views that write call this inside their transaction, so their writes and
+    the DONE record commit or roll back together. Does nothing for requests
+    without a key, for failed responses, and for keys already marked DONE.
+    """
+    claimed = getattr(request, 'idempotency', None)
+    if claimed is None or not storable(response):
+        return response
+    scope, key, request_hash = claimed
+    body = JSONRenderer().render(response.data).decode('utf-8')
+    expires_at = timezone.now() + timedelta(seconds=setting('IDEMPOTENCY_TTL', 24 * 3600))
+    updated = IdempotencyKey.objects.filter(scope=scope, key=key, status='PENDING').update(
+        status='DONE',
+        response_status=response.status_code,
+        response_body=body,
+        expires_at=expires_at
+    )
+    if updated:
+        stored = StoredResponse(request_hash, response.status_code, body, expires_at)
+        transaction.on_commit(lambda: local_store.set((scope, key), stored))
+    return response
+
+
+def idempotent(scope):
+    """Make an APIView ``post`` replay its response for a repeated Idempotency-Key.
+
+    Only successful (2xx) responses are stored; failures release the key so a
+    retry runs again. A duplicate that arrives while the original is still
+    running waits for it instead of running in parallel. Views that write
+    should record their response with store_response inside their transaction;
+    otherwise it is recorded once the view returns.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            key = request.headers.get('Idempotency-Key')
+            if not key:
+                return method(view, request, *args, **kwargs)
+            if len(key) > 255:
+                return Response({
+                    'error': 'Idempotency-Key must be at most 255 characters'
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            request_hash = hashlib.sha256(request.body).hexdigest()
+            stored = local_store.get((scope, key)) or load_completed(scope, key)
+            if stored is not None:
+                return replay(stored, request_hash)
+
+            while not claim(scope, key, request_hash):
+                stored = wait_for_original(scope, key)
+                if stored is not None:
+                    return replay(stored, request_hash)
+                if IdempotencyKey.objects.filter(scope=scope, key=key, status='PENDING').exists():
+                    return Response({
+                        'error': 'A request with this Idempotency-Key is still in progress'
+                    }, status=status.HTTP_409_CONFLICT)
+
+            event = threading.Event()
+            with in_flight_lock:
+                in_flight[(scope, key)] = event
+            request.idempotency = (scope, key, request_hash)
+            try:
+                response = store_response(request, method(view, request, *args, **kwargs))
+                if not storable(response):
+                    IdempotencyKey.objects.filter(scope=scope, key=key, status='PENDING').delete()
+                return response
+            except Exception:
+                IdempotencyKey.objects.filter(scope=scope, key=key, status='PENDING').delete()
+                raise
+            finally:
+                with in_flight_lock:
+                    in_flight.pop((scope, key), None)
+                event.set()
+        return wrapper
+    return decorator
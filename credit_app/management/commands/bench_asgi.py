@@ -0,0 +1,186 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client
+from datetime import date, timedelta
+from decimal import Decimal
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from ... import async_db
+from ...benchmarks import throwaway_databases
+from ...metrics import percentile
+from ...models import User, Loan, BillingCycle, Payment
+
+BENCH_AADHAR_PREFIX = '98'
+
+# WSGI (sync DRF view) and ASGI (native async view) paths for each endpoint
+ENDPOINTS = {
+    'home': ('/', '/api/async/'),
+    'statement': ('/api/get-statement/', '/api/async/get-statement/'),
+    'register': ('/api/register-user/', '/api/async/register-user/'),
+}
+
+
+class HostAsyncClient(AsyncClient):
+    """AsyncClient that sends ``host`` as the Host header.
+
+    On Django 3.2 AsyncClient ignores HTTP_HOST and always sends 'testserver',
+    which ALLOWED_HOSTS rejects.
+    """
+
+    def __init__(self, host, **defaults):
+        super().__init__(**defaults)
+        self.host = host.encode('ascii')
+
+    async def request(self, **request):
+        request['headers'] = [
+            (name, self.host if name == b'host' else value) for name, value in request.get('headers', [])
+        ]
+        return await super().request(**request)
+
+
+def registration(n):
+    suffix = uuid.uuid4().hex[:10]
+    return {
+        'aadhar_id': BENCH_AADHAR_PREFIX + str(uuid.uuid4().int)[:10],
+        'username': f'bench-asgi-{n}-{suffix}',
+        'email_id': f'bench-{n}-{suffix}@example.com',
+        'annual_income': '500000'
+    }
+
+
+class Command(BaseCommand):
+    help = ('Compare WSGI (sync views, one thread per worker) with ASGI (async views, '
+            'DB pool of the same size) on one endpoint. Runs against a throwaway test database '
+            'created from the default one, never the configured database itself.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='statement')
+        parser.add_argument('--requests', type=int, default=1000,
+                            help='Requests sent to each server')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='WSGI worker threads, and ASGI DB pool threads')
+        parser.add_argument('--concurrency', type=int, default=32,
+                            help='Clients sending requests at the same time')
+        parser.add_argument('--payments', type=int, default=50,
+                            help='Payments on the loan used by the statement endpoint')
+
+    def handle(self, *args, **options):
+        if min(options['requests'], options['workers'], options['concurrency']) < 1:
+            raise CommandError('--requests, --workers and --concurrency must be positive')
+
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        with throwaway_databases('bench-asgi'):
+            user = User.objects.create_user(
+                username=f'bench-{uuid.uuid4().hex[:12]}',
+                aadhar_id=BENCH_AADHAR_PREFIX + str(uuid.uuid4().int)[:10],
+                annual_income=Decimal('1000000'),
+                credit_score=900
+            )
+            loan = self.create_loan(user, options['payments'])
+            wsgi_path, asgi_path = ENDPOINTS[options['endpoint']]
+            self.report('WSGI', self.run_wsgi(wsgi_path, loan, options))
+            async_db.resize_db_pool(options['workers'])
+            self.report('ASGI', asyncio.run(self.run_asgi(asgi_path, loan, options)))
+
+    def create_loan(self, user, payments):
+        loan = Loan.objects.create(
+            user=user,
+            loan_type='CREDIT_CARD',
+            loan_amount=Decimal('100000.00'),
+            principal_balance=Decimal('100000.00'),
+            interest_rate=Decimal('12'),
+            term_period=12,
+            disbursement_date=date.today(),
+            next_billing_date=date.today() + timedelta(days=30)
+        )
+        BillingCycle.objects.bulk_create([BillingCycle(
+            loan=loan,
+            billing_date=date.today() + timedelta(days=30 * (i + 1)),
+            due_date=date.today() + timedelta(days=30 * (i + 1) + 15),
+            min_due=Decimal('100.00'),
+            principal_portion=Decimal('90.00'),
+            interest_portion=Decimal('10.00'),
+            is_paid=i < payments
+        ) for i in range(payments + 3)])
+        cycles = list(BillingCycle.objects.filter(loan=loan, is_paid=True))
+        Payment.objects.bulk_create([Payment(billing_cycle=cycle, amount=Decimal('100.00')) for cycle in cycles])
+        return loan
+
+    def request_args(self, endpoint, loan, n):
+        if endpoint.endswith('register-user/'):
+            return 'post', {'data': registration(n), 'content_type': 'application/json'}
+        if endpoint.endswith('get-statement/'):
+            # AsyncClient on this Django version drops the data argument of get()
+            return 'get', {'path': f'{endpoint}?loan_id={loan.id}'}
+        return 'get', {}
+
+    def run_wsgi(self, endpoint, loan, options):
+        # Closed loop: each client sends its next request when the last one
+        # returns; a semaphore limits the server to --workers requests at once
+        server = threading.Semaphore(options['workers'])
+        counter = iter(range(options['requests']))
+        lock = threading.Lock()
+        latencies, failures = [], []
+
+        def client_loop():
+            client = Client(HTTP_HOST='localhost')
+            try:
+                while True:
+                    with lock:
+                        n = next(counter, None)
+                    if n is None:
+                        return
+                    method, kwargs = self.request_args(endpoint, loan, n)
+                    kwargs.setdefault('path', endpoint)
+                    started = time.perf_counter()
+                    with server:
+                        response = getattr(client, method)(**kwargs)
+                    latencies.append(time.perf_counter() - started)
+                    if response.status_code != 200:
+                        failures.append(response.status_code)
+            finally:
+                connection.close()
+
+        connection.close()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            for future in [pool.submit(client_loop) for _ in range(options['concurrency'])]:
+                future.result()
+        return latencies, failures, time.perf_counter() - started
+
+    async def run_asgi(self, endpoint, loan, options):
+        counter = iter(range(options['requests']))
+        latencies, failures = [], []
+
+        async def client_loop():
+            client = HostAsyncClient('localhost')
+            for n in counter:
+                method, kwargs = self.request_args(endpoint, loan, n)
+                kwargs.setdefault('path', endpoint)
+                started = time.perf_counter()
+                response = await getattr(client, method)(**kwargs)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    failures.append(response.status_code)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(options['concurrency'])))
+        return latencies, failures, time.perf_counter() - started
+
+    def report(self, label, result):
+        latencies, failures, elapsed = result
+        if failures:
+            # Latencies of error responses say nothing about the endpoint
+            statuses = ', '.join(f'{status} x{failures.count(status)}' for status in sorted(set(failures)))
+            raise CommandError(f'{label}: {len(failures)} of {len(latencies)} requests failed ({statuses})')
+        self.stdout.write(self.style.SUCCESS(
+            f'{label}: {len(latencies)} requests in {elapsed:.2f}s '
+            f'({len(latencies) / max(elapsed, 1e-9):.0f} req/sec), '
+            f'p50 {percentile(latencies, 0.50) * 1000:.1f}ms, '
+            f'p95 {percentile(latencies, 0.95) * 1000:.1f}ms, '
+            f'p99 {percentile(latencies, 0.99) * 1000:.1f}ms'
+        ))
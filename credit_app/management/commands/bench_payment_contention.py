@@ -0,0 +1,116 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from datetime import date, timedelta
+from decimal import Decimal
+import logging
+import time
+import uuid
+from ...benchmarks import throwaway_databases
+from ...models import User, Loan, BillingCycle
+
+BENCH_AADHAR_PREFIX = '99'
+MIN_DUE = Decimal('10.00')
+PREPAYMENT = Decimal('1.00')
+
+
+def post_payment(loan_id):
+    client = Client(HTTP_HOST='localhost')
+    try:
+        response = client.post(
+            '/api/make-payment/',
+            {'loan_id': str(loan_id), 'amount': str(MIN_DUE + PREPAYMENT)},
+            content_type='application/json'
+        )
+        return response.status_code == 200, response.json().get('error')
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = ('Fire concurrent make-payment requests at one loan and at many loans, '
+            'then check that no update was lost. Runs against a throwaway test database '
+            'created from the default one, never the configured database itself.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payments', type=int, default=200,
+                            help='Payments fired per scenario')
+        parser.add_argument('--threads', type=int, default=8,
+                            help='Concurrent clients')
+        parser.add_argument('--scenario', choices=['single', 'many', 'both'], default='both')
+
+    def handle(self, *args, **options):
+        if options['payments'] < 1 or options['threads'] < 1:
+            raise CommandError('--payments and --threads must be positive')
+
+        # Rejected payments are counted below; don't log each one
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        with throwaway_databases('bench-payments'):
+            self.run_scenarios(options)
+
+    def run_scenarios(self, options):
+        scenarios = ['single', 'many'] if options['scenario'] == 'both' else [options['scenario']]
+        user = User.objects.create_user(
+            username=f'bench-{uuid.uuid4().hex[:12]}',
+            aadhar_id=BENCH_AADHAR_PREFIX + str(uuid.uuid4().int)[:10],
+            annual_income=Decimal('1000000'),
+            credit_score=900
+        )
+        try:
+            for scenario in scenarios:
+                self.run_scenario(user, scenario, options['payments'], options['threads'])
+        finally:
+            user.delete()
+
+    def run_scenario(self, user, scenario, payments, threads):
+        loan_count = 1 if scenario == 'single' else payments
+        cycles_per_loan = payments // loan_count
+        principal = Decimal('100000.00')
+        loans = Loan.objects.bulk_create([Loan(
+            user=user,
+            loan_type='CREDIT_CARD',
+            loan_amount=principal,
+            principal_balance=principal,
+            interest_rate=Decimal('12'),
+            term_period=12,
+            disbursement_date=date.today(),
+            next_billing_date=date.today() + timedelta(days=30)
+        ) for _ in range(loan_count)])
+        BillingCycle.objects.bulk_create([BillingCycle(
+            loan=loan,
+            billing_date=date.today() + timedelta(days=30 * (i + 1)),
+            due_date=date.today() + timedelta(days=30 * (i + 1) + 15),
+            min_due=MIN_DUE,
+            principal_portion=MIN_DUE,
+            interest_portion=Decimal('0')
+        ) for loan in loans for i in range(cycles_per_loan)])
+
+        targets = [loans[i % loan_count].id for i in range(payments)]
+        connection.close()
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(post_payment, targets))
+        elapsed = time.monotonic() - started
+
+        succeeded = sum(1 for ok, _ in results if ok)
+        errors = {}
+        for ok, error in results:
+            if not ok:
+                errors[str(error)] = errors.get(str(error), 0) + 1
+
+        # Every accepted payment must show up exactly once in the balances
+        balances = dict(Loan.objects.filter(id__in=[loan.id for loan in loans]).values_list('id', 'principal_balance'))
+        paid_cycles = BillingCycle.objects.filter(loan__in=loans, is_paid=True).count()
+        expected_total = principal * loan_count - PREPAYMENT * succeeded
+        consistent = sum(balances.values()) == expected_total and paid_cycles == succeeded
+
+        style = self.style.SUCCESS if consistent else self.style.ERROR
+        self.stdout.write(style(
+            f'{scenario}: {succeeded}/{payments} payments on {loan_count} loan(s) with {threads} threads '
+            f'in {elapsed:.2f}s ({payments / max(elapsed, 1e-9):.0f} payments/sec); '
+            f'balances {"consistent" if consistent else "INCONSISTENT"}'
+        ))
+        for error, count in errors.items():
+            self.stdout.write(f'  {count} x {error}')
+        Loan.objects.filter(id__in=[loan.id for loan in loans]).delete()
@@ -0,0 +1,309 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from contextlib import ExitStack
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test import Client, override_settings
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+import json
+import os
+import re
+import tempfile
+import uuid
+from ...billing import BillingRunLocked, RunCheckpoint, bill_chunk, loan_chunks, loans_to_bill, start_billing_run
+from ...models import User, Loan, BillingCycle, Payment, Transaction, ScheduledInstallment
+from ...scoring import rescore_chunk
+from ...sharding import shard_aliases
+from ...tasks import calculate_credit_score, flush_credit_scores, request_credit_scores
+from ...views import ApplyLoanView
+
+SAMPLE_AADHAR_PREFIX = '96'
+
+EXPLAIN_PREFIXES = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+    'mysql': 'EXPLAIN ',
+}
+
+# Plan lines that read every row of a table. A walk of a whole index in
+# order (SQLite's "SCAN t USING INDEX", an Index Scan with a filter) is the
+# planner's choice for ORDER BY ... LIMIT and is not flagged.
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?([^\s(]+)$')
+POSTGRESQL_SCAN = re.compile(r'Seq Scan on (\S+)')
+
+
+class Rollback(Exception):
+    pass
+
+
+class StatementLog:
+    """Execute wrapper that keeps every statement run, with its database alias."""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many:
+            self.statements.append((context['connection'].alias, sql, params))
+        return execute(sql, params, many, context)
+
+
+def explain(alias, sql, params):
+    """Return ``(plan lines, tables read in full)`` for one statement."""
+    vendor = connections[alias].vendor
+    with connections[alias].cursor() as cursor:
+        cursor.execute(EXPLAIN_PREFIXES[vendor] + sql, params)
+        rows = cursor.fetchall()
+        columns = [column[0] for column in cursor.description]
+    if vendor == 'sqlite':
+        lines = [row[-1] for row in rows]
+        return lines, [match.group(1) for match in map(SQLITE_SCAN.match, lines) if match]
+    if vendor == 'postgresql':
+        lines = [row[0] for row in rows]
+        return lines, [match.group(1) for line in lines for match in POSTGRESQL_SCAN.finditer(line)]
+    plans = [dict(zip(columns, row)) for row in rows]
+    lines = [f'{plan["table"]}: type={plan["type"]} key={plan["key"]}' for plan in plans]
+    return lines, [plan['table'] for plan in plans if plan['type'] == 'ALL']
+
+
+def explainable(sql):
+    # Writes are explained too, since UPDATE and DELETE can scan as well;
+    # inserts and transaction control have no plan worth reading
+    return sql.lstrip().split(None, 1)[0].upper() in ('SELECT', 'UPDATE', 'DELETE')
+
+
+class Command(BaseCommand):
+    help = ('Run the queries of the hot views and commands against a sample loan, EXPLAIN each one '
+            'on the current databases and flag full table scans. Everything runs in transactions '
+            'that are rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=sorted(self.scenarios()),
+                            help='Only explain these scenarios (repeatable; default: all)')
+        parser.add_argument('--fail-on-scan', action='store_true',
+                            help='Exit with an error if any filtered query reads a whole table')
+
+    def scenarios(self):
+        return {
+            'register-user': self.register_user,
+            'apply-loan': self.apply_loan,
+            'make-payment': self.make_payment,
+            'make-payment-batch': self.make_payment_batch,
+            'get-statement': self.get_statement,
+            'get-statement-page': self.get_statement_page,
+            'export-statement': self.export_statement,
+            'process_billing': self.process_billing,
+            'rescore_all': self.rescore_all,
+            'calculate_credit_score': self.calculate_credit_score,
+            'flush_credit_scores': self.flush_credit_scores,
+            'import_transactions': self.import_transactions,
+        }
+
+    def handle(self, *args, **options):
+        # The default database and the transaction shards
+        aliases = list(dict.fromkeys((DEFAULT_DB_ALIAS, *shard_aliases())))
+        vendors = sorted({connections[alias].vendor for alias in aliases})
+        for vendor in vendors:
+            if vendor not in EXPLAIN_PREFIXES:
+                raise CommandError(f'EXPLAIN is not supported on {vendor}')
+
+        scenarios = self.scenarios()
+        names = options['scenario'] or list(scenarios)
+        # Private caches, so nothing read or written for the sample data
+        # outlives the rolled back transaction
+        caches = {alias: {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': f'explain-hot-queries-{alias}',
+        } for alias in settings.CACHES}
+
+        flagged = []
+        explained = 0
+        with override_settings(CACHES=caches):
+            try:
+                with ExitStack() as databases:
+                    for alias in aliases:
+                        databases.enter_context(transaction.atomic(using=alias))
+                        if connections[alias].vendor == 'postgresql':
+                            # The sample tables are tiny, and a sequential scan
+                            # is the cheapest plan for any tiny table; make the
+                            # planner use an index wherever one applies
+                            with connections[alias].cursor() as cursor:
+                                cursor.execute('SET LOCAL enable_seqscan = off')
+                    sample = self.create_sample()
+                    for name in names:
+                        log = StatementLog()
+                        with ExitStack() as stack:
+                            for alias in aliases:
+                                stack.enter_context(transaction.atomic(using=alias))
+                                stack.enter_context(connections[alias].execute_wrapper(log))
+                            scenarios[name](sample)
+                        explained += self.report(name, log.statements, flagged, options['verbosity'])
+                    raise Rollback
+            except Rollback:
+                pass
+
+        summary = (f'Explained {explained} distinct statements in {len(names)} scenarios on {", ".join(vendors)}; '
+                   f'{len(flagged)} read a whole table')
+        if not flagged:
+            self.stdout.write(self.style.SUCCESS(summary))
+            return
+        self.stdout.write(self.style.WARNING(summary))
+        if options['fail_on_scan']:
+            raise CommandError('Full table scans in: ' + ', '.join(sorted({name for name, _ in flagged})))
+
+    def report(self, name, statements, flagged, verbosity):
+        seen = set()
+        scans = []
+        for alias, sql, params in statements:
+            if (alias, sql) in seen or not explainable(sql):
+                continue
+            seen.add((alias, sql))
+            lines, tables = explain(alias, sql, params)
+            # A read of every row is only a problem when the query filters
+            if tables and ' WHERE ' in sql:
+                scans.append((tables, sql))
+                flagged.append((name, sql))
+            if verbosity > 1:
+                self.stdout.write(f'  [{alias}] {sql}')
+                for line in lines:
+                    self.stdout.write(f'    {line}')
+
+        style = self.style.WARNING if scans else self.style.SUCCESS
+        self.stdout.write(style(f'{name}: {len(seen)} statements, {len(scans)} full table scans'))
+        for tables, sql in scans:
+            self.stdout.write(f'  scan of {", ".join(tables)}: {sql[:200]}')
+        return len(seen)
+
+    def create_sample(self):
+        suffix = uuid.uuid4().hex[:10]
+        User.objects.bulk_create([User(
+            username=f'explain-{n}-{suffix}',
+            aadhar_id=f'{SAMPLE_AADHAR_PREFIX}{n}{uuid.uuid4().int % 10 ** 9:09d}',
+            annual_income=Decimal('1000000'),
+            credit_score=900
+        ) for n in range(2)])
+        # bulk_create doesn't set primary keys on SQLite
+        user, other = User.objects.filter(username__endswith=suffix).order_by('username')
+
+        rows = [Transaction(
+            aadhar_id=user.aadhar_id,
+            date=date.today() - timedelta(days=n),
+            amount=Decimal('50000'),
+            transaction_type='CREDIT' if n % 3 else 'DEBIT'
+        ) for n in range(12)]
+        Transaction.objects.insert_batch(rows)
+
+        start = date.today() - timedelta(days=180)
+        loans = []
+        for borrower in (user, other):
+            loan = Loan.objects.create(
+                user=borrower,
+                loan_type='CREDIT_CARD',
+                loan_amount=Decimal('5000.00'),
+                principal_balance=Decimal('5000.00'),
+                interest_rate=Decimal('14'),
+                term_period=12,
+                disbursement_date=start,
+                next_billing_date=date.today()
+            )
+            BillingCycle.objects.bulk_create([BillingCycle(
+                loan=loan,
+                billing_date=start + timedelta(days=30 * (n + 1)),
+                due_date=start + timedelta(days=30 * (n + 1) + 15),
+                min_due=Decimal('100.00'),
+                principal_portion=Decimal('60.00'),
+                interest_portion=Decimal('40.00'),
+                is_paid=n < 3
+            ) for n in range(5)])
+            Payment.objects.bulk_create([
+                Payment(billing_cycle=cycle, amount=Decimal('100.00'))
+                for cycle in BillingCycle.objects.filter(loan=loan, is_paid=True)
+            ])
+            ScheduledInstallment.objects.bulk_create(ApplyLoanView().calculate_emi_schedule(loan))
+            loans.append(loan)
+        return {'user': user, 'loans': loans}
+
+    def request(self, method, path, data=None, **extra):
+        # A rejected request runs none of the hot queries, so it must not pass
+        # for an empty plan
+        response = getattr(Client(HTTP_HOST='localhost'), method)(path, data, **extra)
+        if not 200 <= response.status_code < 300:
+            raise CommandError(f'{method.upper()} {path} returned {response.status_code}: {response.content[:200]!r}')
+        return response
+
+    def post_json(self, path, data):
+        return self.request('post', path, data, content_type='application/json')
+
+    def register_user(self, sample):
+        self.post_json('/api/register-user/', {
+            'aadhar_id': f'{SAMPLE_AADHAR_PREFIX}{uuid.uuid4().int % 10 ** 10:010d}',
+            'username': f'explain-new-{uuid.uuid4().hex[:10]}',
+            'email_id': 'explain@example.com',
+            'annual_income': '500000'
+        })
+
+    def apply_loan(self, sample):
+        self.post_json('/api/apply-loan/', {
+            'unique_user_id': str(uuid.UUID(int=sample['user'].id)),
+            'loan_type': 'CREDIT_CARD',
+            'loan_amount': '5000',
+            'interest_rate': '14',
+            'term_period': 12,
+            'disbursement_date': date.today().isoformat()
+        })
+
+    def make_payment(self, sample):
+        self.post_json('/api/make-payment/', {'loan_id': str(sample['loans'][0].id), 'amount': '100.00'})
+
+    def make_payment_batch(self, sample):
+        body = '\n'.join(json.dumps({'loan_id': str(loan.id), 'amount': '100.00'}) for loan in sample['loans'])
+        self.request('post', '/api/make-payment/batch/', body, content_type='application/x-ndjson')
+
+    def get_statement(self, sample):
+        self.request('get', '/api/get-statement/', {'loan_id': str(sample['loans'][0].id)})
+
+    def get_statement_page(self, sample):
+        self.request('get', '/api/get-statement/', {'loan_id': str(sample['loans'][0].id), 'limit': 2})
+
+    def export_statement(self, sample):
+        response = self.request('get', '/api/get-statement/export/', {'loan_id': str(sample['loans'][0].id)})
+        b''.join(response.streaming_content)
+
+    def process_billing(self, sample):
+        # The batch billing path of process_billing, limited to the sample
+        # loans so the rest of the population is neither read nor locked
+        today = date.today()
+        owner = 'explain-hot-queries'
+        try:
+            run = start_billing_run(today, 0, 1, owner)
+        except BillingRunLocked:
+            run = None
+        checkpoint = RunCheckpoint(run, owner) if run else None
+        loans = loans_to_bill(today).filter(id__in=[loan.id for loan in sample['loans']])
+        for chunk in loan_chunks(loans, 1000):
+            bill_chunk(chunk, today, checkpoint)
+        if checkpoint:
+            checkpoint.finish()
+
+    def rescore_all(self, sample):
+        # One rescore_all chunk, over the id range of the sample users only
+        user_ids = sorted(loan.user_id for loan in sample['loans'])
+        rescore_chunk({'ids': (user_ids[0], user_ids[-1]), 'dry_run': True, 'from_transactions': False})
+
+    def calculate_credit_score(self, sample):
+        calculate_credit_score(sample['user'].aadhar_id)
+
+    def flush_credit_scores(self, sample):
+        request_credit_scores([sample['user'].aadhar_id], schedule=False)
+        flush_credit_scores()
+
+    def import_transactions(self, sample):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as feed:
+            feed.write('aadhar_id,date,amount,transaction_type\n')
+            feed.write(f'{sample["user"].aadhar_id},{date.today().isoformat()},100,CREDIT\n')
+        try:
+            call_command('import_transactions', feed.name, '--restart', stdout=StringIO())
+        finally:
+            os.unlink(feed.name)
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+import json
+import os
+import time
+from ...payments import apply_payment_lines
+
+
+class Command(BaseCommand):
+    help = 'Apply a bank settlement file of NDJSON payment lines ({"loan_id": ..., "amount": ...})'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Payment lines read and written per chunk')
+        parser.add_argument('--outcomes', metavar='PATH',
+                            help='Write one NDJSON outcome per payment line to this file')
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['path']):
+            raise CommandError(f'File not found: {options["path"]}')
+
+        started = time.monotonic()
+        accepted = rejected = 0
+        outcomes = open(options['outcomes'], 'w') if options['outcomes'] else None
+        try:
+            with open(options['path'], 'r', encoding='utf-8') as lines:
+                for outcome in apply_payment_lines(lines, options['chunk_size'], self.report_failure):
+                    if outcomes:
+                        outcomes.write(json.dumps(outcome) + '\n')
+                    if outcome['error']:
+                        rejected += 1
+                        self.stdout.write(self.style.ERROR(f'Line {outcome["line"]}: {outcome["error"]}'))
+                    else:
+                        accepted += 1
+        finally:
+            if outcomes:
+                outcomes.close()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Applied {accepted} payments, rejected {rejected} in {elapsed:.2f}s '
+            f'({(accepted + rejected) / max(elapsed, 1e-9):.0f} lines/sec)'
+        ))
+
+    def report_failure(self, first, last, error):
+        self.stdout.write(self.style.ERROR(f'Lines {first}-{last} were not applied: {error}'))
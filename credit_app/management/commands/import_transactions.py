@@ -0,0 +1,247 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from io import StringIO
+import csv
+import json
+import os
+import time
+from ...models import User, Transaction, CustomerBalance, ImportCheckpoint
+from ...parallel import run_in_workers
+from ...sharding import fan_out, group_by_shard, shard_aliases
+from ...tasks import request_credit_scores
+
+FIELDS = ('aadhar_id', 'date', 'amount', 'transaction_type')
+
+
+def parse_row(record):
+    aadhar_id = str(record['aadhar_id']).strip()
+    if not aadhar_id or len(aadhar_id) > 12:
+        raise ValueError(f'invalid aadhar_id {aadhar_id!r}')
+    transaction_type = str(record['transaction_type']).strip().upper()
+    if transaction_type not in ('CREDIT', 'DEBIT'):
+        raise ValueError(f'invalid transaction_type {transaction_type!r}')
+    try:
+        amount = Decimal(str(record['amount']).strip())
+    except InvalidOperation:
+        raise ValueError(f'invalid amount {record["amount"]!r}')
+    return Transaction(
+        aadhar_id=aadhar_id,
+        date=date.fromisoformat(str(record['date']).strip()),
+        amount=amount,
+        transaction_type=transaction_type
+    )
+
+
+def copy_rows(rows, alias):
+    # PostgreSQL native bulk load: one COPY per batch instead of INSERTs
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row.aadhar_id, row.date.isoformat(), row.amount, row.transaction_type])
+    buffer.seek(0)
+    with connections[alias].cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {Transaction._meta.db_table} ({", ".join(FIELDS)}) FROM STDIN WITH (FORMAT csv)',
+            buffer
+        )
+
+
+def write_batch(job, batch, position, progress):
+    """Write ``(line position, row)`` pairs to their shards; return the number of rows written.
+
+    Each shard commits its rows together with its own checkpoint, in one
+    transaction per shard. ``progress`` maps each shard to its committed
+    ``(position, rows_imported)``; lines a shard committed before a restart
+    are skipped there.
+    """
+    def write(alias, pairs):
+        committed, imported = progress.get(alias, (0, 0))
+        rows = [row for line_position, row in pairs if line_position >= committed]
+        if not rows:
+            return committed, imported
+        with transaction.atomic(using=alias):
+            if job['use_copy']:
+                copy_rows(rows, alias)
+            else:
+                Transaction.objects.using(alias).bulk_create(rows, batch_size=job['batch_size'])
+            CustomerBalance.objects.apply_transactions(rows)
+            ImportCheckpoint.objects.using(alias).update_or_create(
+                source=job['source'],
+                segment_start=job['start'],
+                defaults={'position': position, 'rows_imported': imported + len(rows)}
+            )
+        return position, imported + len(rows)
+
+    written = 0
+    for alias, (committed, imported) in fan_out(write, group_by_shard(batch, key=lambda pair: pair[1].aadhar_id)).items():
+        written += imported - progress.get(alias, (0, 0))[1]
+        progress[alias] = (committed, imported)
+    return written
+
+
+def import_segment(job):
+    """Import the lines that start inside ``[job['start'], job['end'])`` of the feed."""
+    started = time.monotonic()
+    touched = set()
+    errors = []
+    imported = skipped = 0
+
+    checkpoints = {
+        alias: ImportCheckpoint.objects.using(alias).filter(
+            source=job['source'],
+            segment_start=job['start']
+        ).first()
+        for alias in shard_aliases()
+    }
+    progress = {
+        alias: (checkpoint.position, checkpoint.rows_imported)
+        for alias, checkpoint in checkpoints.items() if checkpoint
+    }
+
+    with open(job['path'], 'rb') as feed:
+        if progress and len(progress) == len(checkpoints):
+            # Resume where the shard furthest behind stopped
+            feed.seek(min(position for position, _ in progress.values()))
+        elif job['start'] > 0:
+            # Skip the partial line that belongs to the previous segment
+            feed.seek(job['start'] - 1)
+            feed.readline()
+        if job['format'] == 'csv' and feed.tell() == 0:
+            feed.readline()  # header
+
+        batch = []
+        while True:
+            position = feed.tell()
+            if position >= job['end']:
+                break
+            line = feed.readline()
+            if not line:
+                break
+            text = line.decode('utf-8').strip()
+            if not text:
+                continue
+            try:
+                if job['format'] == 'csv':
+                    record = dict(zip(job['header'], next(csv.reader([text]))))
+                else:
+                    record = json.loads(text)
+                batch.append((position, parse_row(record)))
+            except (ValueError, KeyError, TypeError) as e:
+                skipped += 1
+                if len(errors) < 10:
+                    errors.append(f'byte {position}: {e}')
+                continue
+
+            if len(batch) >= job['batch_size']:
+                imported += write_batch(job, batch, feed.tell(), progress)
+                touched.update(row.aadhar_id for _, row in batch)
+                batch = []
+
+        if batch:
+            imported += write_batch(job, batch, feed.tell(), progress)
+            touched.update(row.aadhar_id for _, row in batch)
+
+    return {
+        'start': job['start'],
+        'rows': imported,
+        'skipped': skipped,
+        'errors': errors,
+        'touched': touched,
+        'seconds': time.monotonic() - started,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Stream a CSV or NDJSON transaction feed into the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=str(settings.BASE_DIR / 'data' / 'user_transactions.csv')
+        )
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help='Feed format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows written per bulk insert / COPY')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Worker processes importing segments in parallel')
+        parser.add_argument('--segment-size', type=int, default=64 * 1024 * 1024,
+                            help='Bytes of the feed assigned to one worker job')
+        parser.add_argument('--no-copy', action='store_true',
+                            help='Use bulk_create even on PostgreSQL')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore checkpoints from a previous run of this feed')
+        parser.add_argument('--skip-scoring', action='store_true',
+                            help='Do not queue credit score updates for imported customers')
+
+    def handle(self, *args, **options):
+        path = os.path.realpath(options['path'])
+        if not os.path.exists(path):
+            raise CommandError(f'File not found: {path}')
+
+        fmt = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        size = os.path.getsize(path)
+        source = f'{path}:{size}'[-255:]
+
+        header = None
+        if fmt == 'csv':
+            with open(path, 'r', encoding='utf-8') as feed:
+                header = [column.strip() for column in next(csv.reader([feed.readline()]))]
+            missing = set(FIELDS) - set(header)
+            if missing:
+                raise CommandError(f'CSV header is missing columns: {", ".join(sorted(missing))}')
+
+        if options['restart']:
+            for alias in shard_aliases():
+                ImportCheckpoint.objects.using(alias).filter(source=source).delete()
+
+        segment_size = max(options['segment_size'], 1)
+        jobs = [{
+            'path': path,
+            'source': source,
+            'format': fmt,
+            'header': header,
+            'start': start,
+            'end': min(start + segment_size, size),
+            'batch_size': options['batch_size'],
+            'use_copy': not options['no_copy'] and all(
+                connections[alias].vendor == 'postgresql' for alias in shard_aliases()
+            ),
+        } for start in range(0, size, segment_size)]
+
+        started = time.monotonic()
+        total_rows = total_skipped = 0
+        touched = set()
+        for result in run_in_workers(import_segment, jobs, options['workers']):
+            total_rows += result['rows']
+            total_skipped += result['skipped']
+            touched.update(result['touched'])
+            for error in result['errors']:
+                self.stdout.write(self.style.WARNING(f'Skipped line at {error}'))
+            self.stdout.write(
+                f'Segment @{result["start"]}: {result["rows"]} rows '
+                f'({result["rows"] / max(result["seconds"], 1e-9):.0f} rows/sec)'
+            )
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {total_rows} transactions in {elapsed:.2f}s '
+            f'({total_rows / max(elapsed, 1e-9):.0f} rows/sec), skipped {total_skipped} invalid lines'
+        ))
+
+        if options['skip_scoring'] or not touched:
+            return
+
+        # Only rescore registered customers that actually received new rows
+        touched = sorted(touched)
+        queued = 0
+        for i in range(0, len(touched), 1000):
+            registered = list(User.objects.filter(
+                aadhar_id__in=touched[i:i + 1000]
+            ).values_list('aadhar_id', flat=True))
+            request_credit_scores(registered)
+            queued += len(registered)
+        self.stdout.write(self.style.SUCCESS(f'Queued credit score updates for {queued} customers'))
@@ -1,63 +1,139 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 from datetime import date, timedelta
-from decimal import Decimal
-from ...models import Loan, BillingCycle
+import argparse
+import os
+import socket
+import time
+from ...models import ScheduledInstallment
+from ...billing import (
+    BillingRunLocked,
+    LeaseLost,
+    RunCheckpoint,
+    build_billing_cycle,
+    claim_billing,
+    due_installments,
+    loans_to_bill,
+    run_batch_billing,
+    start_billing_run
+)
+from ...querycount import QueryCounter
+from ...statement_cache import invalidate_statements
+
+def parse_shard(value):
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected N/M, e.g. 0/4')
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError('shard N/M needs 0 <= N < M')
+    return index, count
 
 class Command(BaseCommand):
     help = 'Process billing for loans'
-    
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', action='store_true',
+                            help='Bill loans in set-based chunks with one bulk insert per chunk')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Loans per chunk in --batch mode')
+        parser.add_argument('--shard', type=parse_shard, default=(0, 1), metavar='N/M',
+                            help='Only bill shard N of M (0-based); implies --batch')
+        parser.add_argument('--backfill', action='store_true',
+                            help='Create every missed cycle per loan instead of one; implies --batch')
+        parser.add_argument('--until', type=date.fromisoformat, metavar='YYYY-MM-DD',
+                            help='Bill as of this date instead of today')
+        parser.add_argument('--lease-seconds', type=int, default=300,
+                            help='How long a shard lease lasts without a checkpoint')
+
     def handle(self, *args, **options):
-        today = date.today()
-        
+        today = options['until'] or date.today()
+
+        with QueryCounter() as queries:
+            if options['batch'] or options['backfill'] or options['shard'] != (0, 1):
+                stats = self.handle_batch(today, options)
+                if stats is None:
+                    return
+            else:
+                stats = self.handle_per_loan(today)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {stats["cycles"]} billing cycles for {stats["loans"]} loans in {stats["seconds"]:.2f}s '
+            f'({stats["loans"] / max(stats["seconds"], 1e-9):.0f} loans/sec, '
+            f'{queries.count} queries, {len(stats["errors"])} errors)'
+        ))
+
+    def handle_batch(self, today, options):
+        shard = options['shard']
+        owner = f'{socket.gethostname()}:{os.getpid()}'[:64]
+        lease = timedelta(seconds=options['lease_seconds'])
+        try:
+            run = start_billing_run(
+                today, *shard,
+                owner=owner,
+                lease=lease,
+                mode='BACKFILL' if options['backfill'] else 'BILLING'
+            )
+        except BillingRunLocked as e:
+            raise CommandError(str(e))
+
+        if run.status == 'COMPLETED':
+            self.stdout.write(self.style.WARNING(f'{run} already completed; nothing to do'))
+            return None
+        if run.last_loan_id:
+            self.stdout.write(f'Resuming {run} after loan {run.last_loan_id} '
+                              f'({run.loans_processed} loans already processed)')
+
+        def on_chunk(stats):
+            self.stdout.write(f'{stats["loans"]} loans processed, {stats["cycles"]} cycles created')
+
+        try:
+            stats = run_batch_billing(
+                today,
+                chunk_size=options['chunk_size'],
+                on_chunk=on_chunk,
+                shard=shard,
+                run=run,
+                checkpoint=RunCheckpoint(run, owner, lease),
+                backfill=options['backfill']
+            )
+        except LeaseLost as e:
+            raise CommandError(f'{e}; the chunk in progress was rolled back')
+        for loan_id, error in stats['errors'].items():
+            self.stdout.write(self.style.ERROR(
+                f'Error processing billing for loan {loan_id}: {str(error)}'
+            ))
+        return stats
+
+    def handle_per_loan(self, today):
+        stats = {'loans': 0, 'cycles': 0, 'errors': {}}
+        started = time.monotonic()
+
         # Get loans that need billing today
-        loans_to_bill = Loan.objects.filter(
-            is_active=True,
-            disbursement_date__lte=today - timedelta(days=30)
-        ).select_related('user')
-        
-        for loan in loans_to_bill:
+        loans_to_bill_today = loans_to_bill(today).select_related('user')
+
+        for loan in loans_to_bill_today:
+            stats['loans'] += 1
             try:
                 with transaction.atomic():
-                    # Calculate days since last billing or disbursement
-                    last_billing = BillingCycle.objects.filter(
-                        loan=loan
-                    ).order_by('-billing_date').first()
-                    
-                    if last_billing:
-                        days_since_last_billing = (today - last_billing.billing_date).days
-                        billing_date = last_billing.billing_date + timedelta(days=30)
-                    else:
-                        days_since_last_billing = (today - loan.disbursement_date).days
-                        billing_date = loan.disbursement_date + timedelta(days=30)
-                    
-                    # Calculate daily interest
-                    daily_interest_rate = round(loan.interest_rate / Decimal('365'), 3)
-                    daily_interest_accrued = (loan.principal_balance * daily_interest_rate) / Decimal('100')
-                    
-                    # Calculate interest for the billing cycle
-                    interest_accrued = daily_interest_accrued * days_since_last_billing
-                    
-                    # Calculate min due (3% of principal + interest)
-                    min_due = (loan.principal_balance * Decimal('0.03')) + interest_accrued
-                    
-                    # Create new billing cycle
-                    due_date = billing_date + timedelta(days=15)
-                    
-                    billing_cycle = BillingCycle.objects.create(
-                        loan=loan,
-                        billing_date=billing_date,
-                        due_date=due_date,
-                        min_due=min_due,
-                        principal_portion=loan.principal_balance * Decimal('0.03'),
-                        interest_portion=interest_accrued
-                    )
-                    
+                    billing_cycle = build_billing_cycle(loan, today, due_installments([loan], today))
+                    # Skip loans a batch run billed since they were read
+                    if not claim_billing(loan, billing_cycle.billing_date):
+                        continue
+                    billing_cycle.save()
+                    ScheduledInstallment.objects.mark_billed([billing_cycle])
+                    invalidate_statements([loan.id])
+                    stats['cycles'] += 1
+
                     self.stdout.write(self.style.SUCCESS(
                         f'Created billing cycle for loan {loan.id}: '
-                        f'Min Due: {min_due}, Due Date: {due_date}'
+                        f'Min Due: {billing_cycle.min_due}, Due Date: {billing_cycle.due_date}'
                     ))
             except Exception as e:
+                stats['errors'][loan.id] = e
                 self.stdout.write(self.style.ERROR(
                     f'Error processing billing for loan {loan.id}: {str(e)}'
-                ))
\ No newline at end of file
+                ))
+
+        stats['seconds'] = time.monotonic() - started
+        return stats
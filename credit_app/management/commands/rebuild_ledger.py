@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from ...models import CustomerBalance, Transaction, balance_totals
+from ...sharding import fan_out_all
+
+FIELDS = ('credit_total', 'debit_total', 'last_transaction_id')
+
+
+def rebuild_shard(alias, batch_size):
+    # A customer's ledger row lives on the same shard as their transactions
+    with transaction.atomic(using=alias):
+        balances = CustomerBalance.objects.using(alias)
+        balances.all().delete()
+        batch = []
+        count = 0
+        for row in balance_totals(Transaction.objects.using(alias).all()).iterator():
+            batch.append(CustomerBalance(**row))
+            if len(batch) >= batch_size:
+                balances.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        balances.bulk_create(batch)
+        count += len(batch)
+    return count
+
+
+def verify_shard(alias):
+    """Return the differences between one shard's ledger and its transactions."""
+    ledger = {
+        row['aadhar_id']: row
+        for row in CustomerBalance.objects.using(alias).values('aadhar_id', *FIELDS).iterator()
+    }
+    problems = []
+    for expected in balance_totals(Transaction.objects.using(alias).all()).iterator():
+        stored = ledger.pop(expected['aadhar_id'], None)
+        if stored is None:
+            problems.append(f'{expected["aadhar_id"]}: missing from ledger')
+            continue
+        for field in FIELDS:
+            if stored[field] != expected[field]:
+                problems.append(f'{expected["aadhar_id"]}: {field} is {stored[field]}, expected {expected[field]}')
+    for aadhar_id in ledger:
+        problems.append(f'{aadhar_id}: in ledger but has no transactions')
+    return problems
+
+
+class Command(BaseCommand):
+    help = ('Rebuild or verify the per-customer balance ledger against the Transaction table, '
+            'on every transaction shard in parallel')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Only compare the ledger with Transaction and report differences')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            self.verify()
+        else:
+            self.rebuild(options['batch_size'])
+
+    def rebuild(self, batch_size):
+        counts = fan_out_all(lambda alias: rebuild_shard(alias, batch_size))
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt ledger for {sum(counts.values())} customers'))
+
+    def verify(self):
+        mismatches = 0
+        for problems in fan_out_all(verify_shard).values():
+            mismatches += len(problems)
+            for problem in problems:
+                self.stdout.write(self.style.ERROR(problem))
+
+        if mismatches:
+            raise CommandError(f'Ledger has {mismatches} mismatches; run rebuild_ledger to repair')
+        self.stdout.write(self.style.SUCCESS('Ledger matches the Transaction table'))
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+from ...models import User
+from ...routers import replica_reads
+from ...scoring import rescore_population
+
+
+class Command(BaseCommand):
+    help = 'Recompute credit scores for every user in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Users scored and written per chunk')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Worker processes scoring chunks in parallel')
+        parser.add_argument('--from-transactions', action='store_true',
+                            help='Aggregate balances from Transaction instead of the balance ledger')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report a histogram of score changes without saving them')
+
+    def handle(self, *args, **options):
+        # A population-wide read; the users and balances come from a replica
+        # when one is configured, and only the changed scores hit the primary
+        with replica_reads():
+            self.rescore(options)
+
+    def rescore(self, options):
+        total = User.objects.count()
+
+        def progress(summary):
+            self.stdout.write(
+                f'{summary["users"]}/{total} users scored, {summary["changed"]} changed '
+                f'({summary["users"] / max(summary["seconds"], 1e-9):.0f} users/sec)'
+            )
+
+        summary = rescore_population(
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+            dry_run=options['dry_run'],
+            from_transactions=options['from_transactions'],
+            progress=progress
+        )
+
+        if options['dry_run']:
+            self.write_histogram(summary['histogram'])
+
+        verb = 'would change' if options['dry_run'] else 'changed'
+        self.stdout.write(self.style.SUCCESS(
+            f'Rescored {summary["users"]} users in {summary["seconds"]:.2f}s '
+            f'({summary["users"] / max(summary["seconds"], 1e-9):.0f} users/sec); '
+            f'{summary["changed"]} scores {verb}'
+        ))
+
+    def write_histogram(self, histogram):
+        if not histogram:
+            self.stdout.write('No score changes')
+            return
+        self.stdout.write('Score change histogram:')
+        widest = max(histogram.values())
+        new_count = histogram.pop('new', 0)
+        for bucket in sorted(histogram):
+            bar = '#' * max(1, round(40 * histogram[bucket] / widest))
+            self.stdout.write(f'{bucket:+5d} .. {bucket + 49:+5d}  {bar} {histogram[bucket]}')
+        if new_count:
+            self.stdout.write(f'  first score   {"#" * max(1, round(40 * new_count / widest))} {new_count}')
@@ -0,0 +1,396 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from datetime import date, timedelta
+from decimal import Decimal
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from ...benchmarks import throwaway_databases
+from ...metrics import percentile
+from ...sharding import group_by_shard
+from ...models import (
+    User,
+    Loan,
+    BillingCycle,
+    Payment,
+    Transaction,
+    CustomerBalance,
+    PendingCreditScore
+)
+
+POPULATION_USERNAME = 'bench-pop-'
+REGISTER_USERNAME = 'bench-reg-'
+ENDPOINTS = ('register-user', 'apply-loan', 'make-payment', 'get-statement')
+DEFAULT_MIX = 'register-user=1,apply-loan=2,make-payment=3,get-statement=4'
+MIN_DUE = Decimal('100.00')
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        endpoint, _, weight = part.partition('=')
+        if endpoint.strip() not in ENDPOINTS:
+            raise CommandError(f'Unknown endpoint {endpoint.strip()!r} in --mix; expected {", ".join(ENDPOINTS)}')
+        try:
+            mix[endpoint.strip()] = float(weight)
+        except ValueError:
+            raise CommandError(f'Invalid weight in --mix: {part!r}')
+    return mix
+
+
+def population_aadhar_ids():
+    return list(User.objects.filter(
+        username__startswith=POPULATION_USERNAME
+    ).values_list('aadhar_id', flat=True))
+
+
+def remove_population():
+    # Leftovers of earlier runs, including users registered by the benchmark
+    aadhar_ids = population_aadhar_ids() + list(User.objects.filter(
+        username__startswith=REGISTER_USERNAME
+    ).values_list('aadhar_id', flat=True))
+    for i in range(0, len(aadhar_ids), 500):
+        chunk = aadhar_ids[i:i + 500]
+        for alias, shard_ids in group_by_shard(chunk).items():
+            Transaction.objects.using(alias).filter(aadhar_id__in=shard_ids).delete()
+            CustomerBalance.objects.using(alias).filter(aadhar_id__in=shard_ids).delete()
+        PendingCreditScore.objects.filter(aadhar_id__in=chunk).delete()
+    User.objects.filter(username__startswith=POPULATION_USERNAME).delete()
+    User.objects.filter(username__startswith=REGISTER_USERNAME).delete()
+
+
+class Command(BaseCommand):
+    help = ('Build a synthetic population, replay a request mix against register-user, apply-loan, '
+            'make-payment and get-statement, and report throughput and p50/p95/p99 per endpoint. '
+            'Runs in-process against a throwaway database; with --url and --populate-live-db the '
+            'requests go over HTTP to a server using the configured database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200,
+                            help='Users in the synthetic population')
+        parser.add_argument('--transactions-per-user', type=int, default=10)
+        parser.add_argument('--loan-ratio', type=float, default=0.5,
+                            help='Fraction of users holding a loan')
+        parser.add_argument('--cycles-per-loan', type=int, default=6,
+                            help='Billing cycles per loan; the first half are paid')
+        parser.add_argument('--requests', type=int, default=1000,
+                            help='Requests to generate (ignored with --replay)')
+        parser.add_argument('--mix', default=DEFAULT_MIX,
+                            help='Relative weights of the generated endpoints')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Clients sending requests at the same time')
+        parser.add_argument('--url', help='Base URL of a running server, e.g. http://localhost:8000')
+        parser.add_argument('--populate-live-db', action='store_true',
+                            help='With --url, build the population in the configured database the server uses '
+                                 '(users with aadhar_ids starting 97) and remove it afterwards')
+        parser.add_argument('--record', help='Write the generated request mix to this NDJSON file')
+        parser.add_argument('--replay', help='Replay a request mix written by --record')
+        parser.add_argument('--baseline', help='Compare against this baseline JSON file')
+        parser.add_argument('--save-baseline', help='Write the results to this baseline JSON file')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed regression against the baseline (0.2 = 20%%)')
+        parser.add_argument('--keep', action='store_true',
+                            help='With --populate-live-db, leave the synthetic population in the database')
+
+    def handle(self, *args, **options):
+        if min(options['users'], options['concurrency']) < 1:
+            raise CommandError('--users and --concurrency must be positive')
+        if options['url'] and not options['populate_live_db']:
+            raise CommandError('--url needs --populate-live-db, since the server reads the configured database')
+        if options['populate_live_db'] and not options['url']:
+            raise CommandError('--populate-live-db needs --url; in-process runs use a throwaway database')
+        if options['keep'] and not options['populate_live_db']:
+            raise CommandError('--keep needs --populate-live-db; in-process runs use a throwaway database')
+
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        rng = random.Random(options['seed'])
+        if options['populate_live_db']:
+            remove_population()
+            try:
+                specs, results = self.run(options, rng)
+            finally:
+                if not options['keep']:
+                    remove_population()
+        else:
+            with throwaway_databases('run-benchmarks'):
+                specs, results = self.run(options, rng)
+
+        self.report(results)
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as baseline:
+                json.dump({
+                    'config': {
+                        'users': options['users'],
+                        'requests': len(specs),
+                        'concurrency': options['concurrency'],
+                        'mode': 'http' if options['url'] else 'in-process',
+                    },
+                    'endpoints': results,
+                }, baseline, indent=2)
+            self.stdout.write(f'Saved baseline to {options["save_baseline"]}')
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['tolerance'])
+
+    def run(self, options, rng):
+        started = time.monotonic()
+        population = self.build_population(options, rng)
+        self.stdout.write(
+            f'Built population of {len(population["users"])} users and {len(population["loans"])} loans '
+            f'in {time.monotonic() - started:.2f}s'
+        )
+
+        if options['replay']:
+            specs = self.load_specs(options['replay'], population)
+        else:
+            specs = self.generate_specs(options, population, rng)
+        if options['record']:
+            with open(options['record'], 'w') as recording:
+                for spec in specs:
+                    recording.write(json.dumps(spec) + '\n')
+
+        return specs, self.replay(specs, population, options)
+
+    def build_population(self, options, rng):
+        user_count = options['users']
+        password = make_password(None)
+        User.objects.bulk_create([User(
+            username=f'{POPULATION_USERNAME}{i}',
+            aadhar_id=f'97{i:010d}',
+            annual_income=Decimal('500000'),
+            credit_score=900,
+            password=password
+        ) for i in range(user_count)], batch_size=1000)
+        users = list(User.objects.filter(
+            username__startswith=POPULATION_USERNAME
+        ).order_by('aadhar_id').values_list('id', 'aadhar_id'))
+
+        for i in range(0, len(users), 500):
+            rows = [Transaction(
+                aadhar_id=aadhar_id,
+                date=date.today() - timedelta(days=rng.randrange(365)),
+                amount=Decimal(rng.randrange(100, 50000)),
+                transaction_type=rng.choice(('CREDIT', 'CREDIT', 'DEBIT'))
+            ) for _, aadhar_id in users[i:i + 500] for _ in range(options['transactions_per_user'])]
+            Transaction.objects.insert_batch(rows, batch_size=1000)
+
+        borrowers = users[:int(user_count * options['loan_ratio'])]
+        cycles_per_loan = options['cycles_per_loan']
+        start = date.today() - timedelta(days=30 * cycles_per_loan)
+        loans = Loan.objects.bulk_create([Loan(
+            user_id=user_id,
+            loan_type='CREDIT_CARD',
+            loan_amount=Decimal('5000.00'),
+            principal_balance=Decimal('5000.00'),
+            interest_rate=Decimal('14'),
+            term_period=12,
+            disbursement_date=start,
+            next_billing_date=date.today() + timedelta(days=30)
+        ) for user_id, _ in borrowers], batch_size=1000)
+        BillingCycle.objects.bulk_create([BillingCycle(
+            loan=loan,
+            billing_date=start + timedelta(days=30 * (n + 1)),
+            due_date=start + timedelta(days=30 * (n + 1) + 15),
+            min_due=MIN_DUE,
+            principal_portion=Decimal('60.00'),
+            interest_portion=Decimal('40.00'),
+            is_paid=n < cycles_per_loan // 2
+        ) for loan in loans for n in range(cycles_per_loan)], batch_size=1000)
+        Payment.objects.bulk_create([
+            Payment(billing_cycle=cycle, amount=MIN_DUE)
+            for cycle in BillingCycle.objects.filter(loan__in=loans, is_paid=True).iterator()
+        ], batch_size=1000)
+
+        return {
+            'users': [user_id for user_id, _ in users],
+            'loans': [loan.id for loan in loans],
+            'unpaid_cycles': cycles_per_loan - cycles_per_loan // 2,
+        }
+
+    def generate_specs(self, options, population, rng):
+        # Specs refer to users and loans by position in the population, so a
+        # recorded mix replays against any population of the same scale
+        mix = parse_mix(options['mix'])
+        if not population['loans']:
+            mix.pop('make-payment', None)
+            mix.pop('get-statement', None)
+        endpoints = [endpoint for endpoint, weight in mix.items() if weight > 0]
+        if not endpoints:
+            raise CommandError('--mix leaves no endpoint to request')
+        weights = [mix[endpoint] for endpoint in endpoints]
+
+        unpaid = {n: population['unpaid_cycles'] for n in range(len(population['loans']))}
+        specs = []
+        for n in range(options['requests']):
+            endpoint = rng.choices(endpoints, weights)[0]
+            if endpoint == 'make-payment':
+                payable = [loan for loan, cycles in unpaid.items() if cycles]
+                if not payable:
+                    endpoint = 'get-statement'
+                else:
+                    loan = rng.choice(payable)
+                    unpaid[loan] -= 1
+                    specs.append({'endpoint': endpoint, 'loan': loan})
+                    continue
+            if endpoint == 'register-user':
+                specs.append({'endpoint': endpoint, 'n': n})
+            elif endpoint == 'apply-loan':
+                specs.append({'endpoint': endpoint, 'user': rng.randrange(len(population['users']))})
+            else:
+                specs.append({'endpoint': endpoint, 'loan': rng.randrange(len(population['loans']))})
+        return specs
+
+    def load_specs(self, path, population):
+        specs = []
+        with open(path) as recording:
+            for number, line in enumerate(recording, 1):
+                if not line.strip():
+                    continue
+                try:
+                    spec = json.loads(line)
+                    if spec['endpoint'] not in ENDPOINTS:
+                        raise ValueError(f'unknown endpoint {spec["endpoint"]!r}')
+                    for key, size in (('user', len(population['users'])), ('loan', len(population['loans']))):
+                        if key in spec and not 0 <= spec[key] < size:
+                            raise ValueError(f'{key} {spec[key]} is outside the population; use a larger --users')
+                except (ValueError, KeyError, TypeError) as e:
+                    raise CommandError(f'{path}:{number}: {e}')
+                specs.append(spec)
+        return specs
+
+    def build_request(self, spec, population):
+        endpoint = spec['endpoint']
+        if endpoint == 'register-user':
+            suffix = uuid.uuid4().hex[:8]
+            return 'POST', '/api/register-user/', {
+                'aadhar_id': f'96{uuid.uuid4().int % 10 ** 10:010d}',
+                'username': f'{REGISTER_USERNAME}{spec["n"]}-{suffix}',
+                'email_id': f'bench-{spec["n"]}-{suffix}@example.com',
+                'annual_income': '500000'
+            }
+        if endpoint == 'apply-loan':
+            return 'POST', '/api/apply-loan/', {
+                'unique_user_id': str(uuid.UUID(int=population['users'][spec['user']])),
+                'loan_type': 'CREDIT_CARD',
+                'loan_amount': '5000',
+                'interest_rate': '14',
+                'term_period': 12,
+                'disbursement_date': date.today().isoformat()
+            }
+        loan_id = str(population['loans'][spec['loan']])
+        if endpoint == 'make-payment':
+            return 'POST', '/api/make-payment/', {'loan_id': loan_id, 'amount': str(MIN_DUE)}
+        return 'GET', f'/api/get-statement/?{urlencode({"loan_id": loan_id})}', None
+
+    def send_in_process(self, client, method, path, body):
+        if method == 'GET':
+            return client.get(path).status_code
+        return client.post(path, body, content_type='application/json').status_code
+
+    def send_http(self, base_url, method, path, body):
+        data = json.dumps(body).encode() if body is not None else None
+        request = Request(base_url.rstrip('/') + path, data=data, method=method,
+                          headers={'Content-Type': 'application/json'})
+        try:
+            with urlopen(request, timeout=30) as response:
+                response.read()
+                return response.status
+        except HTTPError as e:
+            return e.code
+
+    def replay(self, specs, population, options):
+        # Closed loop: each client sends its next request when the last returns
+        queue = iter(specs)
+        lock = threading.Lock()
+        samples = {endpoint: [] for endpoint in ENDPOINTS}
+        errors = {endpoint: 0 for endpoint in ENDPOINTS}
+
+        def client_loop():
+            client = None if options['url'] else Client(HTTP_HOST='localhost')
+            try:
+                while True:
+                    with lock:
+                        spec = next(queue, None)
+                    if spec is None:
+                        return
+                    method, path, body = self.build_request(spec, population)
+                    started = time.perf_counter()
+                    try:
+                        if client is None:
+                            code = self.send_http(options['url'], method, path, body)
+                        else:
+                            code = self.send_in_process(client, method, path, body)
+                    except Exception:
+                        code = None
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        samples[spec['endpoint']].append(elapsed)
+                        if code is None or code >= 300:
+                            errors[spec['endpoint']] += 1
+            finally:
+                connection.close()
+
+        connection.close()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            for future in [pool.submit(client_loop) for _ in range(options['concurrency'])]:
+                future.result()
+        elapsed = time.perf_counter() - started
+
+        results = {}
+        for endpoint, latencies in samples.items():
+            if not latencies:
+                continue
+            results[endpoint] = {
+                'requests': len(latencies),
+                'errors': errors[endpoint],
+                'throughput': len(latencies) / max(elapsed, 1e-9),
+                'p50_ms': percentile(latencies, 0.50) * 1000,
+                'p95_ms': percentile(latencies, 0.95) * 1000,
+                'p99_ms': percentile(latencies, 0.99) * 1000,
+            }
+        return results
+
+    def report(self, results):
+        self.stdout.write(f'{"endpoint":<15}{"requests":>10}{"errors":>8}{"req/sec":>10}'
+                          f'{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}')
+        for endpoint, result in results.items():
+            self.stdout.write(
+                f'{endpoint:<15}{result["requests"]:>10}{result["errors"]:>8}{result["throughput"]:>10.1f}'
+                f'{result["p50_ms"]:>10.1f}{result["p95_ms"]:>10.1f}{result["p99_ms"]:>10.1f}'
+            )
+
+    def compare(self, results, path, tolerance):
+        try:
+            with open(path) as baseline:
+                expected = json.load(baseline)['endpoints']
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f'Cannot read baseline {path}: {e}')
+
+        regressions = []
+        for endpoint, base in expected.items():
+            current = results.get(endpoint)
+            if current is None:
+                continue
+            for metric in ('p95_ms', 'p99_ms'):
+                if current[metric] > base[metric] * (1 + tolerance):
+                    regressions.append(f'{endpoint} {metric} {base[metric]:.1f} -> {current[metric]:.1f}')
+            if current['throughput'] < base['throughput'] * (1 - tolerance):
+                regressions.append(
+                    f'{endpoint} throughput {base["throughput"]:.1f} -> {current["throughput"]:.1f} req/sec'
+                )
+
+        if regressions:
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(f'Regression: {regression}'))
+            raise CommandError(f'{len(regressions)} regression(s) against {path} (tolerance {tolerance:.0%})')
+        self.stdout.write(self.style.SUCCESS(f'No regressions against {path} (tolerance {tolerance:.0%})'))
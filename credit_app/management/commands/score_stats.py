@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from ...models import PendingCreditScore
+from ...routers import replica_reads
+from ...tasks import score_counters
+
+
+class Command(BaseCommand):
+    help = 'Show coalesced credit scoring counters'
+
+    def handle(self, *args, **options):
+        counters = score_counters()
+        with replica_reads():
+            pending = PendingCreditScore.objects.count()
+        self.stdout.write(
+            f'{counters["requests"]} score requests received, '
+            f'{counters["computations"]} scores computed in {counters["flushes"]} batches '
+            f'({counters["coalesced"]} coalesced), '
+            f'{pending} pending'
+        )
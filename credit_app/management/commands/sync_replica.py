@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+import time
+from ...routers import replica_aliases
+
+
+class Command(BaseCommand):
+    help = ('Copy the primary SQLite database into each replica in DATABASE_REPLICAS, standing in '
+            'for replication when trying the replica router locally. Run it again (or in a loop) '
+            'to let the replicas catch up.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, metavar='SECONDS',
+                            help='Keep copying at this interval, simulating a lagging replica')
+
+    def handle(self, *args, **options):
+        replicas = replica_aliases()
+        if not replicas:
+            raise CommandError('No replicas configured; set DATABASE_REPLICAS')
+        aliases = (DEFAULT_DB_ALIAS, *replicas)
+        if any(connections[alias].vendor != 'sqlite' for alias in aliases):
+            raise CommandError('sync_replica only copies SQLite databases; real replicas are kept '
+                               'in sync by the database server')
+
+        while True:
+            started = time.monotonic()
+            source = connections[DEFAULT_DB_ALIAS]
+            source.ensure_connection()
+            for alias in replicas:
+                target = connections[alias]
+                target.ensure_connection()
+                source.connection.backup(target.connection)
+            self.stdout.write(self.style.SUCCESS(
+                f'Copied {DEFAULT_DB_ALIAS} to {", ".join(replicas)} in {time.monotonic() - started:.2f}s'
+            ))
+            if options['every'] is None:
+                return
+            time.sleep(options['every'])
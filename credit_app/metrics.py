@@ -0,0 +1,206 @@
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from django.db import connections
+import threading
+import time
+
+# Sub-buckets per power of two: bucket widths stay within 1/32 (~3%) of the
+# values they hold, whatever the magnitude
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+# Bucket bounds (seconds) exported to Prometheus, derived from the fine buckets
+EXPORT_BOUNDS = [scale * 10 ** exponent for exponent in range(-4, 2) for scale in (1, 2.5, 5)]
+COUNT_BOUNDS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+
+def percentile(values, fraction):
+    # Exact percentile of a list of samples (nearest rank)
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def bucket_index(value):
+    if value < SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return shift * SUB_BUCKETS + (value >> shift)
+
+
+def bucket_upper(index):
+    # Exclusive upper bound of the (integer) values counted in a bucket
+    if index < SUB_BUCKETS:
+        return index + 1
+    shift = index // SUB_BUCKETS - 1
+    return (index - shift * SUB_BUCKETS + 1) << shift
+
+
+class Histogram:
+    """HDR-style histogram of non-negative values with bounded relative error.
+
+    Values are scaled by ``unit`` and counted in log-linear integer buckets, so
+    memory depends on the range of values seen rather than on their number.
+    """
+
+    def __init__(self, unit=1):
+        self.unit = unit
+        self.counts = {}
+        self.total = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, value):
+        index = bucket_index(max(int(value * self.unit), 0))
+        with self.lock:
+            self.counts[index] = self.counts.get(index, 0) + 1
+            self.total += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self.lock:
+            return sorted(self.counts.items()), self.total, self.sum
+
+    def quantile(self, fraction, snapshot=None):
+        buckets, total, _ = snapshot or self.snapshot()
+        if not total:
+            return 0.0
+        rank = fraction * total
+        seen = 0
+        for index, count in buckets:
+            seen += count
+            if seen >= rank:
+                return (bucket_upper(index) - 1) / self.unit
+        return (bucket_upper(buckets[-1][0]) - 1) / self.unit
+
+    def cumulative(self, bounds, snapshot=None):
+        # Counts of values <= each bound, as Prometheus "le" buckets
+        buckets, _, _ = snapshot or self.snapshot()
+        result = []
+        seen = 0
+        position = 0
+        for bound in bounds:
+            while position < len(buckets) and bucket_upper(buckets[position][0]) - 1 <= bound * self.unit:
+                seen += buckets[position][1]
+                position += 1
+            result.append((bound, seen))
+        return result
+
+
+class RequestTiming:
+    """Query count and time spent in each phase of one request."""
+
+    def __init__(self, capture_sql=False, max_statements=100):
+        self.queries = 0
+        self.phases = {'db': 0.0, 'validation': 0.0}
+        self.statements = [] if capture_sql else None
+        self.max_statements = max_statements
+        self.lock = threading.Lock()
+
+    def add(self, phase, seconds):
+        with self.lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.queries += 1
+                self.phases['db'] += elapsed
+                if self.statements is not None and len(self.statements) < self.max_statements:
+                    self.statements.append((context['connection'].alias, elapsed, sql, params))
+
+
+current_timing = ContextVar('current_timing', default=None)
+
+
+@contextmanager
+def track_queries(timing=None):
+    """Record the queries this thread runs on every database into the request timing."""
+    timing = timing or current_timing.get()
+    if timing is None:
+        yield
+        return
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timing))
+        yield
+
+
+@contextmanager
+def timed(phase):
+    """Add the time spent in the block to ``phase`` of the current request, if any."""
+    timing = current_timing.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timing is not None:
+            timing.add(phase, time.perf_counter() - started)
+
+
+class Registry:
+    """Per-view histograms and status counters for this process."""
+
+    def __init__(self):
+        self.histograms = {}
+        self.responses = {}
+        self.lock = threading.Lock()
+
+    def histogram(self, name, view, unit):
+        key = (name, view)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(unit)
+            return self.histograms[key]
+
+    def observe(self, view, status_code, timing, seconds):
+        self.histogram('request_duration_seconds', view, 1000000).record(seconds)
+        self.histogram('db_duration_seconds', view, 1000000).record(timing.phases['db'])
+        self.histogram('validation_duration_seconds', view, 1000000).record(timing.phases['validation'])
+        self.histogram('db_queries', view, 1).record(timing.queries)
+        with self.lock:
+            key = (view, status_code)
+            self.responses[key] = self.responses.get(key, 0) + 1
+
+    def render(self):
+        """Prometheus text exposition of every histogram, plus p50/p95/p99 gauges."""
+        lines = []
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            responses = sorted(self.responses.items())
+
+        lines.append('# TYPE credit_responses_total counter')
+        for (view, status_code), count in responses:
+            lines.append(f'credit_responses_total{{view="{view}",status="{status_code}"}} {count}')
+
+        names = sorted({name for (name, _), _ in histograms})
+        for name in names:
+            metric = f'credit_{name}'
+            bounds = COUNT_BOUNDS if name == 'db_queries' else EXPORT_BOUNDS
+            lines.append(f'# TYPE {metric} histogram')
+            quantiles = []
+            for (histogram_name, view), histogram in histograms:
+                if histogram_name != name:
+                    continue
+                snapshot = histogram.snapshot()
+                for bound, count in histogram.cumulative(bounds, snapshot):
+                    lines.append(f'{metric}_bucket{{view="{view}",le="{bound:g}"}} {count}')
+                lines.append(f'{metric}_bucket{{view="{view}",le="+Inf"}} {snapshot[1]}')
+                lines.append(f'{metric}_sum{{view="{view}"}} {snapshot[2]:.6f}')
+                lines.append(f'{metric}_count{{view="{view}"}} {snapshot[1]}')
+                for fraction in (0.5, 0.95, 0.99):
+                    quantiles.append(
+                        f'{metric}_quantile{{view="{view}",quantile="{fraction:g}"}} '
+                        f'{histogram.quantile(fraction, snapshot):g}'
+                    )
+            lines.append(f'# TYPE {metric}_quantile gauge')
+            lines.extend(quantiles)
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
@@ -0,0 +1,88 @@
+from django.conf import settings
+import logging
+import time
+from .metrics import RequestTiming, current_timing, registry, track_queries
+from .routers import PinState, current_pin, pin_seconds, replica_aliases
+
+logger = logging.getLogger('credit_app.slow_requests')
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+class PerformanceMiddleware:
+    """Time every request and report where the time went.
+
+    Adds a Server-Timing header (total, db with query count, validation) and
+    feeds the per-view histograms served at /metrics. Requests slower than
+    SLOW_REQUEST_MS, when set, are logged with their SQL.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_ms = setting('SLOW_REQUEST_MS', None)
+
+    def __call__(self, request):
+        if request.path in setting('PERFORMANCE_EXCLUDED_PATHS', ('/metrics/',)):
+            return self.get_response(request)
+
+        timing = RequestTiming(
+            capture_sql=self.slow_ms is not None,
+            max_statements=setting('SLOW_REQUEST_MAX_STATEMENTS', 100)
+        )
+        token = current_timing.set(timing)
+        started = time.perf_counter()
+        try:
+            with track_queries(timing):
+                response = self.get_response(request)
+        finally:
+            current_timing.reset(token)
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        registry.observe(view, response.status_code, timing, elapsed)
+        response['Server-Timing'] = ', '.join([
+            f'total;dur={elapsed * 1000:.1f}',
+            f'db;dur={timing.phases["db"] * 1000:.1f};desc="{timing.queries} queries"',
+            f'validation;dur={timing.phases["validation"] * 1000:.1f}',
+        ])
+
+        if self.slow_ms is not None and elapsed * 1000 >= self.slow_ms:
+            logger.warning(
+                'Slow request %s %s (%s) took %.1fms: %d queries, %.1fms in the database\n%s',
+                request.method, request.path, view, elapsed * 1000, timing.queries,
+                timing.phases['db'] * 1000,
+                '\n'.join(f'  [{alias}] {seconds * 1000:.1f}ms {sql} {params!r}'
+                          for alias, seconds, sql, params in timing.statements)
+            )
+        return response
+
+
+class ReplicaPinningMiddleware:
+    """Keep a client's reads on the primary for a while after it writes.
+
+    A request that writes sets a cookie lasting REPLICA_PIN_SECONDS; requests
+    carrying it read from the primary, so a client sees its own payments
+    even while the replicas catch up.
+    """
+
+    cookie_name = 'primary_pin'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replica_aliases():
+            return self.get_response(request)
+
+        state = PinState(pinned=self.cookie_name in request.COOKIES)
+        token = current_pin.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_pin.reset(token)
+        if state.wrote:
+            response.set_cookie(self.cookie_name, '1', max_age=pin_seconds(), httponly=True, samesite='Lax')
+        return response
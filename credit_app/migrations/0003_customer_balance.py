@@ -0,0 +1,41 @@
+# Generated by Django 3.2.11 on 2026-10-18 13:18
+
+from django.db import migrations, models
+from django.db.models import Case, Max, Sum, When
+
+
+def build_ledger(apps, schema_editor):
+    Transaction = apps.get_model('credit_app', 'Transaction')
+    CustomerBalance = apps.get_model('credit_app', 'CustomerBalance')
+    amount = models.DecimalField(max_digits=14, decimal_places=2)
+    totals = Transaction.objects.order_by().values('aadhar_id').annotate(
+        credit_total=Sum(Case(When(transaction_type='CREDIT', then='amount'), default=0, output_field=amount)),
+        debit_total=Sum(Case(When(transaction_type='DEBIT', then='amount'), default=0, output_field=amount)),
+        last_transaction_id=Max('id')
+    )
+    CustomerBalance.objects.bulk_create(
+        (CustomerBalance(**row) for row in totals.iterator()),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_app', '0002_import_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('aadhar_id', models.CharField(max_length=12, unique=True)),
+                ('credit_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('debit_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('last_transaction_id', models.BigIntegerField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(build_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.11 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_app', '0003_customer_balance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillingRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('billing_date', models.DateField()),
+                ('shard_index', models.PositiveIntegerField(default=0)),
+                ('shard_count', models.PositiveIntegerField(default=1)),
+                ('status', models.CharField(choices=[('RUNNING', 'Running'), ('COMPLETED', 'Completed')], default='RUNNING', max_length=10)),
+                ('last_loan_id', models.UUIDField(blank=True, null=True)),
+                ('loans_processed', models.PositiveIntegerField(default=0)),
+                ('cycles_created', models.PositiveIntegerField(default=0)),
+                ('lease_owner', models.CharField(blank=True, max_length=64)),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'unique_together': {('billing_date', 'shard_index', 'shard_count')},
+            },
+        ),
+    ]
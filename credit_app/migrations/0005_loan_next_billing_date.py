@@ -0,0 +1,42 @@
+from datetime import timedelta
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_next_billing_date(apps, schema_editor):
+    Loan = apps.get_model('credit_app', 'Loan')
+    BillingCycle = apps.get_model('credit_app', 'BillingCycle')
+    latest = BillingCycle.objects.filter(loan=OuterRef('pk')).order_by('-billing_date')
+    loans = Loan.objects.annotate(
+        last_billing_date=Subquery(latest.values('billing_date')[:1])
+    ).only('id', 'disbursement_date')
+
+    batch = []
+    for loan in loans.iterator(chunk_size=1000):
+        loan.next_billing_date = (loan.last_billing_date or loan.disbursement_date) + timedelta(days=30)
+        batch.append(loan)
+        if len(batch) >= 1000:
+            Loan.objects.bulk_update(batch, ['next_billing_date'])
+            batch = []
+    Loan.objects.bulk_update(batch, ['next_billing_date'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_app', '0004_billing_run'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='next_billing_date',
+            field=models.DateField(null=True),
+        ),
+        migrations.RunPython(backfill_next_billing_date, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='loan',
+            name='next_billing_date',
+            field=models.DateField(db_index=True),
+        ),
+    ]
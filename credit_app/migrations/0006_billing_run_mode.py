@@ -0,0 +1,22 @@
+# Generated by Django 3.2.11 on 2026-10-18 13:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_app', '0005_loan_next_billing_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='billingrun',
+            name='mode',
+            field=models.CharField(choices=[('BILLING', 'Billing'), ('BACKFILL', 'Backfill')], default='BILLING', max_length=10),
+        ),
+        migrations.AlterUniqueTogether(
+            name='billingrun',
+            unique_together={('billing_date', 'mode', 'shard_index', 'shard_count')},
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.2.11 on 2026-10-18 13:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_app', '0006_billing_run_mode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledInstallment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('due_date', models.DateField()),
+                ('amount_due', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('principal', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('interest', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('is_billed', models.BooleanField(default=False)),
+                ('loan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='installments', to='credit_app.loan')),
+            ],
+            options={
+                'ordering': ['due_date'],
+                'unique_together': {('loan', 'number')},
+            },
+        ),
+    ]
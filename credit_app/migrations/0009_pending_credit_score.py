@@ -0,0 +1,21 @@
+# Generated by Django 3.2.11 on 2026-10-18 13:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_app', '0008_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingCreditScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('aadhar_id', models.CharField(max_length=12, unique=True)),
+                ('requested_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.11 on 2026-10-18 13:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_app', '0009_pending_credit_score'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='loan',
+            name='next_billing_date',
+            field=models.DateField(),
+        ),
+        migrations.AddIndex(
+            model_name='billingcycle',
+            index=models.Index(condition=models.Q(('is_paid', False)), fields=['loan', 'billing_date'], name='cycle_unpaid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['next_billing_date'], name='loan_active_billing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scheduledinstallment',
+            index=models.Index(condition=models.Q(('is_billed', False)), fields=['loan', 'due_date'], name='installment_unbilled_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['aadhar_id', 'id'], name='transaction_aadhar_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.11 on 2026-10-18 14:02
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_app', '0010_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='billingrun',
+            unique_together={('billing_date', 'shard_index')},
+        ),
+    ]
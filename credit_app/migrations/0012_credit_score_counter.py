@@ -0,0 +1,28 @@
+# Generated by Django 3.2.11 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+def create_counter_row(apps, schema_editor):
+    CreditScoreCounter = apps.get_model('credit_app', 'CreditScoreCounter')
+    CreditScoreCounter.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_app', '0011_billing_run_per_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreditScoreCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('requests', models.BigIntegerField(default=0)),
+                ('computations', models.BigIntegerField(default=0)),
+                ('flushes', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_counter_row, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.11 on 2026-10-18 14:24
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_app', '0012_credit_score_counter'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='billingrun',
+            unique_together={('billing_date', 'mode', 'shard_index')},
+        ),
+    ]
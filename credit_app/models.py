@@ -1,8 +1,16 @@
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import Case, F, Max, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
 from django.contrib.auth.models import AbstractUser, Group, Permission
+from django.utils import timezone
 from django.core.validators import MinValueValidator
+from datetime import timedelta
 from decimal import Decimal
+from operator import attrgetter
 import uuid
+from .amortization import amortization_schedule
+from .eligibility import invalidate_eligibility
+from .sharding import group_by_shard, shard_for
 
 class User(AbstractUser):
     aadhar_id = models.CharField(max_length=12, unique=True)
@@ -30,6 +38,14 @@ class User(AbstractUser):
     class Meta:
         verbose_name = 'User'
         verbose_name_plural = 'Users'
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        invalidate_eligibility([self.pk])
+    
+    def delete(self, *args, **kwargs):
+        invalidate_eligibility([self.pk])
+        return super().delete(*args, **kwargs)
 
 class Loan(models.Model):
     LOAN_TYPES = (
@@ -44,11 +60,27 @@ class Loan(models.Model):
     interest_rate = models.DecimalField(max_digits=5, decimal_places=2)  # APR
     term_period = models.PositiveIntegerField()  # in months
     disbursement_date = models.DateField()
+    # Date the next billing cycle is due; advanced whenever a cycle is written
+    next_billing_date = models.DateField()
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Billing only ever looks for active loans that are due; closed
+            # loans stay out of the index
+            models.Index(fields=['next_billing_date'], condition=Q(is_active=True),
+                         name='loan_active_billing_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.user.username}'s {self.loan_type} Loan"
+    
+    def save(self, *args, **kwargs):
+        if self.next_billing_date is None:
+            # First cycle is billed 30 days after disbursement
+            self.next_billing_date = self.disbursement_date + timedelta(days=30)
+        super().save(*args, **kwargs)
 
 class BillingCycle(models.Model):
     loan = models.ForeignKey(Loan, on_delete=models.CASCADE)
@@ -63,6 +95,12 @@ class BillingCycle(models.Model):
     
     class Meta:
         ordering = ['billing_date']
+        indexes = [
+            # Payments and statements read a loan's unpaid cycles in billing
+            # order; paid cycles, the bulk of the table, are not indexed
+            models.Index(fields=['loan', 'billing_date'], condition=Q(is_paid=False),
+                         name='cycle_unpaid_idx'),
+        ]
 
 class Payment(models.Model):
     billing_cycle = models.ForeignKey(BillingCycle, on_delete=models.CASCADE)
@@ -73,6 +111,75 @@ class Payment(models.Model):
     def __str__(self):
         return f"Payment of {self.amount} for {self.billing_cycle}"
 
+class ScheduledInstallmentManager(models.Manager):
+    def mark_billed(self, cycles):
+        # Installments falling due on or before a new cycle's due date are now
+        # covered by billing; one select and one update for the whole batch
+        latest_due = {}
+        for cycle in cycles:
+            latest_due[cycle.loan_id] = max(cycle.due_date, latest_due.get(cycle.loan_id, cycle.due_date))
+        if not latest_due:
+            return
+        installments = [
+            installment for installment in self.filter(
+                loan_id__in=latest_due,
+                is_billed=False,
+                due_date__lte=max(latest_due.values())
+            )
+            if installment.due_date <= latest_due[installment.loan_id]
+        ]
+        for installment in installments:
+            installment.is_billed = True
+        self.bulk_update(installments, ['is_billed'])
+    
+    def rebase(self, loan):
+        # Re-amortize the unbilled installments over the loan's new balance,
+        # keeping their due dates
+        remaining = list(self.filter(loan=loan, is_billed=False).order_by('number'))
+        if not remaining:
+            return
+        if loan.principal_balance <= Decimal('0'):
+            self.filter(pk__in=[installment.pk for installment in remaining]).delete()
+            return
+        schedule = amortization_schedule(loan.principal_balance, loan.interest_rate, len(remaining))
+        for installment, row in zip(remaining, schedule):
+            installment.amount_due = row.amount_due
+            installment.principal = row.principal
+            installment.interest = row.interest
+            installment.balance = row.balance
+        self.bulk_update(remaining, ['amount_due', 'principal', 'interest', 'balance'])
+
+class ScheduledInstallment(models.Model):
+    # EMI schedule persisted at loan creation; rows are marked billed as
+    # billing cycles cover them and rebased on principal prepayments
+    loan = models.ForeignKey(Loan, on_delete=models.CASCADE, related_name='installments')
+    number = models.PositiveIntegerField()
+    due_date = models.DateField()
+    amount_due = models.DecimalField(max_digits=12, decimal_places=2)
+    principal = models.DecimalField(max_digits=12, decimal_places=2)
+    interest = models.DecimalField(max_digits=12, decimal_places=2)
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+    is_billed = models.BooleanField(default=False)
+    
+    objects = ScheduledInstallmentManager()
+    
+    class Meta:
+        ordering = ['due_date']
+        unique_together = ('loan', 'number')
+        indexes = [
+            models.Index(fields=['loan', 'due_date'], condition=Q(is_billed=False),
+                         name='installment_unbilled_idx'),
+        ]
+
+class TransactionManager(models.Manager):
+    def insert_batch(self, rows, batch_size=None):
+        # Insert rows on their customers' shards and fold them into the
+        # running balances there, in one transaction per shard
+        for alias, shard_rows in group_by_shard(rows, key=attrgetter('aadhar_id')).items():
+            with transaction.atomic(using=alias):
+                self.db_manager(alias).bulk_create(shard_rows, batch_size=batch_size)
+                CustomerBalance.objects.apply_transactions(shard_rows)
+
 class Transaction(models.Model):
     TRANSACTION_TYPES = (
         ('DEBIT', 'Debit'),
@@ -84,5 +191,175 @@ class Transaction(models.Model):
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     transaction_type = models.CharField(max_length=6, choices=TRANSACTION_TYPES)
     
+    objects = TransactionManager()
+    
+    class Meta:
+        ordering = ['date']
+        indexes = [
+            # Per-customer balance aggregates and last-id lookups
+            models.Index(fields=['aadhar_id', 'id'], name='transaction_aadhar_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        # The router saves the row on the shard of its aadhar_id
+        with transaction.atomic(using=shard_for(self.aadhar_id)):
+            super().save(*args, **kwargs)
+            if adding:
+                CustomerBalance.objects.apply_transactions([self])
+
+def balance_totals(transactions):
+    # Per-customer credit/debit totals in one grouped aggregate
+    return transactions.order_by().values('aadhar_id').annotate(
+        credit_total=Sum(Case(When(transaction_type='CREDIT', then='amount'), default=0,
+                              output_field=models.DecimalField(max_digits=14, decimal_places=2))),
+        debit_total=Sum(Case(When(transaction_type='DEBIT', then='amount'), default=0,
+                             output_field=models.DecimalField(max_digits=14, decimal_places=2))),
+        last_transaction_id=Max('id')
+    )
+
+AMOUNT_FIELD = models.DecimalField(max_digits=14, decimal_places=2)
+ID_FIELD = models.BigIntegerField()
+
+def per_customer(aadhar_ids, value, output_field):
+    # CASE picking each customer's own value in a multi-row UPDATE
+    return Case(*[
+        When(aadhar_id=aadhar_id, then=Value(value(aadhar_id), output_field=output_field))
+        for aadhar_id in aadhar_ids
+    ], output_field=output_field)
+
+class CustomerBalanceManager(models.Manager):
+    def apply_transactions(self, rows):
+        # Fold newly inserted transactions into the running balances on their
+        # shards. Must be called inside the transactions that inserted them.
+        for alias, shard_rows in group_by_shard(rows, key=attrgetter('aadhar_id')).items():
+            self.apply_shard_transactions(alias, shard_rows)
+    
+    def apply_shard_transactions(self, alias, rows):
+        deltas = {}
+        for row in rows:
+            credit, debit, last_id = deltas.get(row.aadhar_id, (Decimal('0'), Decimal('0'), None))
+            if row.transaction_type == 'CREDIT':
+                credit += Decimal(row.amount)
+            else:
+                debit += Decimal(row.amount)
+            if row.pk is not None:
+                last_id = max(last_id or 0, row.pk)
+            deltas[row.aadhar_id] = (credit, debit, last_id)
+        
+        # bulk_create only returns primary keys on some backends
+        missing_ids = [aadhar_id for aadhar_id, delta in deltas.items() if delta[2] is None]
+        last_ids = dict(
+            Transaction.objects.using(alias).filter(aadhar_id__in=missing_ids).order_by()
+            .values('aadhar_id').annotate(last=Max('id')).values_list('aadhar_id', 'last')
+        ) if missing_ids else {}
+        
+        balances = self.db_manager(alias)
+        balances.bulk_create([CustomerBalance(aadhar_id=aadhar_id) for aadhar_id in deltas], ignore_conflicts=True)
+        # One CASE/WHEN UPDATE per chunk of customers, sized to the backend's
+        # parameter limit (about 140 customers a statement on SQLite)
+        aadhar_ids = list(deltas)
+        chunk_size = connections[alias].ops.bulk_batch_size(['aadhar_id'] * 7, aadhar_ids) or len(aadhar_ids)
+        for i in range(0, len(aadhar_ids), chunk_size):
+            chunk = aadhar_ids[i:i + chunk_size]
+            balances.filter(aadhar_id__in=chunk).update(
+                credit_total=F('credit_total') + per_customer(chunk, lambda aadhar_id: deltas[aadhar_id][0], AMOUNT_FIELD),
+                debit_total=F('debit_total') + per_customer(chunk, lambda aadhar_id: deltas[aadhar_id][1], AMOUNT_FIELD),
+                # Batches from parallel importers commit out of order, so the
+                # last id only ever moves forward
+                last_transaction_id=Greatest(
+                    Coalesce('last_transaction_id', Value(0)),
+                    per_customer(chunk, lambda aadhar_id: deltas[aadhar_id][2] or last_ids[aadhar_id], ID_FIELD)
+                ),
+                updated_at=timezone.now()
+            )
+
+class CustomerBalance(models.Model):
+    # Running balance per customer, kept in step with Transaction inserts on
+    # the customer's shard
+    aadhar_id = models.CharField(max_length=12, unique=True)
+    credit_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    debit_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    last_transaction_id = models.BigIntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = CustomerBalanceManager()
+    
+    @property
+    def net_balance(self):
+        return self.credit_total - self.debit_total
+
+class ImportCheckpoint(models.Model):
+    # Committed byte offset of one segment of an import feed, written in the
+    # same database transaction as the rows it covers
+    source = models.CharField(max_length=255)
+    segment_start = models.BigIntegerField()
+    position = models.BigIntegerField()
+    rows_imported = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ('source', 'segment_start')
+
+class BillingRun(models.Model):
+    # One shard of a billing date's run in one mode: checkpoint and lease for
+    # resuming. Each mode bills a date with a single shard count.
+    STATUSES = (
+        ('RUNNING', 'Running'),
+        ('COMPLETED', 'Completed'),
+    )
+    MODES = (
+        ('BILLING', 'Billing'),
+        ('BACKFILL', 'Backfill'),
+    )
+    
+    billing_date = models.DateField()
+    mode = models.CharField(max_length=10, choices=MODES, default='BILLING')
+    shard_index = models.PositiveIntegerField(default=0)
+    shard_count = models.PositiveIntegerField(default=1)
+    status = models.CharField(max_length=10, choices=STATUSES, default='RUNNING')
+    last_loan_id = models.UUIDField(null=True, blank=True)
+    loans_processed = models.PositiveIntegerField(default=0)
+    cycles_created = models.PositiveIntegerField(default=0)
+    lease_owner = models.CharField(max_length=64, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
     class Meta:
-        ordering = ['date']
\ No newline at end of file
+        unique_together = ('billing_date', 'mode', 'shard_index')
+    
+    def __str__(self):
+        return f"{self.get_mode_display()} {self.billing_date} shard {self.shard_index}/{self.shard_count}"
+
+class IdempotencyKey(models.Model):
+    # Stored outcome of a POST made with an Idempotency-Key header
+    STATUSES = (
+        ('PENDING', 'Pending'),
+        ('DONE', 'Done'),
+    )
+    
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status = models.CharField(max_length=10, choices=STATUSES, default='PENDING')
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        unique_together = ('scope', 'key')
+
+class PendingCreditScore(models.Model):
+    # Customers waiting for the next coalesced credit score flush; one row per
+    # customer however many times a score was requested
+    aadhar_id = models.CharField(max_length=12, unique=True)
+    requested_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+class CreditScoreCounter(models.Model):
+    # Coalesced scoring counters shared by every web process and worker; a
+    # single row, incremented in place
+    requests = models.BigIntegerField(default=0)
+    computations = models.BigIntegerField(default=0)
+    flushes = models.BigIntegerField(default=0)
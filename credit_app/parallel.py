@@ -0,0 +1,20 @@
+from multiprocessing import get_context
+
+from django.db import connections
+
+
+def run_in_workers(func, jobs, workers=1):
+    """Yield ``func(job)`` for every job, fanning out to forked processes when workers > 1.
+
+    ``func`` must be a module-level function so it can be sent to the pool.
+    Results are yielded in completion order.
+    """
+    if workers <= 1:
+        for job in jobs:
+            yield func(job)
+        return
+
+    # Children must open their own connections instead of sharing the parent's sockets
+    connections.close_all()
+    with get_context('fork').Pool(processes=workers) as pool:
+        yield from pool.imap_unordered(func, jobs)
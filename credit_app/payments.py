@@ -0,0 +1,195 @@
+from django.db import OperationalError, transaction
+from decimal import Decimal
+import json
+import logging
+import random
+import time
+from .models import Loan, BillingCycle, Payment, ScheduledInstallment
+from .serializers import PaymentSerializer
+from .statement_cache import invalidate_statements
+
+logger = logging.getLogger(__name__)
+
+LOCK_RETRIES = 5
+# Serialization failure, deadlock and NOWAIT lock failure on PostgreSQL;
+# deadlock and lock wait timeout on MySQL
+POSTGRESQL_LOCK_ERRORS = {'40001', '40P01', '55P03'}
+MYSQL_LOCK_ERRORS = {1205, 1213}
+
+
+class PaymentRejected(Exception):
+    pass
+
+
+def is_lock_conflict(error):
+    # Django re-raises the driver's exception as the OperationalError's cause
+    cause = error.__cause__
+    if getattr(cause, 'pgcode', None) in POSTGRESQL_LOCK_ERRORS:
+        return True
+    if cause is not None and cause.args and cause.args[0] in MYSQL_LOCK_ERRORS:
+        return True
+    return 'database is locked' in str(error)
+
+
+def retry_on_lock_conflict(func, attempts=LOCK_RETRIES):
+    """Call ``func``, retrying with jittered backoff when the database reports a
+    lock conflict (deadlock, or SQLite's busy error). Other operational
+    errors, such as a lost connection, are raised at once."""
+    for attempt in range(attempts):
+        try:
+            return func()
+        except OperationalError as e:
+            if attempt == attempts - 1 or not is_lock_conflict(e):
+                raise
+            time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+
+
+def allocate_payment(billing_cycle, amount):
+    """Apply ``amount`` to ``billing_cycle`` in memory and return the excess for principal.
+
+    Raises PaymentRejected, leaving the cycle untouched, if the payment does
+    not cover the cycle's past due amount.
+    """
+    amount_paid = amount
+    
+    # Check if payment covers past due first
+    if billing_cycle.past_due > 0:
+        if amount_paid < billing_cycle.past_due:
+            raise PaymentRejected('Payment must cover past due amount first')
+        
+        amount_paid -= billing_cycle.past_due
+        billing_cycle.past_due = Decimal('0')
+    
+    # Check if payment covers current min due
+    if amount_paid < billing_cycle.min_due:
+        # Partial payment - update past due
+        billing_cycle.past_due = billing_cycle.min_due - amount_paid
+        amount_paid = Decimal('0')
+    else:
+        amount_paid -= billing_cycle.min_due
+    
+    billing_cycle.is_paid = True
+    return amount_paid
+
+
+def apply_to_loan(loan, principal_payment):
+    # If there's extra payment, reduce principal and close a fully paid loan
+    if principal_payment > 0:
+        loan.principal_balance -= principal_payment
+    if loan.principal_balance <= Decimal('0'):
+        loan.is_active = False
+
+
+def parse_payment_line(line):
+    serializer = PaymentSerializer(data=json.loads(line))
+    if not serializer.is_valid():
+        raise PaymentRejected(serializer.errors)
+    return serializer.validated_data
+
+
+def apply_payment_chunk(entries):
+    """Apply a chunk of ``(line_number, data)`` payments with bulk reads and writes.
+
+    Payments are applied in line order with the same rules as MakePaymentView,
+    so several payments for one loan settle successive unpaid cycles. The
+    chunk runs in one transaction holding row locks on its loans.
+    Returns one outcome dict per entry.
+    """
+    return retry_on_lock_conflict(lambda: settle_payment_chunk(entries))
+
+
+def settle_payment_chunk(entries):
+    loan_ids = {data['loan_id'] for _, data in entries}
+    with transaction.atomic():
+        # Lock loans in primary key order so overlapping chunks and single
+        # payments always acquire locks in the same order
+        loans = {
+            loan.id: loan
+            for loan in Loan.objects.select_for_update().filter(id__in=loan_ids, is_active=True).order_by('id')
+        }
+        unpaid = {}
+        for cycle in BillingCycle.objects.filter(loan_id__in=loans, is_paid=False).order_by('billing_date', 'id'):
+            unpaid.setdefault(cycle.loan_id, []).append(cycle)
+        
+        outcomes = []
+        paid_cycles, payments, prepaid = [], [], set()
+        for line_number, data in entries:
+            loan = loans.get(data['loan_id'])
+            outcome = {'line': line_number, 'loan_id': str(data['loan_id']), 'error': None}
+            outcomes.append(outcome)
+            if loan is None or not loan.is_active:
+                outcome['error'] = 'Loan not found or already closed'
+                continue
+            cycles = unpaid.get(loan.id)
+            if not cycles:
+                outcome['error'] = 'No pending payments for this loan'
+                continue
+            try:
+                principal_payment = allocate_payment(cycles[0], data['amount'])
+            except PaymentRejected as e:
+                outcome['error'] = str(e)
+                continue
+            billing_cycle = cycles.pop(0)
+            paid_cycles.append(billing_cycle)
+            payments.append(Payment(
+                billing_cycle=billing_cycle,
+                amount=data['amount'],
+                is_principal_payment=(principal_payment > 0)
+            ))
+            apply_to_loan(loan, principal_payment)
+            if principal_payment > 0:
+                prepaid.add(loan.id)
+        
+        if paid_cycles:
+            touched = {cycle.loan_id for cycle in paid_cycles}
+            BillingCycle.objects.bulk_update(paid_cycles, ['is_paid', 'past_due'])
+            Payment.objects.bulk_create(payments)
+            Loan.objects.bulk_update([loans[loan_id] for loan_id in touched], ['principal_balance', 'is_active'])
+            for loan_id in prepaid:
+                ScheduledInstallment.objects.rebase(loans[loan_id])
+            invalidate_statements(touched)
+    return outcomes
+
+
+def apply_payment_lines(lines, chunk_size=1000, on_failure=None):
+    """Apply NDJSON payment lines (``{"loan_id": ..., "amount": ...}``) chunk by chunk.
+
+    ``lines`` may be text or bytes, e.g. an HttpRequest read line by line.
+    Yields one outcome per non-blank line, in order. A chunk that fails is
+    rolled back and its lines reported as not applied; the chunks before it
+    stay committed and the next ones are still tried. ``on_failure(first
+    line, last line, exception)`` is called for each failed chunk.
+    """
+    entries = []
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            entries.append((line_number, parse_payment_line(line)))
+        except (ValueError, PaymentRejected) as e:
+            # Keep invalid lines in position so outcomes stay in line order
+            entries.append((line_number, e))
+        if len(entries) >= chunk_size:
+            yield from settle_entries(entries, on_failure)
+            entries = []
+    if entries:
+        yield from settle_entries(entries, on_failure)
+
+
+def settle_entries(entries, on_failure=None):
+    valid = [(line_number, data) for line_number, data in entries if not isinstance(data, Exception)]
+    try:
+        outcomes = {outcome['line']: outcome for outcome in apply_payment_chunk(valid)} if valid else {}
+    except Exception as e:
+        logger.exception('Payment lines %s-%s failed', entries[0][0], entries[-1][0])
+        if on_failure:
+            on_failure(entries[0][0], entries[-1][0], e)
+        outcomes = {
+            line_number: {'line': line_number, 'loan_id': str(data['loan_id']), 'error': f'Not applied: {e}'}
+            for line_number, data in valid
+        }
+    for line_number, data in entries:
+        if isinstance(data, Exception):
+            yield {'line': line_number, 'loan_id': None, 'error': str(data)}
+        else:
+            yield outcomes[line_number]
@@ -0,0 +1,35 @@
+import time
+
+from django.db import connection
+
+
+class QueryCounter:
+    """Count the queries (and time spent in them) issued on a connection while active.
+
+    Usage::
+
+        with QueryCounter() as queries:
+            ...
+        print(queries.count, queries.seconds)
+    """
+
+    def __init__(self, using=None):
+        self.connection = connection if using is None else using
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.monotonic() - started
+
+    def __enter__(self):
+        self._wrapper = self.connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._wrapper.__exit__(*exc_info)
@@ -0,0 +1,175 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+import random
+from .checks import process_local
+from .sharding import SHARD_LOCAL_MODELS, SHARDED_MODELS, shard_aliases, shard_for
+
+# The replica chosen for the current replica_reads block, or None
+use_replica = ContextVar('use_replica', default=None)
+# Per-request PinState, installed by ReplicaPinningMiddleware
+current_pin = ContextVar('current_pin', default=None)
+
+
+def replica_aliases():
+    return tuple(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+def pin_key(key):
+    return f'replica-pin:{key}'
+
+
+def pin_cache():
+    """The cache holding pins, or None when it is a per-process cache.
+
+    Loans are pinned by whichever process wrote them, often a command or a
+    Celery worker, so a process-local cache would never show the pin to the
+    web processes.
+    """
+    alias = getattr(settings, 'REPLICA_PIN_CACHE_ALIAS', DEFAULT_CACHE_ALIAS)
+    return None if process_local(alias) else caches[alias]
+
+
+class PinState:
+    """Whether this request reads from the primary, and whether it wrote."""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+def pin_to_primary(keys):
+    """Read objects named by ``keys`` from the primary for REPLICA_PIN_SECONDS after commit.
+
+    Replicas may lag the primary by up to that long, so without the pin a
+    read straight after a write could see (and cache) the old rows.
+    """
+    keys = [pin_key(key) for key in set(keys)]
+    cache = pin_cache()
+    if keys and replica_aliases() and cache is not None:
+        transaction.on_commit(lambda: cache.set_many(dict.fromkeys(keys, 1), timeout=pin_seconds()))
+
+
+def primary_pinned(keys=()):
+    state = current_pin.get()
+    if state is not None and state.pinned:
+        return True
+    if not keys:
+        return False
+    # Without a shared pin cache, writes by other processes can't be seen
+    cache = pin_cache()
+    return cache is None or bool(cache.get_many([pin_key(key) for key in keys]))
+
+
+def reads_on_replica(keys=()):
+    return bool(replica_aliases()) and not primary_pinned(keys)
+
+
+@contextmanager
+def replica_reads(*keys):
+    """Send the block's reads to a replica, the same one for the whole block.
+
+    Reads stay on the primary when the client wrote within REPLICA_PIN_SECONDS,
+    or when any of ``keys`` was pinned by ``pin_to_primary``.
+    """
+    if not reads_on_replica(keys):
+        yield
+        return
+    token = use_replica.set(random.choice(replica_aliases()))
+    try:
+        yield
+    finally:
+        use_replica.reset(token)
+
+
+def replica_stream(rows, *keys):
+    """Iterate the lazy generator ``rows`` with its reads on a replica.
+
+    For streamed responses, which are consumed after the view and the
+    middleware have returned: the pins are checked now, while the request's
+    own pin is still known.
+    """
+    if not reads_on_replica(keys):
+        return rows
+    replica = random.choice(replica_aliases())
+
+    def stream():
+        # Restored by value rather than with a token, as the server may
+        # close the stream from another context
+        previous = use_replica.get()
+        use_replica.set(replica)
+        try:
+            yield from rows
+        finally:
+            use_replica.set(previous)
+    return stream()
+
+
+class ReplicaRouter:
+    """Route reads inside ``replica_reads`` to the replica picked for the block.
+
+    Everything else, including every write and every read inside a
+    transaction on the primary, goes to the default database.
+    """
+
+    def db_for_read(self, model, **hints):
+        replica = use_replica.get()
+        if replica is None or replica not in replica_aliases():
+            return None
+        state = current_pin.get()
+        if state is not None and state.pinned:
+            return None
+        # A transaction must see its own writes
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return replica
+
+    def db_for_write(self, model, **hints):
+        state = current_pin.get()
+        if state is not None:
+            # The rest of the request, and the client's next requests, read
+            # from the primary
+            state.pinned = state.wrote = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        if db in replica_aliases():
+            return False
+        return None
+
+
+class ShardRouter:
+    """Place Transaction and CustomerBalance rows on the shard of their aadhar_id.
+
+    Saves and related lookups are routed by the instance's aadhar_id; querysets
+    carry no instance, so per-customer queries name their shard with
+    ``using(shard_for(aadhar_id))`` and population-wide ones go through
+    ``sharding.fan_out``.
+    """
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if model._meta.model_name in SHARDED_MODELS and getattr(instance, 'aadhar_id', None):
+            return shard_for(instance.aadhar_id)
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == DEFAULT_DB_ALIAS or db not in shard_aliases():
+            return None
+        # Shards hold only the sharded tables; data migrations run on the default
+        return app_label == 'credit_app' and model_name in SHARD_LOCAL_MODELS
@@ -0,0 +1,225 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection, models
+from django.db.models import Case, F, Sum, Value, When
+from django.db.models.functions import Coalesce
+import threading
+import time
+from .eligibility import invalidate_eligibility
+from .models import User, CustomerBalance, Transaction, balance_totals
+from .parallel import run_in_workers
+from .sharding import fan_out, group_by_shard, shard_for, shard_objects
+
+
+def score_from_balance(total_balance):
+    # Calculate credit score based on rules
+    if total_balance >= Decimal('1000000'):
+        return 900
+    if total_balance <= Decimal('10000'):
+        return 300
+    # Calculate based on 10 points per Rs. 15,000
+    difference = total_balance - Decimal('10000')
+    points = (difference / Decimal('15000')) * 10
+    return min(300 + int(points), 900)  # Cap at 900
+
+
+def score_balances(balances):
+    # Score a whole batch of balances in one pass
+    return [score_from_balance(balance) for balance in balances]
+
+
+def customer_balances(aadhar_ids, from_transactions=False):
+    """Net balance of each customer in ``aadhar_ids`` that has one, read from all shards in parallel.
+
+    Balances come from the running ledger, or with ``from_transactions`` are
+    aggregated from the Transaction rows themselves.
+    """
+    def read(alias, shard_ids):
+        if from_transactions:
+            totals = balance_totals(shard_objects(Transaction, alias).filter(aadhar_id__in=shard_ids))
+        else:
+            totals = shard_objects(CustomerBalance, alias).filter(aadhar_id__in=shard_ids).values(
+                'aadhar_id', 'credit_total', 'debit_total'
+            )
+        return {row['aadhar_id']: row['credit_total'] - row['debit_total'] for row in totals}
+
+    balances = {}
+    for shard_balances in fan_out(read, group_by_shard(aadhar_ids)).values():
+        balances.update(shard_balances)
+    return balances
+
+
+def score_customers(aadhar_ids):
+    """Recompute the scores of the given customers with one balance query per shard and one bulk update.
+
+    Returns the number of registered users that were scored.
+    """
+    balances = customer_balances(aadhar_ids)
+    users = list(User.objects.filter(aadhar_id__in=aadhar_ids).only('id', 'aadhar_id', 'credit_score'))
+    scores = score_balances([balances.get(user.aadhar_id, Decimal('0')) for user in users])
+    changed = []
+    for user, score in zip(users, scores):
+        if user.credit_score != score:
+            user.credit_score = score
+            changed.append(user)
+    if changed:
+        User.objects.bulk_update(changed, ['credit_score'], batch_size=500)
+        invalidate_eligibility([user.id for user in changed])
+    return len(users)
+
+
+def user_id_ranges(chunk_size):
+    # Split the user table into contiguous id ranges of at most chunk_size rows
+    ranges = []
+    first = last = None
+    count = 0
+    for user_id in User.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=10000):
+        if first is None:
+            first = user_id
+        last = user_id
+        count += 1
+        if count == chunk_size:
+            ranges.append((first, last))
+            first, count = None, 0
+    if first is not None:
+        ranges.append((first, last))
+    return ranges
+
+
+def change_bucket(old_score, new_score, width=50):
+    if old_score is None:
+        return 'new'
+    return ((new_score - old_score) // width) * width
+
+
+def rescore_chunk(job):
+    """Rescore the users with ids in ``job['ids']`` and return a summary of the changes."""
+    started = time.monotonic()
+    first_id, last_id = job['ids']
+    users = list(User.objects.filter(id__gte=first_id, id__lte=last_id).only('id', 'aadhar_id', 'credit_score'))
+    aadhar_ids = [user.aadhar_id for user in users]
+
+    balances = customer_balances(aadhar_ids, job['from_transactions'])
+
+    scores = score_balances([balances.get(aadhar_id, Decimal('0')) for aadhar_id in aadhar_ids])
+    histogram = Counter()
+    changed = []
+    for user, score in zip(users, scores):
+        if user.credit_score == score:
+            continue
+        histogram[change_bucket(user.credit_score, score)] += 1
+        user.credit_score = score
+        changed.append(user)
+
+    if changed and not job['dry_run']:
+        User.objects.bulk_update(changed, ['credit_score'], batch_size=500)
+        invalidate_eligibility([user.id for user in changed])
+
+    return {
+        'users': len(users),
+        'changed': len(changed),
+        'histogram': histogram,
+        'seconds': time.monotonic() - started,
+    }
+
+
+def rescore_population(chunk_size=1000, workers=1, dry_run=False, from_transactions=False, progress=None):
+    """Recompute every user's credit score in chunks, optionally across worker processes.
+
+    ``progress`` is called with the running summary after each chunk.
+    """
+    started = time.monotonic()
+    jobs = [{
+        'ids': ids,
+        'dry_run': dry_run,
+        'from_transactions': from_transactions,
+    } for ids in user_id_ranges(chunk_size)]
+
+    summary = {'users': 0, 'changed': 0, 'chunks': len(jobs), 'histogram': Counter(), 'seconds': 0.0}
+    for result in run_in_workers(rescore_chunk, jobs, workers):
+        summary['users'] += result['users']
+        summary['changed'] += result['changed']
+        summary['histogram'].update(result['histogram'])
+        summary['seconds'] = time.monotonic() - started
+        if progress:
+            progress(summary)
+    summary['seconds'] = time.monotonic() - started
+    return summary
+
+
+def aggregate_balance(aadhar_id):
+    # Net balance straight from Transaction in one SUM/CASE query
+    amount = models.DecimalField(max_digits=14, decimal_places=2)
+    transactions = shard_objects(Transaction, shard_for(aadhar_id)).filter(aadhar_id=aadhar_id)
+    return transactions.aggregate(balance=Coalesce(
+        Sum(Case(
+            When(transaction_type='CREDIT', then=F('amount')),
+            default=-F('amount'),
+            output_field=amount
+        )),
+        Value(Decimal('0')),
+        output_field=amount
+    ))['balance']
+
+
+def compute_and_save_score(aadhar_id):
+    try:
+        score = score_from_balance(aggregate_balance(aadhar_id))
+        users = User.objects.filter(aadhar_id=aadhar_id)
+        user_ids = list(users.values_list('id', flat=True))
+        users.update(credit_score=score)
+        invalidate_eligibility(user_ids)
+        return score
+    finally:
+        # Runs on a pool thread, which must not keep a connection open
+        connection.close()
+
+
+inline_pool = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'CREDIT_SCORE_INLINE_WORKERS', 4),
+    thread_name_prefix='inline-score'
+)
+inline_flights = {}
+inline_flights_lock = threading.Lock()
+
+
+def inline_credit_score(aadhar_id):
+    """Compute a missing credit score during the request, or return None.
+
+    The score is computed on a pool thread within
+    CREDIT_SCORE_INLINE_BUDGET_MS; concurrent callers for the same customer
+    share one computation. If the budget runs out, the computation is awaited
+    for up to CREDIT_SCORE_TASK_WAIT_SECONDS more. A calculate_credit_score
+    task is only queued when the inline computation never started or failed.
+    """
+    with inline_flights_lock:
+        future = inline_flights.get(aadhar_id)
+        if future is None:
+            future = inline_pool.submit(compute_and_save_score, aadhar_id)
+            inline_flights[aadhar_id] = future
+            future.add_done_callback(lambda _: inline_flights.pop(aadhar_id, None))
+    
+    task_wait = getattr(settings, 'CREDIT_SCORE_TASK_WAIT_SECONDS', 2)
+    try:
+        return future.result(timeout=getattr(settings, 'CREDIT_SCORE_INLINE_BUDGET_MS', 200) / 1000)
+    except TimeoutError:
+        # Once running, the computation saves the score itself; queueing a
+        # task as well would compute it twice
+        if not future.cancel():
+            try:
+                return future.result(timeout=task_wait)
+            except TimeoutError:
+                return None
+            except Exception:
+                pass
+    except Exception:
+        pass
+    
+    from .tasks import calculate_credit_score
+    try:
+        calculate_credit_score.delay(aadhar_id).get(timeout=task_wait)
+    except Exception:
+        return None
+    return User.objects.filter(aadhar_id=aadhar_id).values_list('credit_score', flat=True).first()
@@ -1,11 +1,23 @@
 from rest_framework import serializers
+from django.contrib.auth.models import UserManager
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.db.models import Q
 from .models import User, Loan, Payment
+from .metrics import timed
 from datetime import datetime
 import uuid
+from base64 import urlsafe_b64decode
 from decimal import Decimal
 # Change any min_value=0.01 to:
 min_value=Decimal('0.01')
-class UserRegistrationSerializer(serializers.ModelSerializer):
+BULK_REGISTRATION_LIMIT = 5000
+class TimedValidation:
+    # Reports is_valid() time as the "validation" phase of the request
+    def is_valid(self, raise_exception=False):
+        with timed('validation'):
+            return super().is_valid(raise_exception=raise_exception)
+
+class UserRegistrationSerializer(TimedValidation, serializers.ModelSerializer):
     aadhar_id = serializers.CharField(max_length=12)
     email_id = serializers.EmailField(source='email')
     
@@ -27,7 +39,64 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         )
         return user
 
-class LoanApplicationSerializer(serializers.Serializer):
+class BulkUserSerializer(serializers.Serializer):
+    # Same fields as UserRegistrationSerializer, without the per-row
+    # uniqueness queries; collisions are checked once for the whole batch
+    aadhar_id = serializers.CharField(max_length=12)
+    username = serializers.CharField(max_length=150, validators=[UnicodeUsernameValidator()])
+    email_id = serializers.EmailField(source='email')
+    annual_income = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+class BulkUserRegistrationSerializer(TimedValidation, serializers.Serializer):
+    users = BulkUserSerializer(many=True, allow_empty=False, max_length=BULK_REGISTRATION_LIMIT)
+    
+    def validate_users(self, users):
+        aadhar_ids = [user['aadhar_id'] for user in users]
+        usernames = [User.normalize_username(user['username']) for user in users]
+        taken = User.objects.filter(
+            Q(aadhar_id__in=aadhar_ids) | Q(username__in=usernames)
+        ).values_list('aadhar_id', 'username')
+        taken_aadhar_ids = {aadhar_id for aadhar_id, _ in taken}
+        taken_usernames = {username for _, username in taken}
+        
+        errors = []
+        seen_aadhar_ids, seen_usernames = set(), set()
+        for aadhar_id, username in zip(aadhar_ids, usernames):
+            item_errors = {}
+            if aadhar_id in taken_aadhar_ids or aadhar_id in seen_aadhar_ids:
+                item_errors['aadhar_id'] = ['A user with this aadhar_id already exists.']
+            if username in taken_usernames or username in seen_usernames:
+                item_errors['username'] = ['A user with that username already exists.']
+            seen_aadhar_ids.add(aadhar_id)
+            seen_usernames.add(username)
+            errors.append(item_errors)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return users
+    
+    def create(self, validated_data):
+        users = []
+        for data in validated_data['users']:
+            user = User(
+                username=User.normalize_username(data['username']),
+                email=UserManager.normalize_email(data['email']),
+                aadhar_id=data['aadhar_id'],
+                annual_income=data['annual_income']
+            )
+            # Nobody logs in with these accounts; skip the PBKDF2 hash
+            user.set_unusable_password()
+            users.append(user)
+        User.objects.bulk_create(users, batch_size=500)
+        
+        # bulk_create does not return primary keys on every backend
+        ids = dict(User.objects.filter(
+            aadhar_id__in=[user.aadhar_id for user in users]
+        ).values_list('aadhar_id', 'id'))
+        for user in users:
+            user.id = ids[user.aadhar_id]
+        return users
+
+class LoanApplicationSerializer(TimedValidation, serializers.Serializer):
     unique_user_id = serializers.UUIDField()
     loan_type = serializers.CharField()
     loan_amount = serializers.DecimalField(max_digits=12, decimal_places=2)
@@ -40,9 +109,23 @@ class LoanApplicationSerializer(serializers.Serializer):
             raise serializers.ValidationError("Disbursement date cannot be in the past")
         return value
 
-class PaymentSerializer(serializers.Serializer):
+class PaymentSerializer(TimedValidation, serializers.Serializer):
+    loan_id = serializers.UUIDField()
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=Decimal('0.01'))
+
+class StatementSerializer(TimedValidation, serializers.Serializer):
     loan_id = serializers.UUIDField()
-    amount = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=0.01)
+    # Keyset pagination of past_transactions; omit both to get every payment
+    cursor = serializers.CharField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, required=False)
+    
+    def validate_cursor(self, value):
+        try:
+            payment_date, payment_id = urlsafe_b64decode(value.encode()).decode().split('|')
+            return datetime.strptime(payment_date, '%Y-%m-%d').date(), int(payment_id)
+        except (ValueError, UnicodeDecodeError):
+            raise serializers.ValidationError("Invalid cursor")
 
-class StatementSerializer(serializers.Serializer):
-    loan_id = serializers.UUIDField()
\ No newline at end of file
+class StatementExportSerializer(TimedValidation, serializers.Serializer):
+    loan_id = serializers.UUIDField()
+    output = serializers.ChoiceField(choices=['ndjson', 'csv'], default='ndjson')
\ No newline at end of file
@@ -0,0 +1,72 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+import zlib
+
+# Models stored on the transaction shards, next to each customer's rows
+SHARDED_MODELS = ('transaction', 'customerbalance')
+# Also migrated on the shards: the importer checkpoints each shard's progress
+# in the same database transaction as its rows
+SHARD_LOCAL_MODELS = SHARDED_MODELS + ('importcheckpoint',)
+
+# Runs one query per shard in parallel. Each thread holds a connection to
+# every shard it has served, so size it to the connection budget.
+shard_pool = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'SHARD_POOL_SIZE', 8),
+    thread_name_prefix='shard'
+)
+
+
+def shard_aliases():
+    """Database aliases holding Transaction rows; just the default database when unsharded."""
+    return tuple(getattr(settings, 'TRANSACTION_SHARDS', ())) or (DEFAULT_DB_ALIAS,)
+
+
+def shard_for(aadhar_id):
+    # crc32 rather than hash(): the same customer must map to the same shard
+    # in every process. Changing TRANSACTION_SHARDS moves customers, so the
+    # list can only change together with a move of their rows.
+    aliases = shard_aliases()
+    return aliases[zlib.crc32(str(aadhar_id).encode()) % len(aliases)]
+
+
+def group_by_shard(items, key=lambda item: item):
+    """Split ``items`` into ``{alias: [items on that shard]}``, keeping their order."""
+    groups = {}
+    for item in items:
+        groups.setdefault(shard_for(key(item)), []).append(item)
+    return groups
+
+
+def call_on_shard(func, *args):
+    try:
+        return func(*args)
+    finally:
+        # Honour CONN_MAX_AGE on the pool threads, as async_db does
+        close_old_connections()
+
+
+def fan_out(func, jobs):
+    """Return ``{alias: func(alias, job)}`` for every ``alias: job`` in ``jobs``, in parallel.
+
+    A single shard, or a shard with a transaction open on this thread, runs
+    here instead: a pool thread's connection could not see that
+    transaction's rows.
+    """
+    if len(jobs) <= 1 or any(connections[alias].in_atomic_block for alias in jobs):
+        return {alias: func(alias, job) for alias, job in jobs.items()}
+    futures = {alias: shard_pool.submit(call_on_shard, func, alias, job) for alias, job in jobs.items()}
+    return {alias: future.result() for alias, future in futures.items()}
+
+
+def fan_out_all(func):
+    """Return ``{alias: func(alias)}`` for every shard, in parallel."""
+    return fan_out(lambda alias, job: func(alias), dict.fromkeys(shard_aliases()))
+
+
+def shard_objects(model, alias):
+    """Queryset for reading ``model`` rows stored on shard ``alias``."""
+    if not getattr(settings, 'TRANSACTION_SHARDS', ()):
+        # Unsharded, reads are left to the routers, which may pick a replica
+        return model.objects.all()
+    return model.objects.using(alias)
@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+import uuid
+from .models import Loan
+from .routers import pin_to_primary
+
+
+def statement_cache():
+    # Must be shared by every process that writes payments or billing cycles;
+    # see checks.SHARED_CACHES
+    return caches[getattr(settings, 'STATEMENT_CACHE_ALIAS', 'default')]
+
+
+def version_key(loan_id):
+    return f'statement:version:{loan_id}'
+
+
+def statement_version(loan_id):
+    """Return the loan's current statement version, creating one if needed.
+
+    Versions are random tokens rather than counters, so a version that was
+    evicted from the cache can never come back and validate an old ETag.
+    They expire after STATEMENT_VERSION_TTL seconds, which bounds how long a
+    missed invalidation can go on serving an old statement. Raises
+    ``Loan.DoesNotExist`` for unknown loans, so probing ids creates no keys.
+    """
+    cache = statement_cache()
+    key = version_key(loan_id)
+    version = cache.get(key)
+    if version is None:
+        if not Loan.objects.filter(id=loan_id).exists():
+            raise Loan.DoesNotExist(f'Loan {loan_id} does not exist')
+        cache.add(key, uuid.uuid4().hex, timeout=getattr(settings, 'STATEMENT_VERSION_TTL', 300))
+        version = cache.get(key)
+    return version
+
+
+def statement_etag(version):
+    return f'"{version}"'
+
+
+def get_cached_statement(loan_id, version, variant=''):
+    return statement_cache().get(f'statement:{loan_id}:{version}:{variant}')
+
+
+def cache_statement(loan_id, version, data, variant=''):
+    statement_cache().set(f'statement:{loan_id}:{version}:{variant}', data)
+
+
+def loan_pin(loan_id):
+    return f'loan:{loan_id}'
+
+
+def invalidate_statements(loan_ids):
+    """Drop the statement versions of ``loan_ids`` once the current transaction commits.
+
+    Call this from every code path that writes a Payment or BillingCycle. The
+    loans are also pinned to the primary database, so the next statement is
+    not built (and cached under the new version) from a lagging replica.
+    """
+    loan_ids = set(loan_ids)
+    keys = [version_key(loan_id) for loan_id in loan_ids]
+    if keys:
+        transaction.on_commit(lambda: statement_cache().delete_many(keys))
+        pin_to_primary(loan_pin(loan_id) for loan_id in loan_ids)
@@ -1,41 +1,126 @@
 from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
 from django.db import transaction
-from .models import User, Transaction
+from django.db.models import F
+from .models import User, CreditScoreCounter, CustomerBalance, PendingCreditScore
+from .scoring import score_customers, score_from_balance, rescore_population
+from .sharding import shard_for, shard_objects
 from decimal import Decimal
+import logging
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SCHEDULED_KEY = 'credit-score:flush-scheduled'
+COUNTERS = ('requests', 'computations', 'flushes')
 
 @shared_task
 def calculate_credit_score(aadhar_id):
     try:
         with transaction.atomic():
-            # Get all transactions for this user
-            transactions = Transaction.objects.filter(aadhar_id=aadhar_id)
-            
-            total_balance = Decimal('0')
-            
-            for txn in transactions:
-                if txn.transaction_type == 'CREDIT':
-                    total_balance += txn.amount
-                else:
-                    total_balance -= txn.amount
-            
-            # Calculate credit score based on rules
-            if total_balance >= Decimal('1000000'):
-                credit_score = 900
-            elif total_balance <= Decimal('10000'):
-                credit_score = 300
-            else:
-                # Calculate based on 10 points per Rs. 15,000
-                difference = total_balance - Decimal('10000')
-                points = (difference / Decimal('15000')) * 10
-                credit_score = 300 + int(points)
-                credit_score = min(credit_score, 900)  # Cap at 900
+            # Read the maintained running balance instead of scanning history
+            balance = shard_objects(CustomerBalance, shard_for(aadhar_id)).filter(aadhar_id=aadhar_id).first()
+            total_balance = balance.net_balance if balance else Decimal('0')
+            credit_score = score_from_balance(total_balance)
             
             # Update user's credit score
             user = User.objects.get(aadhar_id=aadhar_id)
             user.credit_score = credit_score
-            user.save()
+            user.save(update_fields=['credit_score'])
             
             return True
     except Exception as e:
         # Log error
-        return False
\ No newline at end of file
+        return False
+
+@shared_task
+def rescore_all(chunk_size=1000):
+    # Celery worker processes are daemonic and cannot fork a pool of their own
+    summary = rescore_population(chunk_size=chunk_size)
+    return {
+        'users': summary['users'],
+        'changed': summary['changed'],
+        'seconds': summary['seconds'],
+    }
+
+
+def count(**amounts):
+    # One UPDATE of the shared counter row, e.g. count(computations=10, flushes=1)
+    increments = {name: F(name) + amount for name, amount in amounts.items()}
+    if not CreditScoreCounter.objects.filter(pk=1).update(**increments):
+        CreditScoreCounter.objects.get_or_create(pk=1)
+        CreditScoreCounter.objects.filter(pk=1).update(**increments)
+
+
+def score_counters():
+    """Requests received, scores actually computed, and flushes run so far, across all processes."""
+    counters = CreditScoreCounter.objects.filter(pk=1).values(*COUNTERS).first() or dict.fromkeys(COUNTERS, 0)
+    counters['coalesced'] = max(counters['requests'] - counters['computations'], 0)
+    return counters
+
+
+def request_credit_scores(aadhar_ids, schedule=True):
+    """Ask for the given customers to be rescored by the next coalesced flush.
+
+    Repeated requests for a customer within CREDIT_SCORE_COALESCE_SECONDS
+    collapse into one pending row, and the flush scores the pending
+    customers in batches. With ``schedule=False`` the caller must call
+    ``schedule_flush`` itself once the rows are committed.
+    """
+    aadhar_ids = list(aadhar_ids)
+    if not aadhar_ids:
+        return
+    # Counted once committed, outside the caller's transaction
+    requested = len(aadhar_ids)
+    transaction.on_commit(lambda: count(requests=requested))
+    PendingCreditScore.objects.bulk_create(
+        [PendingCreditScore(aadhar_id=aadhar_id) for aadhar_id in set(aadhar_ids)],
+        batch_size=1000,
+        ignore_conflicts=True
+    )
+    if schedule:
+        transaction.on_commit(schedule_flush)
+
+
+def schedule_flush():
+    # Only the first request in a window schedules the flush
+    window = getattr(settings, 'CREDIT_SCORE_COALESCE_SECONDS', 5)
+    if cache.add(FLUSH_SCHEDULED_KEY, True, timeout=window):
+        try:
+            flush_credit_scores.apply_async(countdown=window)
+        except Exception:
+            # The pending rows are committed; let the next request retry
+            cache.delete(FLUSH_SCHEDULED_KEY)
+            logger.exception('Could not schedule flush_credit_scores')
+
+
+@shared_task
+def flush_credit_scores(batch_size=None):
+    # Requests arriving from here on schedule the next flush
+    cache.delete(FLUSH_SCHEDULED_KEY)
+    batch_size = batch_size or getattr(settings, 'CREDIT_SCORE_BATCH_SIZE', 500)
+    scored = 0
+    while True:
+        with transaction.atomic():
+            aadhar_ids = list(
+                PendingCreditScore.objects.select_for_update(skip_locked=True)
+                .order_by('requested_at')
+                .values_list('aadhar_id', flat=True)[:batch_size]
+            )
+            PendingCreditScore.objects.filter(aadhar_id__in=aadhar_ids).delete()
+        if not aadhar_ids:
+            break
+        
+        # Balances are read after the rows are released, so a request made
+        # while this batch is scored gets a pending row of its own
+        try:
+            computed = score_customers(aadhar_ids)
+        except Exception:
+            PendingCreditScore.objects.bulk_create(
+                [PendingCreditScore(aadhar_id=aadhar_id) for aadhar_id in aadhar_ids],
+                ignore_conflicts=True
+            )
+            raise
+        count(computations=computed, flushes=1)
+        scored += computed
+    return scored
@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from datetime import date, timedelta
+from decimal import Decimal
+from ..eligibility import local_verdicts
+from ..idempotency import local_store
+from ..models import User, Loan, BillingCycle, Payment, Transaction
+from ..sharding import shard_aliases, shard_for, shard_objects
+
+# The default database and the configured transaction shards, for test cases
+# that read or write transactions and balances
+ALL_DATABASES = {DEFAULT_DB_ALIAS, *shard_aliases()}
+
+
+def clear_caches():
+    for alias in settings.CACHES:
+        caches[alias].clear()
+    local_verdicts.entries.clear()
+    local_store.entries.clear()
+
+
+def customer_rows(model, aadhar_id):
+    # A customer's Transaction or CustomerBalance rows, on their shard
+    return shard_objects(model, shard_for(aadhar_id)).filter(aadhar_id=aadhar_id)
+
+
+def all_shard_rows(model):
+    return [row for alias in shard_aliases() for row in shard_objects(model, alias)]
+
+
+def make_user(n, credit_score=900, annual_income=Decimal('500000')):
+    return User.objects.create(
+        username=f'user-{n}',
+        aadhar_id=f'{n:012d}',
+        annual_income=annual_income,
+        credit_score=credit_score
+    )
+
+
+def make_users(count, start=0):
+    User.objects.bulk_create([User(
+        username=f'user-{n}',
+        aadhar_id=f'{n:012d}',
+        annual_income=Decimal('500000'),
+        credit_score=900
+    ) for n in range(start, start + count)])
+    # bulk_create doesn't set primary keys on SQLite
+    return list(User.objects.filter(
+        username__in=[f'user-{n}' for n in range(start, start + count)]
+    ).order_by('id'))
+
+
+def make_transactions(aadhar_id, count, amount=Decimal('50000')):
+    rows = [Transaction(
+        aadhar_id=aadhar_id,
+        date=date.today() - timedelta(days=n),
+        amount=amount,
+        transaction_type='CREDIT' if n % 3 else 'DEBIT'
+    ) for n in range(count)]
+    Transaction.objects.insert_batch(rows)
+
+
+def make_loan(user, cycles=0, paid=0, next_billing_date=None):
+    """A loan with ``cycles`` billing cycles, the first ``paid`` of them paid."""
+    start = date.today() - timedelta(days=30 * (cycles + 1))
+    loan = Loan.objects.create(
+        user=user,
+        loan_type='CREDIT_CARD',
+        loan_amount=Decimal('5000.00'),
+        principal_balance=Decimal('5000.00'),
+        interest_rate=Decimal('14'),
+        term_period=12,
+        disbursement_date=start,
+        next_billing_date=next_billing_date or date.today() + timedelta(days=30)
+    )
+    BillingCycle.objects.bulk_create([BillingCycle(
+        loan=loan,
+        billing_date=start + timedelta(days=30 * (n + 1)),
+        due_date=start + timedelta(days=30 * (n + 1) + 15),
+        min_due=Decimal('100.00'),
+        principal_portion=Decimal('60.00'),
+        interest_portion=Decimal('40.00'),
+        is_paid=n < paid
+    ) for n in range(cycles)])
+    Payment.objects.bulk_create([
+        Payment(billing_cycle=cycle, amount=Decimal('100.00'))
+        for cycle in BillingCycle.objects.filter(loan=loan, is_paid=True)
+    ])
+    return loan
@@ -0,0 +1,91 @@
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, TransactionTestCase
+from unittest import mock
+import uuid
+from ..models import PendingCreditScore, User
+from ..tasks import schedule_flush
+from .fixtures import clear_caches, make_loan, make_user
+
+
+class AsyncViewTestCase(TransactionTestCase):
+    # The async views query on pool threads with their own connections, so
+    # the rows they read must be committed
+    def setUp(self):
+        clear_caches()
+        self.async_client = AsyncClient()
+
+    def async_request(self, method, path, data=None, **headers):
+        # AsyncClient on this Django version sends extra keyword arguments as
+        # headers under their literal names (not HTTP_*), and only reads the
+        # query string from the path
+        async def send():
+            return await getattr(self.async_client, method)(path, data, content_type='application/json', **headers)
+        return async_to_sync(send)()
+
+
+class AsyncStatementTests(AsyncViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.loan = make_loan(make_user(1), cycles=3, paid=1)
+
+    def get_both(self, query, etag=None):
+        sync = self.client.get(f'/api/get-statement/?{query}', **({'HTTP_IF_NONE_MATCH': etag} if etag else {}))
+        headers = {'If-None-Match': etag} if etag else {}
+        return sync, self.async_request('get', f'/api/async/get-statement/?{query}', **headers)
+
+    def test_statement_and_etag_match_the_sync_view(self):
+        sync, async_ = self.get_both(f'loan_id={self.loan.id}')
+        self.assertEqual((sync.status_code, async_.status_code), (200, 200))
+        self.assertEqual(async_.json(), sync.json())
+        self.assertEqual(async_['ETag'], sync['ETag'])
+
+        sync, async_ = self.get_both(f'loan_id={self.loan.id}', etag=sync['ETag'])
+        self.assertEqual((sync.status_code, async_.status_code), (304, 304))
+        self.assertEqual(async_['ETag'], sync['ETag'])
+        self.assertEqual(async_.content, b'')
+
+    def test_errors_match_the_sync_view(self):
+        for query in (f'loan_id={uuid.uuid4()}', 'loan_id=not-a-uuid', ''):
+            with self.subTest(query=query):
+                sync, async_ = self.get_both(query)
+                self.assertEqual((sync.status_code, async_.status_code), (400, 400))
+                self.assertEqual(async_.json(), sync.json())
+
+
+class AsyncRegistrationTests(AsyncViewTestCase):
+    def payload(self, n):
+        return {
+            'aadhar_id': f'{n:012d}',
+            'username': f'async-{n}',
+            'email_id': f'async-{n}@example.com',
+            'annual_income': '500000'
+        }
+
+    def test_registers_user_and_publishes_the_flush(self):
+        with mock.patch('credit_app.views.publish') as publish:
+            response = self.async_request('post', '/api/async/register-user/', self.payload(1))
+        self.assertEqual(response.status_code, 200)
+        user = User.objects.get(username='async-1')
+        self.assertEqual(response.json(), {'error': None, 'unique_user_id': user.id})
+        self.assertTrue(PendingCreditScore.objects.filter(aadhar_id=user.aadhar_id).exists())
+        publish.assert_called_once_with(schedule_flush)
+
+    def test_errors_match_the_sync_view(self):
+        with mock.patch('credit_app.views.publish'), mock.patch('credit_app.tasks.schedule_flush'):
+            self.client.post('/api/register-user/', self.payload(1), content_type='application/json')
+            invalid = dict(self.payload(2), email_id='not-an-email', annual_income='')
+            for payload in (self.payload(1), invalid):
+                with self.subTest(payload=payload):
+                    sync = self.client.post('/api/register-user/', payload, content_type='application/json')
+                    async_ = self.async_request('post', '/api/async/register-user/', payload)
+                    self.assertEqual((sync.status_code, async_.status_code), (400, 400))
+                    self.assertEqual(async_.json(), sync.json())
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_rejects_other_methods_and_malformed_json(self):
+        response = self.async_request('get', '/api/async/register-user/')
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response.json(), {'error': 'Method "GET" not allowed.'})
+        response = self.async_request('post', '/api/async/register-user/', 'not json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Request body must be JSON'})
@@ -0,0 +1,134 @@
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError
+from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+import uuid
+from ..billing import LeaseLost, bill_chunk
+from ..models import BillingCycle, BillingRun, Loan
+from .fixtures import clear_caches, make_loan, make_user
+
+
+class BillingRunTests(TestCase):
+    def setUp(self):
+        self.today = date.today()
+        self.loan = make_loan(make_user(1), next_billing_date=self.today)
+
+    def bill(self, *args):
+        call_command('process_billing', *args, stdout=StringIO())
+
+    def test_stale_loans_are_not_billed_twice(self):
+        # Read before another process bills the loan
+        stale = list(Loan.objects.filter(pk=self.loan.pk))
+        self.bill()
+        cycles, errors = bill_chunk(stale, self.today)
+        self.assertEqual((cycles, errors), ([], {}))
+        self.assertEqual(BillingCycle.objects.filter(loan=self.loan).count(), 1)
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.next_billing_date, self.today + timedelta(days=30))
+
+    def test_per_loan_mode_after_batch_bills_nothing(self):
+        self.bill('--batch')
+        self.bill()
+        self.assertEqual(BillingCycle.objects.filter(loan=self.loan).count(), 1)
+
+    def test_date_keeps_its_shard_count(self):
+        self.bill('--shard', '0/2')
+        with self.assertRaisesMessage(CommandError, 'finish it with --shard N/2'):
+            self.bill('--shard', '0/4')
+        with self.assertRaisesMessage(CommandError, 'finish it with --shard N/2'):
+            self.bill('--batch')
+        self.bill('--shard', '1/2')
+        self.assertEqual(BillingRun.objects.filter(billing_date=self.today, status='COMPLETED').count(), 2)
+        self.assertEqual(BillingCycle.objects.filter(loan=self.loan).count(), 1)
+
+    def test_backfill_after_completed_regular_run(self):
+        self.bill('--batch')
+        # Missed by the outage, noticed after the day's regular run finished
+        missed = make_loan(make_user(2), next_billing_date=self.today - timedelta(days=60))
+        self.bill('--backfill')
+        self.assertEqual(
+            list(BillingCycle.objects.filter(loan=missed).order_by('billing_date').values_list('billing_date', flat=True)),
+            [self.today - timedelta(days=60), self.today - timedelta(days=30), self.today]
+        )
+        self.assertEqual(BillingCycle.objects.filter(loan=self.loan).count(), 1)
+        self.assertEqual(
+            set(BillingRun.objects.filter(billing_date=self.today, status='COMPLETED').values_list('mode', flat=True)),
+            {'BILLING', 'BACKFILL'}
+        )
+        with self.assertRaisesMessage(CommandError, 'finish it with --shard N/1 --backfill'):
+            self.bill('--backfill', '--shard', '0/2')
+
+    def test_failed_bulk_insert_is_logged_and_retried_per_loan(self):
+        bulk_create = BillingCycle.objects.bulk_create
+        calls = []
+
+        def fail_first(cycles, *args, **kwargs):
+            calls.append(cycles)
+            if len(calls) == 1:
+                raise DatabaseError('connection lost')
+            return bulk_create(cycles, *args, **kwargs)
+
+        with mock.patch.object(BillingCycle.objects, 'bulk_create', side_effect=fail_first), \
+                self.assertLogs('credit_app.billing', 'ERROR') as logs:
+            cycles, errors = bill_chunk(list(Loan.objects.all()), self.today)
+        self.assertIn('connection lost', logs.output[0])
+        self.assertEqual((len(cycles), errors), (1, {}))
+        self.assertEqual(BillingCycle.objects.filter(loan=self.loan).count(), 1)
+
+    def test_lost_lease_is_a_command_error(self):
+        with mock.patch('credit_app.billing.RunCheckpoint.save', side_effect=LeaseLost('Lease taken over')):
+            with self.assertRaisesMessage(CommandError, 'Lease taken over'):
+                self.bill('--batch')
+        self.assertFalse(BillingCycle.objects.filter(loan=self.loan).exists())
+
+
+class BillingAmountTests(TestCase):
+    def apply_loan(self, user):
+        response = self.client.post('/api/apply-loan/', {
+            'unique_user_id': str(uuid.UUID(int=user.id)),
+            'loan_type': 'CREDIT_CARD',
+            'loan_amount': '5000',
+            'interest_rate': '14',
+            'term_period': 6,
+            'disbursement_date': date.today().isoformat()
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return Loan.objects.get(id=response.json()['loan_id'])
+
+    def test_cycle_is_built_from_the_stored_installment(self):
+        clear_caches()
+        loan = self.apply_loan(make_user(1))
+        first = loan.installments.get(number=1)
+        call_command('process_billing', '--batch', '--until', first.due_date.isoformat(), stdout=StringIO())
+
+        cycle = BillingCycle.objects.get(loan=loan)
+        self.assertEqual(cycle.billing_date, first.due_date)
+        self.assertEqual(cycle.due_date, first.due_date + timedelta(days=15))
+        self.assertEqual(cycle.min_due, first.amount_due)
+        self.assertEqual(cycle.principal_portion, first.principal)
+        self.assertEqual(cycle.interest_portion, first.interest)
+        self.assertEqual(list(loan.installments.filter(is_billed=True)), [first])
+
+    def test_backfill_bills_each_missed_installment(self):
+        clear_caches()
+        loan = self.apply_loan(make_user(1))
+        until = date.today() + timedelta(days=95)
+        call_command('process_billing', '--backfill', '--until', until.isoformat(), stdout=StringIO())
+        self.assertEqual(
+            list(BillingCycle.objects.filter(loan=loan).order_by('billing_date').values_list('min_due', flat=True)),
+            list(loan.installments.order_by('number').values_list('amount_due', flat=True)[:3])
+        )
+        self.assertEqual(loan.installments.filter(is_billed=False).count(), 3)
+
+    def test_loan_without_schedule_accrues_interest(self):
+        loan = make_loan(make_user(1), next_billing_date=date.today())
+        call_command('process_billing', stdout=StringIO())
+        cycle = BillingCycle.objects.get(loan=loan)
+        # 3% of 5000, plus 30 days at round(14 / 365, 3)% a day
+        self.assertEqual(cycle.principal_portion, Decimal('150.00'))
+        self.assertEqual(cycle.interest_portion, Decimal('57.00'))
+        self.assertEqual(cycle.min_due, Decimal('207.00'))
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+import shutil
+import tempfile
+from ..eligibility import eligibility_verdict, invalidate_eligibility, local_verdicts, verdict_key
+from .fixtures import clear_caches, make_user
+
+
+class EligibilityCacheTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.user = make_user(1)
+
+    def test_process_local_cache_is_not_a_shared_tier(self):
+        self.assertIsNone(eligibility_verdict(self.user.id).error)
+        self.assertIsNone(caches['eligibility'].get(verdict_key(self.user.id)))
+        with self.assertNumQueries(0):
+            eligibility_verdict(self.user.id)
+
+    def test_shared_cache_serves_other_processes(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        shared = dict(settings.CACHES, eligibility={
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': location,
+        })
+        with override_settings(CACHES=shared):
+            eligibility_verdict(self.user.id)
+            # Another process starts with an empty local tier
+            local_verdicts.entries.clear()
+            with self.assertNumQueries(0):
+                self.assertIsNone(eligibility_verdict(self.user.id).error)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.credit_score = 300
+                self.user.save(update_fields=['credit_score'])
+                invalidate_eligibility([self.user.id])
+            self.assertEqual(eligibility_verdict(self.user.id).error, 'Credit score too low')
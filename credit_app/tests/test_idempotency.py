@@ -0,0 +1,80 @@
+from django.db import DatabaseError
+from django.db.models import QuerySet
+from django.test import TestCase
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+import uuid
+from ..models import IdempotencyKey, Loan, Payment
+from .fixtures import clear_caches, make_loan, make_user
+
+
+class IdempotentReplayTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.user = make_user(1)
+
+    def post(self, path, data, key):
+        return self.client.post(path, data, content_type='application/json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_repeated_payment_is_applied_once(self):
+        loan = make_loan(self.user, cycles=1)
+        body = {'loan_id': str(loan.id), 'amount': '600.00'}
+        first = self.post('/api/make-payment/', body, 'pay-1')
+        clear_caches()  # replay from the stored row, as another process would
+        again = self.post('/api/make-payment/', body, 'pay-1')
+        self.assertEqual((first.status_code, again.status_code), (200, 200))
+        self.assertEqual(again['Idempotent-Replayed'], 'true')
+        self.assertEqual(again.json(), first.json())
+        self.assertEqual(Payment.objects.filter(billing_cycle__loan=loan).count(), 1)
+        loan.refresh_from_db()
+        self.assertEqual(loan.principal_balance, Decimal('4500.00'))
+
+        reused = self.post('/api/make-payment/', dict(body, amount='700.00'), 'pay-1')
+        self.assertEqual(reused.status_code, 422)
+
+    def test_repeated_loan_application_creates_one_loan(self):
+        body = {
+            'unique_user_id': str(uuid.UUID(int=self.user.id)),
+            'loan_type': 'CREDIT_CARD',
+            'loan_amount': '5000',
+            'interest_rate': '14',
+            'term_period': 6,
+            'disbursement_date': date.today().isoformat()
+        }
+        first = self.post('/api/apply-loan/', body, 'apply-1')
+        again = self.post('/api/apply-loan/', body, 'apply-1')
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again['Idempotent-Replayed'], 'true')
+        self.assertEqual(again.json()['loan_id'], first.json()['loan_id'])
+        self.assertEqual(Loan.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(IdempotencyKey.objects.get(key='apply-1').status, 'DONE')
+
+    def test_failed_request_releases_the_key(self):
+        body = {'loan_id': str(uuid.uuid4()), 'amount': '100.00'}
+        self.assertEqual(self.post('/api/make-payment/', body, 'pay-2').status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.filter(key='pay-2').exists())
+        response = self.post('/api/make-payment/', body, 'pay-2')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+
+    def test_failed_done_write_rolls_back_the_payment(self):
+        loan = make_loan(self.user, cycles=1)
+        body = {'loan_id': str(loan.id), 'amount': '600.00'}
+        update = QuerySet.update
+
+        def lose_connection(queryset, **kwargs):
+            if queryset.model is IdempotencyKey:
+                raise DatabaseError('connection lost')
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=lose_connection):
+            self.assertEqual(self.post('/api/make-payment/', body, 'pay-3').status_code, 400)
+        self.assertFalse(Payment.objects.filter(billing_cycle__loan=loan).exists())
+        self.assertFalse(IdempotencyKey.objects.filter(key='pay-3').exists())
+
+        self.assertEqual(self.post('/api/make-payment/', body, 'pay-3').status_code, 200)
+        self.assertEqual(self.post('/api/make-payment/', body, 'pay-3')['Idempotent-Replayed'], 'true')
+        self.assertEqual(Payment.objects.filter(billing_cycle__loan=loan).count(), 1)
+        loan.refresh_from_db()
+        self.assertEqual(loan.principal_balance, Decimal('4500.00'))
@@ -0,0 +1,93 @@
+from django.core.management import call_command
+from django.test import TestCase
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+import os
+import tempfile
+from ..models import CustomerBalance, ImportCheckpoint, Transaction
+from .fixtures import ALL_DATABASES, all_shard_rows, customer_rows
+
+ROWS = [
+    ('000000000001', '2025-01-01', '5000', 'CREDIT'),
+    ('000000000002', '2025-01-02', '700', 'CREDIT'),
+    ('000000000001', '2025-01-03', '1200', 'DEBIT'),
+    ('000000000003', '2025-01-04', '900', 'CREDIT'),
+    ('000000000002', '2025-01-05', '100', 'DEBIT'),
+    ('000000000003', '2025-01-06', '300', 'DEBIT'),
+    ('000000000001', '2025-01-07', '50', 'CREDIT'),
+]
+
+
+class ImportTransactionsTests(TestCase):
+    databases = ALL_DATABASES
+
+    def setUp(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as feed:
+            feed.write('aadhar_id,date,amount,transaction_type\n')
+            for row in ROWS[:3]:
+                feed.write(','.join(row) + '\n')
+            feed.write('000000000009,not-a-date,10,CREDIT\n')
+            for row in ROWS[3:]:
+                feed.write(','.join(row) + '\n')
+        self.path = feed.name
+        self.addCleanup(os.unlink, self.path)
+
+    def run_import(self, *args):
+        out = StringIO()
+        call_command('import_transactions', self.path, '--batch-size', '2', '--skip-scoring', *args, stdout=out)
+        return out.getvalue()
+
+    def assert_imported_once(self):
+        self.assertEqual(
+            sorted((row.aadhar_id, row.amount) for row in all_shard_rows(Transaction)),
+            sorted((aadhar_id, Decimal(amount)) for aadhar_id, _, amount, _ in ROWS)
+        )
+        balance = customer_rows(CustomerBalance, '000000000001').get()
+        self.assertEqual(balance.net_balance, Decimal('3850'))
+        self.assertEqual(balance.last_transaction_id, customer_rows(Transaction, '000000000001').latest('id').id)
+        call_command('rebuild_ledger', '--verify', stdout=StringIO())
+
+    def test_imports_valid_rows_and_skips_invalid(self):
+        output = self.run_import()
+        self.assertIn('Imported 7 transactions', output)
+        self.assertIn('skipped 1 invalid lines', output)
+        self.assert_imported_once()
+        # One checkpoint per shard that received rows
+        checkpoints = all_shard_rows(ImportCheckpoint)
+        self.assertEqual(sum(checkpoint.rows_imported for checkpoint in checkpoints), 7)
+        self.assertEqual({checkpoint.position for checkpoint in checkpoints}, {os.path.getsize(self.path)})
+
+    def test_rerun_imports_nothing(self):
+        self.run_import()
+        self.assertIn('Imported 0 transactions', self.run_import())
+        self.assert_imported_once()
+
+    def test_resumes_after_failed_batch(self):
+        apply_transactions = CustomerBalance.objects.apply_transactions
+        calls = []
+
+        def fail_third_batch(rows):
+            calls.append(rows)
+            if len(calls) == 3:
+                raise RuntimeError('connection lost')
+            apply_transactions(rows)
+
+        with mock.patch.object(CustomerBalance.objects, 'apply_transactions', side_effect=fail_third_batch):
+            with self.assertRaises(RuntimeError):
+                self.run_import()
+        # The failed batch rolled back together with its checkpoint
+        imported = len(all_shard_rows(Transaction))
+        self.assertLess(imported, 7)
+        self.assertEqual(sum(checkpoint.rows_imported for checkpoint in all_shard_rows(ImportCheckpoint)), imported)
+
+        # A different batch size on resume must not re-import or skip lines
+        out = StringIO()
+        call_command('import_transactions', self.path, '--batch-size', '5', '--skip-scoring', stdout=out)
+        self.assertIn(f'Imported {7 - imported} transactions', out.getvalue())
+        self.assert_imported_once()
+
+    def test_restart_ignores_checkpoints(self):
+        self.run_import()
+        self.assertIn('Imported 7 transactions', self.run_import('--restart'))
+        self.assertEqual(len(all_shard_rows(Transaction)), 14)
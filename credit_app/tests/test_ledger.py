@@ -0,0 +1,45 @@
+from django.core.management import call_command
+from django.test import TestCase
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from ..models import CustomerBalance, Transaction
+from .fixtures import ALL_DATABASES, all_shard_rows, customer_rows, make_transactions
+
+
+def transaction_row(aadhar_id, amount, transaction_type='CREDIT'):
+    return Transaction(aadhar_id=aadhar_id, date=date(2025, 1, 1), amount=Decimal(amount),
+                       transaction_type=transaction_type)
+
+
+class LedgerTests(TestCase):
+    databases = ALL_DATABASES
+
+    def test_save_and_insert_batch_update_balances(self):
+        make_transactions('000000000001', 6, amount=Decimal('100'))
+        transaction_row('000000000001', '25', 'DEBIT').save()
+        balance = customer_rows(CustomerBalance, '000000000001').get()
+        # Every third fixture row is a debit
+        self.assertEqual(balance.credit_total, Decimal('400'))
+        self.assertEqual(balance.debit_total, Decimal('225'))
+        self.assertEqual(balance.last_transaction_id, customer_rows(Transaction, '000000000001').latest('id').id)
+        call_command('rebuild_ledger', '--verify', stdout=StringIO())
+
+    def test_last_transaction_id_never_moves_back(self):
+        older, newer = transaction_row('000000000001', '10'), transaction_row('000000000001', '20')
+        customer_rows(Transaction, '000000000001').bulk_create([older, newer])
+        older, newer = customer_rows(Transaction, '000000000001').order_by('id')
+        # Batches from parallel importers can commit in either order
+        CustomerBalance.objects.apply_transactions([newer])
+        CustomerBalance.objects.apply_transactions([older])
+        balance = customer_rows(CustomerBalance, '000000000001').get()
+        self.assertEqual(balance.last_transaction_id, newer.id)
+        self.assertEqual(balance.credit_total, Decimal('30'))
+
+    def test_batch_spanning_update_chunks(self):
+        rows = [transaction_row(f'{n % 400:012d}', str(n + 1)) for n in range(1200)]
+        Transaction.objects.insert_batch(rows)
+        self.assertEqual(len(all_shard_rows(CustomerBalance)), 400)
+        balance = customer_rows(CustomerBalance, f'{7:012d}').get()
+        self.assertEqual(balance.credit_total, Decimal(8 + 408 + 808))
+        call_command('rebuild_ledger', '--verify', stdout=StringIO())
@@ -0,0 +1,94 @@
+from django.test import TestCase
+from unittest import mock
+import re
+from ..eligibility import eligibility_stats
+from ..metrics import EXPORT_BOUNDS, Histogram, Registry
+from .fixtures import clear_caches, make_loan, make_user
+
+
+class HistogramTests(TestCase):
+    def test_small_values_are_counted_exactly(self):
+        histogram = Histogram(1)
+        for value in range(1, 64):
+            histogram.record(value)
+        self.assertEqual(histogram.cumulative([1, 10, 50, 63, 100]), [
+            (1, 1), (10, 10), (50, 50), (63, 63), (100, 63)
+        ])
+        self.assertEqual(histogram.quantile(0.5), 32)
+
+    def test_quantiles_stay_within_the_bucket_width(self):
+        histogram = Histogram(1000000)
+        for us in range(1, 100001):
+            histogram.record(us / 1000000)
+        for fraction in (0.5, 0.95, 0.99):
+            self.assertAlmostEqual(histogram.quantile(fraction), fraction / 10, delta=fraction / 10 / 32)
+        buckets = histogram.cumulative(EXPORT_BOUNDS)
+        self.assertEqual([count for _, count in buckets], sorted(count for _, count in buckets))
+        self.assertAlmostEqual(dict(buckets)[0.05], 50000, delta=50000 / 32)
+        self.assertEqual(dict(buckets)[0.25], 100000)
+
+    def test_empty_histogram(self):
+        histogram = Histogram(1)
+        self.assertEqual(histogram.quantile(0.99), 0.0)
+        self.assertEqual(histogram.cumulative([1, 10]), [(1, 0), (10, 0)])
+
+
+class PerformanceMetricsTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        registry = Registry()
+        for module in ('credit_app.middleware', 'credit_app.views'):
+            patcher = mock.patch(f'{module}.registry', registry)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.loan = make_loan(make_user(1), cycles=2)
+
+    def metric(self, text, name, **labels):
+        selector = ','.join(f'{key}="{value}"' for key, value in labels.items())
+        match = re.search(rf'^{re.escape(name)}\{{{re.escape(selector)}\}} (\S+)$', text, re.M)
+        self.assertIsNotNone(match, f'{name}{{{selector}}} missing from /metrics/')
+        return float(match.group(1))
+
+    def test_server_timing_header(self):
+        response = self.client.get('/api/get-statement/', {'loan_id': str(self.loan.id)})
+        self.assertEqual(response.status_code, 200)
+        match = re.fullmatch(
+            r'total;dur=([\d.]+), db;dur=([\d.]+);desc="(\d+) queries", validation;dur=([\d.]+)',
+            response['Server-Timing']
+        )
+        self.assertIsNotNone(match, response['Server-Timing'])
+        total, db, queries, validation = match.groups()
+        self.assertGreater(int(queries), 0)
+        self.assertLessEqual(float(db) + float(validation), float(total) + 0.1)
+
+    def test_metrics_after_requests(self):
+        for _ in range(3):
+            self.client.get('/api/get-statement/', {'loan_id': str(self.loan.id)})
+        self.assertEqual(self.client.get('/api/get-statement/').status_code, 400)
+
+        response = self.client.get('/metrics/')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4')
+        self.assertFalse(response.has_header('Server-Timing'))
+        text = response.content.decode()
+
+        self.assertEqual(self.metric(text, 'credit_responses_total', view='get-statement', status='200'), 3)
+        self.assertEqual(self.metric(text, 'credit_responses_total', view='get-statement', status='400'), 1)
+        self.assertNotIn('view="metrics"', text)
+        for name in ('request_duration_seconds', 'db_duration_seconds', 'validation_duration_seconds', 'db_queries'):
+            metric = f'credit_{name}'
+            self.assertIn(f'# TYPE {metric} histogram', text)
+            self.assertEqual(self.metric(text, f'{metric}_count', view='get-statement'), 4)
+            self.assertEqual(self.metric(text, f'{metric}_bucket', view='get-statement', le='+Inf'), 4)
+            self.assertGreaterEqual(self.metric(text, f'{metric}_quantile', view='get-statement', quantile='0.99'), 0)
+
+        buckets = [
+            self.metric(text, 'credit_request_duration_seconds_bucket', view='get-statement', le=f'{bound:g}')
+            for bound in EXPORT_BOUNDS
+        ]
+        self.assertEqual(buckets, sorted(buckets))
+        self.assertEqual(buckets[-1], 4)  # all well under 50s
+        self.assertGreater(self.metric(text, 'credit_request_duration_seconds_sum', view='get-statement'), 0)
+
+        self.assertEqual(self.metric(text, 'credit_score_requests_total', outcome='requests'), 0)
+        for name, value in eligibility_stats().items():
+            self.assertAlmostEqual(self.metric(text, 'credit_eligibility_cache', stat=name), value, places=4)
@@ -0,0 +1,86 @@
+from django.test import SimpleTestCase
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+import json
+import os
+import timeit
+import unittest
+import uuid
+from ..amortization import amortization_schedule, monthly_emi
+from ..billing import build_billing_cycle
+from ..metrics import Histogram
+from ..models import BillingCycle, Loan
+from ..payments import allocate_payment, parse_payment_line
+from ..scoring import score_balances
+
+# Absolute timings depend on the machine, so these only run with
+# RUN_MICROBENCHMARKS=1. Limits live in benchmark_thresholds.json;
+# BENCHMARK_THRESHOLD_SCALE loosens them on slow machines (e.g. 2 doubles
+# every limit)
+THRESHOLDS = json.loads(Path(__file__).with_name('benchmark_thresholds.json').read_text())['thresholds']
+SCALE = float(os.environ.get('BENCHMARK_THRESHOLD_SCALE', '1'))
+
+
+@unittest.skipUnless(os.environ.get('RUN_MICROBENCHMARKS'), 'set RUN_MICROBENCHMARKS=1 to check timing thresholds')
+class MicrobenchmarkTests(SimpleTestCase):
+    def assertFasterThanThreshold(self, name, func, number):
+        seconds = min(timeit.repeat(func, number=number, repeat=5)) / number
+        limit = THRESHOLDS[name] * SCALE
+        self.assertLessEqual(
+            seconds, limit,
+            f'{name} took {seconds * 1e6:.1f}us per call, threshold is {limit * 1e6:.1f}us'
+        )
+
+    def test_score_balances(self):
+        balances = [Decimal(n * 997 % 1200000) for n in range(1000)]
+        self.assertFasterThanThreshold('score_balances_1000', lambda: score_balances(balances), 20)
+
+    def test_monthly_emi(self):
+        self.assertFasterThanThreshold(
+            'monthly_emi', lambda: monthly_emi(Decimal('500000'), Decimal('14'), 360), 1000
+        )
+
+    def test_amortization_schedule(self):
+        # Bypass the cache to time the schedule itself
+        self.assertFasterThanThreshold(
+            'amortization_schedule_360',
+            lambda: amortization_schedule.__wrapped__(Decimal('500000'), Decimal('14'), 360),
+            20
+        )
+        self.assertFasterThanThreshold(
+            'amortization_schedule_cached',
+            lambda: amortization_schedule(Decimal('500000'), Decimal('14'), 360),
+            10000
+        )
+
+    def test_allocate_payment(self):
+        self.assertFasterThanThreshold(
+            'allocate_payment',
+            lambda: allocate_payment(BillingCycle(min_due=Decimal('100'), past_due=Decimal('20')), Decimal('150')),
+            1000
+        )
+
+    def test_build_billing_cycle(self):
+        loan = Loan(
+            loan_amount=Decimal('5000'),
+            principal_balance=Decimal('5000'),
+            interest_rate=Decimal('14'),
+            term_period=12,
+            disbursement_date=date(2024, 1, 1),
+            next_billing_date=date(2024, 1, 31)
+        )
+        self.assertFasterThanThreshold('build_billing_cycle', lambda: build_billing_cycle(loan, date(2024, 3, 1)), 1000)
+
+    def test_parse_payment_line(self):
+        line = json.dumps({'loan_id': str(uuid.uuid4()), 'amount': '100.00'})
+        self.assertFasterThanThreshold('parse_payment_line', lambda: parse_payment_line(line), 200)
+
+    def test_histogram_record(self):
+        histogram = Histogram(1000000)
+        values = [n / 100000 for n in range(1000)]
+
+        def record():
+            for value in values:
+                histogram.record(value)
+        self.assertFasterThanThreshold('histogram_record_1000', record, 20)
@@ -0,0 +1,151 @@
+from django.core.management import call_command
+from django.db import DatabaseError, OperationalError
+from django.test import SimpleTestCase, TestCase
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+import json
+import os
+import tempfile
+from ..models import BillingCycle, Payment
+from ..payments import is_lock_conflict, retry_on_lock_conflict
+from .fixtures import clear_caches, make_loan, make_user
+
+
+def ndjson(*payments):
+    return b'\n'.join(payment if isinstance(payment, bytes) else json.dumps(payment).encode() for payment in payments)
+
+
+class MakePaymentTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.loan = make_loan(make_user(1), cycles=2, paid=1)
+
+    def pay(self, amount):
+        return self.client.post('/api/make-payment/', {
+            'loan_id': str(self.loan.id), 'amount': amount
+        }, content_type='application/json')
+
+    def test_excess_reduces_principal(self):
+        self.assertEqual(self.pay('1100.00').status_code, 200)
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.principal_balance, Decimal('4000.00'))
+        self.assertTrue(self.loan.is_active)
+        self.assertFalse(BillingCycle.objects.filter(loan=self.loan, is_paid=False).exists())
+        self.assertTrue(Payment.objects.filter(billing_cycle__loan=self.loan).latest('id').is_principal_payment)
+
+    def test_partial_payment_carries_past_due(self):
+        self.assertEqual(self.pay('40.00').status_code, 200)
+        cycle = BillingCycle.objects.filter(loan=self.loan).latest('billing_date')
+        self.assertEqual(cycle.past_due, Decimal('60.00'))
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.principal_balance, Decimal('5000.00'))
+
+    def test_paying_off_principal_closes_the_loan(self):
+        self.assertEqual(self.pay('5100.00').status_code, 200)
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.principal_balance, Decimal('0.00'))
+        self.assertFalse(self.loan.is_active)
+        response = self.pay('100.00')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Loan not found or already closed')
+
+
+class BatchPaymentTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.loan = make_loan(make_user(1), cycles=3, paid=1)
+        self.other = make_loan(make_user(2), cycles=1)
+
+    def post_batch(self, body):
+        return self.client.post('/api/make-payment/batch/', body, content_type='application/x-ndjson')
+
+    def test_applies_lines_in_order_and_rejects_bad_ones(self):
+        response = self.post_batch(ndjson(
+            {'loan_id': str(self.loan.id), 'amount': '100.00'},
+            b'\xff{not utf-8}',
+            b'{"loan_id": ',
+            {'loan_id': str(self.other.id), 'amount': '100.00'},
+            {'loan_id': str(self.loan.id), 'amount': '100.00'},
+            {'loan_id': str(self.other.id), 'amount': '100.00'},
+        ))
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertIsNone(body['error'])
+        self.assertEqual((body['accepted'], body['rejected']), (3, 3))
+        self.assertEqual([result['line'] for result in body['results']], [1, 2, 3, 4, 5, 6])
+        self.assertEqual(body['results'][5]['error'], 'No pending payments for this loan')
+        # Two payments for one loan settle its two unpaid cycles
+        self.assertFalse(BillingCycle.objects.filter(loan=self.loan, is_paid=False).exists())
+        self.assertEqual(Payment.objects.filter(billing_cycle__loan=self.loan).count(), 3)
+
+    def test_failed_chunk_is_reported_in_the_body(self):
+        with mock.patch('credit_app.payments.settle_payment_chunk', side_effect=DatabaseError('disk full')), \
+                self.assertLogs('credit_app.payments', 'ERROR'):
+            response = self.post_batch(ndjson(
+                {'loan_id': str(self.loan.id), 'amount': '100.00'},
+                {'loan_id': str(self.other.id), 'amount': '100.00'},
+            ))
+        self.assertEqual(response.status_code, 500)
+        body = response.json()
+        self.assertEqual(body['error'], 'Lines 1-2 were not applied: disk full')
+        self.assertEqual(body['rejected'], 2)
+        self.assertEqual(body['results'][0]['error'], 'Not applied: disk full')
+        self.assertEqual(Payment.objects.filter(billing_cycle__loan=self.other).count(), 0)
+
+    def test_import_payments_keeps_chunks_around_a_failure(self):
+        from ..payments import settle_payment_chunk
+        calls = []
+
+        def fail_second_chunk(entries):
+            calls.append(entries)
+            if len(calls) == 2:
+                raise DatabaseError('disk full')
+            return settle_payment_chunk(entries)
+
+        with tempfile.NamedTemporaryFile('wb', suffix='.ndjson', delete=False) as feed:
+            feed.write(ndjson(
+                {'loan_id': str(self.loan.id), 'amount': '100.00'},
+                {'loan_id': str(self.loan.id), 'amount': '100.00'},
+                {'loan_id': str(self.other.id), 'amount': '100.00'},
+            ))
+        self.addCleanup(os.unlink, feed.name)
+        out = StringIO()
+        with mock.patch('credit_app.payments.settle_payment_chunk', side_effect=fail_second_chunk), \
+                self.assertLogs('credit_app.payments', 'ERROR'):
+            call_command('import_payments', feed.name, '--chunk-size', '1', stdout=out)
+        self.assertIn('Lines 2-2 were not applied: disk full', out.getvalue())
+        self.assertIn('Applied 2 payments, rejected 1', out.getvalue())
+        self.assertEqual(BillingCycle.objects.filter(loan=self.loan, is_paid=False).count(), 1)
+        self.assertTrue(BillingCycle.objects.get(loan=self.other).is_paid)
+
+
+class LockRetryTests(SimpleTestCase):
+    def test_retries_lock_conflicts_only(self):
+        attempts = []
+
+        def locked_once():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise OperationalError('database is locked')
+            return 'done'
+
+        with mock.patch('credit_app.payments.time.sleep'):
+            self.assertEqual(retry_on_lock_conflict(locked_once), 'done')
+        self.assertEqual(len(attempts), 2)
+
+        missing_table = mock.Mock(side_effect=OperationalError('no such table: credit_app_loan'))
+        with self.assertRaises(OperationalError):
+            retry_on_lock_conflict(missing_table)
+        missing_table.assert_called_once()
+
+    def test_postgresql_deadlock_is_a_lock_conflict(self):
+        def driver_error(message, pgcode):
+            cause = Exception(message)
+            cause.pgcode = pgcode
+            error = OperationalError(message)
+            error.__cause__ = cause
+            return error
+
+        self.assertTrue(is_lock_conflict(driver_error('deadlock detected', '40P01')))
+        self.assertFalse(is_lock_conflict(driver_error('server closed the connection unexpectedly', None)))
@@ -0,0 +1,157 @@
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from datetime import date, timedelta
+from io import StringIO
+import json
+import os
+import tempfile
+import uuid
+from ..models import User, Loan, BillingCycle, PendingCreditScore
+from ..tasks import calculate_credit_score, flush_credit_scores
+from .fixtures import clear_caches, make_loan, make_transactions, make_user, make_users
+
+# Every budget below is asserted at each of these sizes, so a query that
+# grows with the data shows up as a failure at the larger sizes
+SIZES = (1, 10, 50)
+
+
+# The budgets are for the unsharded layout; the sharded one is covered by
+# test_sharding
+@override_settings(TRANSACTION_SHARDS=())
+class QueryBudgetTestCase(TestCase):
+    def setUp(self):
+        clear_caches()
+
+    def post_json(self, path, data):
+        return self.client.post(path, data, content_type='application/json')
+
+
+class EndpointQueryTests(QueryBudgetTestCase):
+    def test_register_user(self):
+        for size in SIZES:
+            with self.subTest(existing_users=size):
+                make_users(size, start=size * 1000)
+                with self.assertNumQueries(5):
+                    response = self.post_json('/api/register-user/', {
+                        'aadhar_id': f'9{size:011d}',
+                        'username': f'new-{size}',
+                        'email_id': f'new-{size}@example.com',
+                        'annual_income': '500000'
+                    })
+                self.assertEqual(response.status_code, 200)
+
+    def test_apply_loan(self):
+        user = make_user(1)
+        for size in SIZES:
+            with self.subTest(term_period=size):
+                clear_caches()
+                body = {
+                    'unique_user_id': str(uuid.UUID(int=user.id)),
+                    'loan_type': 'CREDIT_CARD',
+                    'loan_amount': '5000',
+                    'interest_rate': '14',
+                    'term_period': size,
+                    'disbursement_date': date.today().isoformat()
+                }
+                # Cold: the eligibility verdict is loaded once
+                with self.assertNumQueries(5):
+                    response = self.post_json('/api/apply-loan/', body)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()['due_dates']), size)
+                # Warm: the verdict comes from the cache
+                with self.assertNumQueries(4):
+                    self.post_json('/api/apply-loan/', body)
+
+    def test_make_payment(self):
+        for size in SIZES:
+            with self.subTest(billing_cycles=size):
+                loan = make_loan(make_user(size), cycles=size + 1, paid=size)
+                with self.assertNumQueries(8):
+                    response = self.post_json('/api/make-payment/', {'loan_id': str(loan.id), 'amount': '150.00'})
+                self.assertEqual(response.status_code, 200)
+
+    def test_get_statement(self):
+        for size in SIZES:
+            with self.subTest(payments=size):
+                loan = make_loan(make_user(size), cycles=size + 3, paid=size)
+                with self.assertNumQueries(5):
+                    response = self.client.get('/api/get-statement/', {'loan_id': str(loan.id)})
+                self.assertEqual(len(response.json()['past_transactions']), size)
+                # Unchanged statements are served from the cache or by ETag
+                with self.assertNumQueries(0):
+                    self.client.get('/api/get-statement/', {'loan_id': str(loan.id)})
+                with self.assertNumQueries(0):
+                    response = self.client.get('/api/get-statement/', {'loan_id': str(loan.id)},
+                                               HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_get_statement_page(self):
+        for size in SIZES:
+            with self.subTest(payments=size):
+                loan = make_loan(make_user(size), cycles=size, paid=size)
+                with self.assertNumQueries(5):
+                    response = self.client.get('/api/get-statement/', {'loan_id': str(loan.id), 'limit': 5})
+                self.assertEqual(len(response.json()['past_transactions']), min(size, 5))
+
+    def test_batch_payment(self):
+        for size in SIZES:
+            with self.subTest(payments=size):
+                loans = [make_loan(make_user(size * 1000 + n), cycles=2) for n in range(size)]
+                body = '\n'.join(json.dumps({'loan_id': str(loan.id), 'amount': '100.00'}) for loan in loans)
+                with self.assertNumQueries(7):
+                    response = self.client.post('/api/make-payment/batch/', body, content_type='application/x-ndjson')
+                self.assertEqual(response.status_code, 200)
+
+
+class CommandQueryTests(QueryBudgetTestCase):
+    def test_process_billing_batch(self):
+        today = date.today()
+        for size in SIZES:
+            with self.subTest(loans=size):
+                Loan.objects.update(is_active=False)
+                users = make_users(size, start=size * 1000)
+                for user in users:
+                    make_loan(user, next_billing_date=today)
+                with self.assertNumQueries(18):
+                    call_command('process_billing', '--batch', '--until', (today + timedelta(days=size)).isoformat(),
+                                 stdout=StringIO())
+                self.assertEqual(BillingCycle.objects.filter(loan__user__in=users).count(), size)
+
+    def test_rescore_all(self):
+        for size in SIZES:
+            with self.subTest(users=size):
+                User.objects.all().delete()
+                for user in make_users(size):
+                    make_transactions(user.aadhar_id, 3)
+                with self.assertNumQueries(5):
+                    call_command('rescore_all', stdout=StringIO())
+
+    def test_calculate_credit_score(self):
+        for size in SIZES:
+            with self.subTest(transactions=size):
+                user = make_user(size, credit_score=None)
+                make_transactions(user.aadhar_id, size)
+                with self.assertNumQueries(5):
+                    self.assertTrue(calculate_credit_score(user.aadhar_id))
+
+    def test_flush_credit_scores(self):
+        for size in SIZES:
+            with self.subTest(pending=size):
+                users = make_users(size, start=size * 1000)
+                PendingCreditScore.objects.bulk_create([PendingCreditScore(aadhar_id=user.aadhar_id) for user in users])
+                with self.assertNumQueries(11):
+                    self.assertEqual(flush_credit_scores(), size)
+
+    def test_import_transactions(self):
+        for size in SIZES:
+            with self.subTest(customers=size):
+                users = make_users(size, start=size * 1000)
+                with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as feed:
+                    feed.write('aadhar_id,date,amount,transaction_type\n')
+                    for n in range(size * 3):
+                        feed.write(f'{users[n % size].aadhar_id},2024-01-01,{100 + n},CREDIT\n')
+                try:
+                    with self.assertNumQueries(15):
+                        call_command('import_transactions', feed.name, stdout=StringIO())
+                finally:
+                    os.unlink(feed.name)
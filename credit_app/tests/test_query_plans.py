@@ -0,0 +1,52 @@
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from datetime import date
+from io import StringIO
+import re
+from unittest import mock
+from ..billing import bill_chunk
+from ..models import User
+from ..scoring import rescore_chunk
+from .fixtures import ALL_DATABASES, make_loan, make_user
+
+
+class QueryPlanTests(TestCase):
+    databases = ALL_DATABASES
+
+    def test_hot_queries_use_indexes(self):
+        out = StringIO()
+        # The deployed hosts, without the test client's 'testserver'
+        with self.settings(ALLOWED_HOSTS=['localhost', '127.0.0.1']):
+            call_command('explain_hot_queries', '--fail-on-scan', stdout=out)
+        self.assertIn('0 read a whole table', out.getvalue())
+        statements = dict(re.findall(r'^([\w-]+): (\d+) statements', out.getvalue(), re.MULTILINE))
+        self.assertEqual(len(statements), 12)
+        self.assertNotIn('0', statements.values())
+        # The sample data is rolled back
+        self.assertFalse(User.objects.filter(username__startswith='explain-').exists())
+
+    def test_rejected_request_fails_the_command(self):
+        with self.settings(ALLOWED_HOSTS=['credit.example.com']):
+            with self.assertRaisesMessage(CommandError, 'returned 400'):
+                call_command('explain_hot_queries', '--scenario', 'get-statement', stdout=StringIO())
+        self.assertFalse(User.objects.filter(username__startswith='explain-').exists())
+
+    def test_command_scenarios_only_touch_the_sample(self):
+        loan = make_loan(make_user(1, credit_score=300), next_billing_date=date.today())
+        summaries = []
+
+        def rescore(job):
+            summaries.append(rescore_chunk(job))
+            return summaries[-1]
+
+        with mock.patch('credit_app.management.commands.explain_hot_queries.bill_chunk', wraps=bill_chunk) as billed, \
+                mock.patch('credit_app.management.commands.explain_hot_queries.rescore_chunk', side_effect=rescore):
+            call_command('explain_hot_queries', '--scenario', 'process_billing', '--scenario', 'rescore_all',
+                         stdout=StringIO())
+        billed_ids = [billed_loan.id for call in billed.call_args_list for billed_loan in call.args[0]]
+        self.assertEqual(len(billed_ids), 2)
+        self.assertNotIn(loan.id, billed_ids)
+        self.assertEqual([summary['users'] for summary in summaries], [2])
+        loan.refresh_from_db()
+        self.assertEqual(loan.next_billing_date, date.today())
@@ -0,0 +1,59 @@
+from django.core.management import call_command
+from django.test import TestCase
+from io import StringIO
+from unittest import mock
+from ..models import PendingCreditScore, User
+from ..tasks import flush_credit_scores
+from .fixtures import ALL_DATABASES, clear_caches
+
+
+class BulkRegistrationTests(TestCase):
+    databases = ALL_DATABASES
+
+    def setUp(self):
+        clear_caches()
+
+    def register(self, count):
+        return self.client.post('/api/register-user/bulk/', {'users': [{
+            'aadhar_id': f'{n:012d}',
+            'username': f'bulk-{n}',
+            'email_id': f'bulk-{n}@example.com',
+            'annual_income': '500000'
+        } for n in range(count)]}, content_type='application/json')
+
+    def test_registers_users_and_queues_scores(self):
+        with mock.patch('credit_app.views.schedule_flush') as schedule_flush:
+            response = self.register(3)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['users']), 3)
+        self.assertEqual(PendingCreditScore.objects.count(), 3)
+        schedule_flush.assert_called_once_with()
+
+    def test_broker_failure_after_commit_still_succeeds(self):
+        with mock.patch('credit_app.views.schedule_flush', side_effect=ConnectionError('broker down')), \
+                self.assertLogs('credit_app.views', 'ERROR'):
+            response = self.register(2)
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(response.json()['error'])
+        self.assertEqual(User.objects.count(), 2)
+        self.assertEqual(PendingCreditScore.objects.count(), 2)
+
+    def test_duplicate_rejects_whole_batch(self):
+        with mock.patch('credit_app.views.schedule_flush'):
+            self.register(1)
+            response = self.register(2)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error']['users'][0]['aadhar_id'],
+                         ['A user with this aadhar_id already exists.'])
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_score_stats_reads_shared_counters(self):
+        with mock.patch('credit_app.views.schedule_flush'), self.captureOnCommitCallbacks(execute=True):
+            self.register(3)
+        flush_credit_scores()
+        out = StringIO()
+        call_command('score_stats', stdout=out)
+        self.assertEqual(
+            out.getvalue().strip(),
+            '3 score requests received, 3 scores computed in 1 batches (0 coalesced), 0 pending'
+        )
@@ -0,0 +1,135 @@
+from django.conf import settings
+from django.db import connections, router
+from django.http import HttpResponse
+from django.test import RequestFactory, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from unittest import mock
+import shutil
+import tempfile
+from ..middleware import ReplicaPinningMiddleware
+from ..models import Loan
+from ..routers import pin_to_primary, replica_reads, replica_stream
+from .fixtures import clear_caches, make_loan, make_user
+
+
+def use_shared_pin_cache(test):
+    # Pins only count in a cache shared between processes
+    location = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, location)
+    pins = test.settings(REPLICA_PIN_CACHE_ALIAS='pins', CACHES=dict(settings.CACHES, pins={
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': location,
+    }))
+    pins.enable()
+    test.addCleanup(pins.disable)
+
+
+def read_alias():
+    # Where a read would go, without running it
+    return Loan.objects.all().db
+
+
+@override_settings(DATABASE_REPLICAS=('replica',))
+class ReplicaRouterTests(TransactionTestCase):
+    # Not TestCase: reads inside a transaction always stay on the primary
+    def setUp(self):
+        clear_caches()
+        use_shared_pin_cache(self)
+
+    def test_reads_opt_in_to_replica(self):
+        self.assertEqual(read_alias(), 'default')
+        with replica_reads():
+            self.assertEqual(read_alias(), 'replica')
+            self.assertEqual(router.db_for_write(Loan), 'default')
+        self.assertEqual(read_alias(), 'default')
+
+    def test_no_replicas_configured(self):
+        with self.settings(DATABASE_REPLICAS=()), replica_reads():
+            self.assertEqual(read_alias(), 'default')
+
+    def test_written_keys_read_from_primary(self):
+        pin_to_primary(['loan:1'])
+        with replica_reads('loan:1'):
+            self.assertEqual(read_alias(), 'default')
+        with replica_reads('loan:2'):
+            self.assertEqual(read_alias(), 'replica')
+
+    def test_process_local_pin_cache_keeps_keyed_reads_on_primary(self):
+        with self.settings(REPLICA_PIN_CACHE_ALIAS='default'):
+            with replica_reads('loan:2'):
+                self.assertEqual(read_alias(), 'default')
+            with replica_reads():
+                self.assertEqual(read_alias(), 'replica')
+
+    @override_settings(DATABASE_REPLICAS=('replica', 'replica_2'))
+    def test_one_replica_per_block(self):
+        with mock.patch('credit_app.routers.random.choice', side_effect=['replica_2', 'replica']) as choice:
+            with replica_reads():
+                self.assertEqual({read_alias() for _ in range(5)}, {'replica_2'})
+            with replica_reads():
+                self.assertEqual(read_alias(), 'replica')
+        self.assertEqual(choice.call_count, 2)
+
+    def test_stream_decides_when_created(self):
+        def rows():
+            yield read_alias()
+        self.assertEqual(list(replica_stream(rows())), ['replica'])
+        pin_to_primary(['loan:1'])
+        self.assertEqual(list(replica_stream(rows(), 'loan:1')), ['default'])
+
+    def test_client_pinned_after_write(self):
+        aliases = []
+
+        def view(request):
+            aliases.append(read_alias())
+            if request.method == 'POST':
+                router.db_for_write(Loan)
+                aliases.append(read_alias())
+            return HttpResponse()
+
+        middleware = ReplicaPinningMiddleware(lambda request: view(request))
+        factory = RequestFactory()
+        with replica_reads():
+            self.assertNotIn('primary_pin', middleware(factory.get('/')).cookies)
+            response = middleware(factory.post('/'))
+            pinned = factory.get('/')
+            pinned.COOKIES['primary_pin'] = response.cookies['primary_pin'].value
+            middleware(pinned)
+        # Reads after the write, in the same request and the next, use the primary
+        self.assertEqual(aliases, ['replica', 'replica', 'default', 'default'])
+        self.assertEqual(response.cookies['primary_pin']['max-age'], 5)
+
+
+@override_settings(DATABASE_REPLICAS=('replica',))
+class ReplicaQueryTests(TransactionTestCase):
+    # 'replica' mirrors the default test database, so it sees the same rows
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        clear_caches()
+        use_shared_pin_cache(self)
+
+    def test_reads_run_on_the_replica_connection(self):
+        loan = make_loan(make_user(1), cycles=2, paid=1)
+        with CaptureQueriesContext(connections['replica']) as replica, \
+                CaptureQueriesContext(connections['default']) as primary:
+            with replica_reads():
+                self.assertEqual(Loan.objects.get(id=loan.id).principal_balance, loan.principal_balance)
+                self.assertEqual(loan.billingcycle_set.count(), 2)
+        self.assertEqual(len(replica.captured_queries), 2)
+        self.assertEqual(len(primary.captured_queries), 0)
+
+    def test_statement_reads_from_the_replica(self):
+        loan = make_loan(make_user(1), cycles=2, paid=1)
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get('/api/get-statement/', {'loan_id': str(loan.id)})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(any('credit_app_billingcycle' in query['sql'] for query in replica.captured_queries))
+
+        # A payment pins the loan, so even other clients read its statement from the primary
+        self.client.post('/api/make-payment/', {'loan_id': str(loan.id), 'amount': '100.00'},
+                         content_type='application/json')
+        self.client.cookies.clear()
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.assertEqual(self.client.get('/api/get-statement/', {'loan_id': str(loan.id)}).status_code, 200)
+        self.assertEqual(replica.captured_queries, [])
@@ -0,0 +1,77 @@
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from io import StringIO
+from unittest import mock
+import threading
+from ..models import User
+from ..scoring import inline_credit_score
+from .fixtures import clear_caches, make_transactions, make_user, make_users
+
+
+@override_settings(CREDIT_SCORE_INLINE_BUDGET_MS=10, CREDIT_SCORE_TASK_WAIT_SECONDS=5)
+class InlineCreditScoreTests(TestCase):
+    def test_slow_computation_is_awaited_not_queued_again(self):
+        over_budget = threading.Event()
+
+        def slow_score(aadhar_id):
+            over_budget.wait(5)
+            return 640
+
+        with mock.patch('credit_app.scoring.compute_and_save_score', side_effect=slow_score), \
+                mock.patch('credit_app.tasks.calculate_credit_score.delay') as delay:
+            timer = threading.Timer(0.1, over_budget.set)
+            timer.start()
+            self.addCleanup(timer.cancel)
+            self.assertEqual(inline_credit_score('000000000001'), 640)
+        delay.assert_not_called()
+
+    def test_failed_computation_falls_back_to_the_task(self):
+        make_user(1, credit_score=710)
+        with mock.patch('credit_app.scoring.compute_and_save_score', side_effect=RuntimeError('shard down')), \
+                mock.patch('credit_app.tasks.calculate_credit_score.delay') as delay:
+            self.assertEqual(inline_credit_score('000000000001'), 710)
+        delay.assert_called_once_with('000000000001')
+
+
+class RescoreAllCommandTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.broke, self.modest, self.rich = make_users(3)
+        make_transactions(self.modest.aadhar_id, 3)  # 50000 net
+        make_transactions(self.rich.aadhar_id, 60)  # 1000000 net
+        self.unscored = make_user(4, credit_score=None)
+
+    def rescore(self, *args):
+        out = StringIO()
+        call_command('rescore_all', *args, stdout=out)
+        return out.getvalue().splitlines()
+
+    def scores(self):
+        return dict(User.objects.values_list('username', 'credit_score'))
+
+    def test_dry_run_reports_changes_without_saving(self):
+        before = self.scores()
+        lines = self.rescore('--dry-run')
+        self.assertEqual(self.scores(), before)
+        self.assertRegex(lines[0], r'^4/4 users scored, 3 changed ')
+        self.assertEqual(lines[1:-1], [
+            'Score change histogram:',
+            ' -600 ..  -551  ######################################## 2',
+            '  first score   #################### 1',
+        ])
+        self.assertRegex(lines[-1], r'^Rescored 4 users in .*; 3 scores would change$')
+
+    def test_saves_changed_scores(self):
+        lines = self.rescore()
+        self.assertEqual(self.scores(), {
+            self.broke.username: 300,
+            self.modest.username: 326,
+            self.rich.username: 900,
+            self.unscored.username: 300
+        })
+        self.assertNotIn('Score change histogram:', lines)
+        self.assertRegex(lines[-1], r'; 3 scores changed$')
+
+        lines = self.rescore('--dry-run')
+        self.assertIn('No score changes', lines)
+        self.assertRegex(lines[-1], r'; 0 scores would change$')
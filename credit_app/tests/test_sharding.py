@@ -0,0 +1,143 @@
+from django.core.management import call_command
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+import os
+import tempfile
+import threading
+from ..models import CustomerBalance, ImportCheckpoint, Transaction, User
+from ..routers import ShardRouter
+from ..scoring import score_customers, score_from_balance
+from ..sharding import fan_out_all, group_by_shard, shard_aliases, shard_for
+from .fixtures import make_user
+
+SHARDS = ('transactions_0', 'transactions_1', 'transactions_2')
+# The shard databases in settings, unused unless TRANSACTION_SHARDS lists them
+TEST_SHARDS = ('transactions_0', 'transactions_1')
+
+
+class ShardingTests(SimpleTestCase):
+    @override_settings(TRANSACTION_SHARDS=())
+    def test_unsharded_uses_default(self):
+        self.assertEqual(shard_aliases(), ('default',))
+        self.assertEqual(shard_for('000000000001'), 'default')
+
+    @override_settings(TRANSACTION_SHARDS=SHARDS)
+    def test_stable_hash_spreads_customers(self):
+        # Fixed values: a customer must land on the same shard in every process
+        self.assertEqual(shard_for('000000000007'), 'transactions_2')
+        aadhar_ids = [f'{n:012d}' for n in range(3000)]
+        groups = group_by_shard(aadhar_ids)
+        self.assertEqual(set(groups), set(SHARDS))
+        for alias, members in groups.items():
+            self.assertGreater(len(members), 800)
+            self.assertEqual(members, sorted(members))
+            self.assertTrue(all(shard_for(aadhar_id) == alias for aadhar_id in members))
+
+    @override_settings(TRANSACTION_SHARDS=SHARDS)
+    def test_router_places_rows_by_aadhar_id(self):
+        router = ShardRouter()
+        row = Transaction(aadhar_id='000000000007')
+        self.assertEqual(router.db_for_write(Transaction, instance=row), 'transactions_2')
+        self.assertIsNone(router.db_for_write(Transaction))
+        self.assertTrue(router.allow_migrate('transactions_0', 'credit_app', model_name='transaction'))
+        self.assertTrue(router.allow_migrate('transactions_0', 'credit_app', model_name='importcheckpoint'))
+        self.assertFalse(router.allow_migrate('transactions_0', 'credit_app', model_name='loan'))
+        self.assertFalse(router.allow_migrate('transactions_0', 'credit_app'))
+        self.assertIsNone(router.allow_migrate('default', 'credit_app', model_name='loan'))
+
+
+
+def transaction_row(n, amount, transaction_type='CREDIT'):
+    return Transaction(aadhar_id=f'{n:012d}', date=date(2025, 1, n), amount=Decimal(amount),
+                       transaction_type=transaction_type)
+
+
+@override_settings(TRANSACTION_SHARDS=TEST_SHARDS)
+class ShardedStorageTests(TransactionTestCase):
+    # Not TestCase: fan_out only uses its pool threads outside a transaction
+    databases = {'default', *TEST_SHARDS}
+
+    def shard_rows(self, model, alias):
+        return list(model.objects.using(alias).order_by('id'))
+
+    def test_insert_batch_places_rows_on_their_shards(self):
+        Transaction.objects.insert_batch([transaction_row(n, 100 * n) for n in range(1, 9)])
+        for alias in TEST_SHARDS:
+            rows = self.shard_rows(Transaction, alias)
+            self.assertTrue(rows)
+            self.assertTrue(all(shard_for(row.aadhar_id) == alias for row in rows))
+            balances = {balance.aadhar_id: balance.net_balance for balance in self.shard_rows(CustomerBalance, alias)}
+            self.assertEqual(balances, {row.aadhar_id: row.amount for row in rows})
+        self.assertFalse(Transaction.objects.using('default').exists())
+        call_command('rebuild_ledger', '--verify', stdout=StringIO())
+
+    def test_fan_out_queries_every_shard_on_the_pool(self):
+        Transaction.objects.insert_batch([transaction_row(n, 100) for n in range(1, 9)])
+        threads = []
+
+        def count(alias):
+            threads.append(threading.current_thread().name)
+            return Transaction.objects.using(alias).count()
+
+        counts = fan_out_all(count)
+        self.assertEqual(counts, {'transactions_0': 4, 'transactions_1': 4})
+        self.assertTrue(all(name.startswith('shard') for name in threads))
+
+    def test_score_customers_merges_balances_from_all_shards(self):
+        users = [make_user(n, credit_score=None) for n in range(1, 9)]
+        Transaction.objects.insert_batch(
+            [transaction_row(n, 40000 * n) for n in range(1, 9)] + [transaction_row(2, 5000, 'DEBIT')]
+        )
+        self.assertEqual(score_customers([user.aadhar_id for user in users]), 8)
+        scores = dict(User.objects.values_list('aadhar_id', 'credit_score'))
+        self.assertEqual(scores['000000000002'], score_from_balance(Decimal('75000')))
+        for n in range(3, 9):
+            self.assertEqual(scores[f'{n:012d}'], score_from_balance(Decimal(40000 * n)))
+        self.assertEqual(len(set(scores.values())), 8)
+
+    def test_import_resumes_from_each_shards_checkpoint(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as feed:
+            feed.write('aadhar_id,date,amount,transaction_type\n')
+            for n in range(1, 9):
+                feed.write(f'{n:012d},2025-01-0{n},{100 * n},CREDIT\n')
+        self.addCleanup(os.unlink, feed.name)
+
+        apply_transactions = CustomerBalance.objects.apply_transactions
+        calls = []
+
+        def fail_second_batch_on_one_shard(rows):
+            if shard_for(rows[0].aadhar_id) == 'transactions_1':
+                calls.append(rows)
+                if len(calls) == 2:
+                    raise RuntimeError('shard connection lost')
+            apply_transactions(rows)
+
+        def run_import(batch_size):
+            out = StringIO()
+            call_command('import_transactions', feed.name, '--batch-size', batch_size, '--skip-scoring', stdout=out)
+            return out.getvalue()
+
+        with mock.patch.object(CustomerBalance.objects, 'apply_transactions',
+                               side_effect=fail_second_batch_on_one_shard):
+            with self.assertRaises(RuntimeError):
+                run_import('4')
+        # Both shards committed their rows of the first batch; only
+        # transactions_0 committed its rows of the second
+        checkpoints = {alias: ImportCheckpoint.objects.using(alias).get() for alias in TEST_SHARDS}
+        self.assertLess(checkpoints['transactions_1'].position, checkpoints['transactions_0'].position)
+        imported = {alias: len(self.shard_rows(Transaction, alias)) for alias in TEST_SHARDS}
+        self.assertEqual(imported, {alias: checkpoints[alias].rows_imported for alias in TEST_SHARDS})
+        self.assertEqual(imported, {'transactions_0': 4, 'transactions_1': 3})
+
+        # The resume reads from the shard furthest behind; transactions_0
+        # skips the lines it already has
+        self.assertIn('Imported 1 transactions', run_import('3'))
+        for alias in TEST_SHARDS:
+            rows = self.shard_rows(Transaction, alias)
+            self.assertEqual(len(rows), 4)
+            self.assertEqual(len({row.aadhar_id for row in rows}), 4)
+            self.assertEqual(ImportCheckpoint.objects.using(alias).get().position, os.path.getsize(feed.name))
+        call_command('rebuild_ledger', '--verify', stdout=StringIO())
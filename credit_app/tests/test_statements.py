@@ -0,0 +1,64 @@
+from django.test import AsyncClient, TestCase, override_settings
+from decimal import Decimal
+from unittest import mock
+import json
+import uuid
+from ..statement_cache import statement_cache, version_key
+from .fixtures import clear_caches, make_loan, make_user
+
+
+class StatementCacheTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.loan = make_loan(make_user(1), cycles=3, paid=1)
+
+    def get_statement(self, **headers):
+        return self.client.get('/api/get-statement/', {'loan_id': str(self.loan.id)}, **headers)
+
+    def test_payment_changes_statement_and_etag(self):
+        first = self.get_statement()
+        self.assertEqual(len(first.json()['past_transactions']), 1)
+        self.assertEqual(self.get_statement(HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        # Invalidation runs on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/make-payment/', {'loan_id': str(self.loan.id), 'amount': '100.00'},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        second = self.get_statement(HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertEqual([row['amount_paid'] for row in second.json()['past_transactions']],
+                         [Decimal('100.00'), Decimal('100.00')])
+
+    def test_unknown_loan_creates_no_version(self):
+        loan_id = uuid.uuid4()
+        response = self.client.get('/api/get-statement/', {'loan_id': str(loan_id)})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Loan not found'})
+        self.assertIsNone(statement_cache().get(version_key(loan_id)))
+
+    @override_settings(STATEMENT_VERSION_TTL=42)
+    def test_versions_expire(self):
+        with mock.patch.object(statement_cache(), 'add', wraps=statement_cache().add) as add:
+            self.get_statement()
+        add.assert_called_once_with(version_key(self.loan.id), mock.ANY, timeout=42)
+
+
+class StatementExportTests(TestCase):
+    def setUp(self):
+        self.loan = make_loan(make_user(1), cycles=3, paid=2)
+
+    def assert_export(self, body):
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual([row['type'] for row in rows], ['payment', 'payment', 'billing'])
+
+    def test_export_streams_ndjson(self):
+        response = self.client.get('/api/get-statement/export/', {'loan_id': str(self.loan.id)})
+        self.assert_export(b''.join(response.streaming_content))
+
+    async def test_export_under_asgi(self):
+        # The ASGI handler consumes the stream inside the event loop
+        response = await AsyncClient().get(f'/api/get-statement/export/?loan_id={self.loan.id}')
+        self.assert_export(b''.join(response.streaming_content))
@@ -1,17 +1,31 @@
 from django.urls import path
 from .views import (
     RegisterUserView,
+    BulkRegisterUserView,
     ApplyLoanView,
     MakePaymentView,
+    BatchPaymentView,
     GetStatementView,
-    home
+    StatementExportView,
+    async_get_statement,
+    async_home,
+    async_register_user,
+    home,
+    metrics
 )
 
 urlpatterns = [
     path('', home, name='home'),  # Add this line
+    path('metrics/', metrics, name='metrics'),
     path('register-user/', RegisterUserView.as_view(), name='register-user'),
     path('api/register-user/', RegisterUserView.as_view(), name='register-user'),
+    path('api/register-user/bulk/', BulkRegisterUserView.as_view(), name='register-user-bulk'),
     path('api/apply-loan/', ApplyLoanView.as_view(), name='apply-loan'),
     path('api/make-payment/', MakePaymentView.as_view(), name='make-payment'),
+    path('api/make-payment/batch/', BatchPaymentView.as_view(), name='make-payment-batch'),
     path('api/get-statement/', GetStatementView.as_view(), name='get-statement'),
+    path('api/get-statement/export/', StatementExportView.as_view(), name='export-statement'),
+    path('api/async/', async_home, name='async-home'),
+    path('api/async/register-user/', async_register_user, name='async-register-user'),
+    path('api/async/get-statement/', async_get_statement, name='async-get-statement'),
 ]
\ No newline at end of file
@@ -5,29 +5,87 @@ from rest_framework.permissions import AllowAny
 from django.db import transaction
 from decimal import Decimal
 from datetime import datetime, timedelta
-from .models import User, Loan, BillingCycle, Payment, Transaction
+from .models import User, Loan, BillingCycle, Payment, Transaction, ScheduledInstallment
 from .serializers import (
     UserRegistrationSerializer,
+    BulkUserRegistrationSerializer,
     LoanApplicationSerializer,
     PaymentSerializer,
-    StatementSerializer
+    StatementSerializer,
+    StatementExportSerializer
+)
+from .tasks import request_credit_scores, schedule_flush, score_counters
+from .async_db import publish, run_db
+from .metrics import registry
+from .eligibility import eligibility_stats
+from .amortization import amortization_schedule
+from .idempotency import idempotent, store_response
+from .scoring import inline_credit_score
+from .routers import replica_reads, replica_stream
+from .eligibility import SCORE_PENDING, eligibility_verdict
+from .payments import (
+    PaymentRejected,
+    allocate_payment,
+    apply_payment_lines,
+    apply_to_loan,
+    retry_on_lock_conflict
+)
+from .statement_cache import (
+    cache_statement,
+    get_cached_statement,
+    invalidate_statements,
+    loan_pin,
+    statement_etag,
+    statement_version
 )
-from .tasks import calculate_credit_score
 import uuid
 import csv
+import json
+import logging
+from base64 import urlsafe_b64encode
 from django.core.files.uploadedfile import InMemoryUploadedFile
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+from django.utils.http import parse_etags
+
+logger = logging.getLogger(__name__)
+
+STATEMENT_PAGE_SIZE = 100
+EXPORT_CHUNK_SIZE = 2000
+
+API_INDEX = {
+    "message": "Credit Service API",
+    "endpoints": {
+        "register": "/api/register-user/",
+        "register_bulk": "/api/register-user/bulk/",
+        "apply_loan": "/api/apply-loan/",
+        "make_payment": "/api/make-payment/",
+        "make_payment_batch": "/api/make-payment/batch/",
+        "get_statement": "/api/get-statement/",
+        "export_statement": "/api/get-statement/export/",
+        "async_index": "/api/async/",
+        "async_register": "/api/async/register-user/",
+        "async_get_statement": "/api/async/get-statement/",
+        "metrics": "/metrics/"
+    }
+}
 
 def home(request):
-    return JsonResponse({
-        "message": "Credit Service API",
-        "endpoints": {
-            "register": "/api/register-user/",
-            "apply_loan": "/api/apply-loan/",
-            "make_payment": "/api/make-payment/",
-            "get_statement": "/api/get-statement/"
-        }
-    })
+    return JsonResponse(API_INDEX)
+
+def metrics(request):
+    # Prometheus text format; request histograms come from PerformanceMiddleware
+    lines = [registry.render()]
+    lines.append('# TYPE credit_score_requests_total counter')
+    for name, value in score_counters().items():
+        lines.append(f'credit_score_requests_total{{outcome="{name}"}} {value}')
+    lines.append('# TYPE credit_eligibility_cache gauge')
+    for name, value in eligibility_stats().items():
+        lines.append(f'credit_eligibility_cache{{stat="{name}"}} {value:g}')
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4')
 class RegisterUserView(APIView):
     permission_classes = [AllowAny]
     
@@ -38,8 +96,8 @@ class RegisterUserView(APIView):
                 with transaction.atomic():
                     user = serializer.save()
                     
-                    # Start async task to calculate credit score
-                    calculate_credit_score.delay(user.aadhar_id)
+                    # Queue the credit score for the next coalesced flush
+                    request_credit_scores([user.aadhar_id])
                     
                     return Response({
                         'error': None,
@@ -53,29 +111,62 @@ class RegisterUserView(APIView):
             'error': serializer.errors
         }, status=status.HTTP_400_BAD_REQUEST)
 
+class BulkRegisterUserView(APIView):
+    permission_classes = [AllowAny]
+    
+    def post(self, request):
+        serializer = BulkUserRegistrationSerializer(data=request.data)
+        if serializer.is_valid():
+            try:
+                with transaction.atomic():
+                    users = serializer.save()
+                    aadhar_ids = [user.aadhar_id for user in users]
+                    
+                    # Queue the whole batch for the next coalesced flush
+                    request_credit_scores(aadhar_ids, schedule=False)
+            except Exception as e:
+                return Response({
+                    'error': str(e)
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            # The users are committed whatever happens to the broker; the
+            # pending rows are flushed by the next request that schedules
+            try:
+                schedule_flush()
+            except Exception:
+                logger.exception('Could not schedule the credit score flush for %d new users', len(users))
+            
+            return Response({
+                'error': None,
+                'users': [{
+                    'aadhar_id': user.aadhar_id,
+                    'unique_user_id': user.id
+                } for user in users]
+            }, status=status.HTTP_201_CREATED)
+        return Response({
+            'error': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+
 class ApplyLoanView(APIView):
+    @idempotent('apply-loan')
     def post(self, request):
         serializer = LoanApplicationSerializer(data=request.data)
         if serializer.is_valid():
             try:
+                data = serializer.validated_data
+                verdict = eligibility_verdict(data['unique_user_id'])
+                
+                # Score inline if the task hasn't run yet; done outside the
+                # transaction so the scoring thread can write the user row
+                if verdict.error == SCORE_PENDING:
+                    inline_credit_score(verdict.aadhar_id)
+                    verdict = eligibility_verdict(data['unique_user_id'])
+                
                 with transaction.atomic():
-                    data = serializer.validated_data
-                    user = User.objects.get(id=data['unique_user_id'])
-                    
                     # Check eligibility
-                    if user.credit_score is None:
-                        return Response({
-                            'error': 'Credit score not calculated yet'
-                        }, status=status.HTTP_400_BAD_REQUEST)
-                    
-                    if user.credit_score < 450:
-                        return Response({
-                            'error': 'Credit score too low'
-                        }, status=status.HTTP_400_BAD_REQUEST)
-                    
-                    if user.annual_income < Decimal('150000'):
+                    if verdict.error:
                         return Response({
-                            'error': 'Annual income too low'
+                            'error': verdict.error
                         }, status=status.HTTP_400_BAD_REQUEST)
                     
                     if data['loan_amount'] > Decimal('5000'):
@@ -90,23 +181,32 @@ class ApplyLoanView(APIView):
                     
                     # Create loan
                     loan = Loan.objects.create(
-                        user=user,
+                        user_id=verdict.user_id,
                         loan_type=data['loan_type'],
                         loan_amount=data['loan_amount'],
                         principal_balance=data['loan_amount'],
                         interest_rate=data['interest_rate'],
                         term_period=data['term_period'],
-                        disbursement_date=data['disbursement_date']
+                        disbursement_date=data['disbursement_date'],
+                        next_billing_date=data['disbursement_date'] + timedelta(days=30)
                     )
                     
-                    # Calculate EMI schedule
-                    due_dates = self.calculate_emi_schedule(loan)
+                    # Calculate and persist the EMI schedule
+                    installments = self.calculate_emi_schedule(loan)
+                    ScheduledInstallment.objects.bulk_create(installments)
+                    due_dates = [{
+                        'date': installment.due_date.strftime('%Y-%m-%d'),
+                        'amount_due': installment.amount_due,
+                        'principal': installment.principal,
+                        'interest': installment.interest,
+                        'balance': installment.balance
+                    } for installment in installments]
                     
-                    return Response({
+                    return store_response(request, Response({
                         'error': None,
                         'loan_id': loan.id,
                         'due_dates': due_dates
-                    }, status=status.HTTP_200_OK)
+                    }, status=status.HTTP_200_OK))
             except User.DoesNotExist:
                 return Response({
                     'error': 'User not found'
@@ -120,91 +220,32 @@ class ApplyLoanView(APIView):
         }, status=status.HTTP_400_BAD_REQUEST)
     
     def calculate_emi_schedule(self, loan):
-        # Implement EMI calculation logic here
-        # This is a simplified version - you'll need to implement the actual formula
-        due_dates = []
-        monthly_interest_rate = loan.interest_rate / Decimal('1200')
-        term = loan.term_period
-        
-        # EMI formula: P * r * (1+r)^n / ((1+r)^n - 1)
-        emi = (loan.loan_amount * monthly_interest_rate * 
-              (1 + monthly_interest_rate)**term) / ((1 + monthly_interest_rate)**term - 1)
+        installments = []
+        schedule = amortization_schedule(loan.loan_amount, loan.interest_rate, loan.term_period)
         
         current_date = loan.disbursement_date
-        for i in range(1, term + 1):
+        for row in schedule:
             # Add 30 days for each billing cycle
             current_date += timedelta(days=30)
-            due_dates.append({
-                'date': current_date.strftime('%Y-%m-%d'),
-                'amount_due': round(emi, 2)
-            })
+            installments.append(ScheduledInstallment(
+                loan=loan,
+                number=row.number,
+                due_date=current_date,
+                amount_due=row.amount_due,
+                principal=row.principal,
+                interest=row.interest,
+                balance=row.balance
+            ))
         
-        return due_dates
+        return installments
 
 class MakePaymentView(APIView):
+    @idempotent('make-payment')
     def post(self, request):
         serializer = PaymentSerializer(data=request.data)
         if serializer.is_valid():
             try:
-                with transaction.atomic():
-                    data = serializer.validated_data
-                    loan = Loan.objects.get(id=data['loan_id'], is_active=True)
-                    
-                    # Get the earliest unpaid billing cycle
-                    billing_cycle = BillingCycle.objects.filter(
-                        loan=loan,
-                        is_paid=False
-                    ).order_by('billing_date').first()
-                    
-                    if not billing_cycle:
-                        return Response({
-                            'error': 'No pending payments for this loan'
-                        }, status=status.HTTP_400_BAD_REQUEST)
-                    
-                    amount_paid = data['amount']
-                    
-                    # Check if payment covers past due first
-                    if billing_cycle.past_due > 0:
-                        if amount_paid < billing_cycle.past_due:
-                            return Response({
-                                'error': 'Payment must cover past due amount first'
-                            }, status=status.HTTP_400_BAD_REQUEST)
-                        
-                        amount_paid -= billing_cycle.past_due
-                        billing_cycle.past_due = Decimal('0')
-                    
-                    # Check if payment covers current min due
-                    if amount_paid < billing_cycle.min_due:
-                        # Partial payment - update past due
-                        billing_cycle.past_due = billing_cycle.min_due - amount_paid
-                        amount_paid = Decimal('0')
-                    else:
-                        amount_paid -= billing_cycle.min_due
-                    
-                    # Update billing cycle
-                    billing_cycle.is_paid = True
-                    billing_cycle.save()
-                    
-                    # Create payment record
-                    Payment.objects.create(
-                        billing_cycle=billing_cycle,
-                        amount=data['amount'],
-                        is_principal_payment=(amount_paid > 0)
-                    )
-                    
-                    # If there's extra payment, reduce principal
-                    if amount_paid > 0:
-                        loan.principal_balance -= amount_paid
-                        loan.save()
-                    
-                    # Check if loan is fully paid
-                    if loan.principal_balance <= Decimal('0'):
-                        loan.is_active = False
-                        loan.save()
-                    
-                    return Response({
-                        'error': None
-                    }, status=status.HTTP_200_OK)
+                return retry_on_lock_conflict(lambda: self.apply_payment(serializer.validated_data))
             except Loan.DoesNotExist:
                 return Response({
                     'error': 'Loan not found or already closed'
@@ -216,43 +257,85 @@ class MakePaymentView(APIView):
         return Response({
             'error': serializer.errors
         }, status=status.HTTP_400_BAD_REQUEST)
+    
+    def apply_payment(self, data):
+        with transaction.atomic():
+            # Lock the loan, then its cycle, so concurrent payments on the
+            # same loan queue up instead of overwriting each other
+            loan = Loan.objects.select_for_update().get(id=data['loan_id'], is_active=True)
+            
+            # Get the earliest unpaid billing cycle
+            billing_cycle = BillingCycle.objects.select_for_update().filter(
+                loan=loan,
+                is_paid=False
+            ).order_by('billing_date').first()
+            
+            if not billing_cycle:
+                return Response({
+                    'error': 'No pending payments for this loan'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            try:
+                amount_paid = allocate_payment(billing_cycle, data['amount'])
+            except PaymentRejected as e:
+                return Response({
+                    'error': str(e)
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            # Update billing cycle
+            billing_cycle.save()
+            invalidate_statements([loan.id])
+            
+            # Create payment record
+            Payment.objects.create(
+                billing_cycle=billing_cycle,
+                amount=data['amount'],
+                is_principal_payment=(amount_paid > 0)
+            )
+            
+            # Reduce principal by any excess and close a fully paid loan
+            apply_to_loan(loan, amount_paid)
+            if amount_paid > 0 or not loan.is_active:
+                loan.save(update_fields=['principal_balance', 'is_active'])
+            if amount_paid > 0:
+                ScheduledInstallment.objects.rebase(loan)
+            
+            return store_response(self.request, Response({
+                'error': None
+            }, status=status.HTTP_200_OK))
+
+class BatchPaymentView(APIView):
+    # Settlement files: one JSON payment per line, outcomes returned per line.
+    # The body is read from the request stream a line at a time rather than
+    # loaded whole.
+    def post(self, request):
+        failures = []
+        results = list(apply_payment_lines(
+            request._request,
+            on_failure=lambda first, last, e: failures.append(f'Lines {first}-{last} were not applied: {e}')
+        ))
+        rejected = sum(1 for result in results if result['error'])
+        return Response({
+            # Chunks before a failed one stay applied; results say which lines
+            'error': '; '.join(failures) or None,
+            'accepted': len(results) - rejected,
+            'rejected': rejected,
+            'results': results
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR if failures else status.HTTP_200_OK)
 
 class GetStatementView(APIView):
     def get(self, request):
         serializer = StatementSerializer(data=request.GET)
         if serializer.is_valid():
             try:
-                data = serializer.validated_data
-                loan = Loan.objects.get(id=data['loan_id'])
-                
-                past_transactions = []
-                payments = Payment.objects.filter(billing_cycle__loan=loan).select_related('billing_cycle')
-                
-                for payment in payments:
-                    past_transactions.append({
-                        'date': payment.payment_date.strftime('%Y-%m-%d'),
-                        'principal': payment.billing_cycle.principal_portion,
-                        'interest': payment.billing_cycle.interest_portion,
-                        'amount_paid': payment.amount
-                    })
-                
-                upcoming_transactions = []
-                unpaid_billing = BillingCycle.objects.filter(
-                    loan=loan,
-                    is_paid=False
-                ).order_by('billing_date')
-                
-                for billing in unpaid_billing:
-                    upcoming_transactions.append({
-                        'date': billing.due_date.strftime('%Y-%m-%d'),
-                        'amount_due': billing.min_due + billing.past_due
-                    })
-                
-                return Response({
-                    'error': None,
-                    'past_transactions': past_transactions,
-                    'upcoming_transactions': upcoming_transactions
-                }, status=status.HTTP_200_OK)
+                etag, statement = self.resolve_statement(
+                    serializer.validated_data,
+                    request.GET.get('cursor', ''),
+                    request.headers.get('If-None-Match', '')
+                )
+                if statement is None:
+                    return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+                return Response(statement, status=status.HTTP_200_OK, headers={'ETag': etag})
             except Loan.DoesNotExist:
                 return Response({
                     'error': 'Loan not found'
@@ -263,4 +346,257 @@ class GetStatementView(APIView):
                 }, status=status.HTTP_400_BAD_REQUEST)
         return Response({
             'error': serializer.errors
-        }, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    def resolve_statement(self, data, raw_cursor, if_none_match):
+        """Return ``(etag, statement)``; statement is None when the client's copy is current."""
+        loan_id = data['loan_id']
+        cursor = data.get('cursor')
+        limit = data.get('limit')
+        if cursor and not limit:
+            limit = STATEMENT_PAGE_SIZE
+        
+        # Unchanged statements are answered from the version alone
+        version = statement_version(loan_id)
+        variant = f'{raw_cursor}:{limit or ""}'
+        etag = statement_etag(f'{version}:{variant}')
+        if etag in parse_etags(if_none_match):
+            return etag, None
+        
+        statement = get_cached_statement(loan_id, version, variant)
+        if statement is None:
+            with replica_reads(loan_pin(loan_id)):
+                statement = self.build_statement(loan_id, cursor, limit)
+            cache_statement(loan_id, version, statement, variant)
+        return etag, statement
+    
+    def build_statement(self, loan_id, cursor=None, limit=None):
+        loan = Loan.objects.get(id=loan_id)
+        
+        past_transactions = []
+        payments = Payment.objects.filter(
+            billing_cycle__loan=loan
+        ).select_related('billing_cycle').order_by('payment_date', 'id')
+        
+        # Keyset pagination on (payment_date, id)
+        if cursor:
+            payment_date, payment_id = cursor
+            payments = payments.filter(
+                Q(payment_date__gt=payment_date) | Q(payment_date=payment_date, id__gt=payment_id)
+            )
+        has_more = False
+        if limit:
+            payments = list(payments[:limit + 1])
+            has_more = len(payments) > limit
+            payments = payments[:limit]
+        
+        for payment in payments:
+            past_transactions.append({
+                'date': payment.payment_date.strftime('%Y-%m-%d'),
+                'principal': payment.billing_cycle.principal_portion,
+                'interest': payment.billing_cycle.interest_portion,
+                'amount_paid': payment.amount
+            })
+        
+        upcoming_transactions = []
+        unpaid_billing = BillingCycle.objects.filter(
+            loan=loan,
+            is_paid=False
+        ).order_by('billing_date')
+        
+        for billing in unpaid_billing:
+            upcoming_transactions.append({
+                'date': billing.due_date.strftime('%Y-%m-%d'),
+                'amount_due': billing.min_due + billing.past_due
+            })
+        
+        # Installments not yet covered by a billing cycle
+        upcoming_installments = []
+        for installment in loan.installments.filter(is_billed=False):
+            upcoming_installments.append({
+                'date': installment.due_date.strftime('%Y-%m-%d'),
+                'amount_due': installment.amount_due,
+                'principal': installment.principal,
+                'interest': installment.interest
+            })
+        
+        statement = {
+            'error': None,
+            'past_transactions': past_transactions,
+            'upcoming_transactions': upcoming_transactions,
+            'upcoming_installments': upcoming_installments
+        }
+        if limit:
+            statement['next_cursor'] = encode_cursor(payments[-1]) if has_more else None
+        return statement
+
+
+def encode_cursor(payment):
+    return urlsafe_b64encode(f'{payment.payment_date:%Y-%m-%d}|{payment.id}'.encode()).decode()
+
+
+class Echo:
+    # File-like object for csv.writer that hands each row back to the caller
+    def write(self, value):
+        return value
+
+
+class StatementExportView(APIView):
+    def get(self, request):
+        serializer = StatementExportSerializer(data=request.GET)
+        if serializer.is_valid():
+            data = serializer.validated_data
+            if not Loan.objects.filter(id=data['loan_id']).exists():
+                return Response({
+                    'error': 'Loan not found'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            rows = replica_stream(self.statement_rows(data['loan_id']), loan_pin(data['loan_id']))
+            if isinstance(request._request, ASGIRequest):
+                # Django 3.2's ASGI handler iterates streaming_content on the
+                # event loop, where the ORM refuses to run; read the rows here,
+                # on the view's worker thread, and stream them from memory
+                rows = list(rows)
+            if data['output'] == 'csv':
+                response = StreamingHttpResponse(self.csv_lines(rows), content_type='text/csv')
+                response['Content-Disposition'] = f'attachment; filename="statement-{data["loan_id"]}.csv"'
+            else:
+                lines = (json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows)
+                response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+            return response
+        return Response({
+            'error': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    def statement_rows(self, loan_id):
+        # Server-side iteration keeps only one chunk of rows in memory
+        payments = Payment.objects.filter(
+            billing_cycle__loan_id=loan_id
+        ).select_related('billing_cycle').order_by('payment_date', 'id')
+        for payment in payments.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield {
+                'type': 'payment',
+                'date': payment.payment_date.strftime('%Y-%m-%d'),
+                'amount': payment.amount,
+                'principal': payment.billing_cycle.principal_portion,
+                'interest': payment.billing_cycle.interest_portion
+            }
+        
+        unpaid_billing = BillingCycle.objects.filter(
+            loan_id=loan_id,
+            is_paid=False
+        ).order_by('billing_date', 'id')
+        for billing in unpaid_billing.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield {
+                'type': 'billing',
+                'date': billing.due_date.strftime('%Y-%m-%d'),
+                'amount': billing.min_due + billing.past_due,
+                'principal': billing.principal_portion,
+                'interest': billing.interest_portion
+            }
+        
+        installments = ScheduledInstallment.objects.filter(
+            loan_id=loan_id,
+            is_billed=False
+        ).order_by('due_date', 'id')
+        for installment in installments.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield {
+                'type': 'installment',
+                'date': installment.due_date.strftime('%Y-%m-%d'),
+                'amount': installment.amount_due,
+                'principal': installment.principal,
+                'interest': installment.interest
+            }
+    
+    def csv_lines(self, rows):
+        columns = ['type', 'date', 'amount', 'principal', 'interest']
+        writer = csv.DictWriter(Echo(), fieldnames=columns)
+        yield writer.writerow(dict(zip(columns, columns)))
+        for row in rows:
+            yield writer.writerow(row)
+
+
+# Native async views for ASGI deployments. They skip DRF, which has no async
+# support, and run ORM work on the bounded pool in async_db.
+
+def json_response(data, status_code=status.HTTP_200_OK, headers=None):
+    # Rendered like the DRF views so both paths return identical bodies
+    response = HttpResponse(JSONRenderer().render(data), status=status_code, content_type='application/json')
+    for name, value in (headers or {}).items():
+        response[name] = value
+    return response
+
+
+async def async_home(request):
+    return JsonResponse(API_INDEX)
+
+
+async def async_get_statement(request):
+    serializer = StatementSerializer(data=request.GET)
+    if not serializer.is_valid():
+        return json_response({
+            'error': serializer.errors
+        }, status.HTTP_400_BAD_REQUEST)
+    try:
+        etag, statement = await run_db(
+            GetStatementView().resolve_statement,
+            serializer.validated_data,
+            request.GET.get('cursor', ''),
+            request.headers.get('If-None-Match', '')
+        )
+    except Loan.DoesNotExist:
+        return json_response({
+            'error': 'Loan not found'
+        }, status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return json_response({
+            'error': str(e)
+        }, status.HTTP_400_BAD_REQUEST)
+    if statement is None:
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        response['ETag'] = etag
+        return response
+    return json_response(statement, headers={'ETag': etag})
+
+
+def register_user(payload):
+    serializer = UserRegistrationSerializer(data=payload)
+    if not serializer.is_valid():
+        return None, serializer.errors
+    with transaction.atomic():
+        user = serializer.save()
+        request_credit_scores([user.aadhar_id], schedule=False)
+    return user, None
+
+
+async def async_register_user(request):
+    if request.method != 'POST':
+        return json_response({
+            'error': f'Method "{request.method}" not allowed.'
+        }, status.HTTP_405_METHOD_NOT_ALLOWED)
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        return json_response({
+            'error': 'Request body must be JSON'
+        }, status.HTTP_400_BAD_REQUEST)
+    try:
+        user, errors = await run_db(register_user, payload)
+    except Exception as e:
+        return json_response({
+            'error': str(e)
+        }, status.HTTP_400_BAD_REQUEST)
+    if errors:
+        return json_response({
+            'error': errors
+        }, status.HTTP_400_BAD_REQUEST)
+    
+    # The user is committed; the broker publish doesn't hold up the response
+    publish(schedule_flush)
+    return json_response({
+        'error': None,
+        'unique_user_id': user.id
+    })
+
+# csrf_exempt() can't wrap a coroutine function on this Django version
+async_register_user.csrf_exempt = True
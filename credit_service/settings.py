@@ -28,6 +28,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'credit_app.middleware.PerformanceMiddleware',
+    'credit_app.middleware.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,6 +67,78 @@ DATABASES = {
     }
 }
 
+# Read replicas (credit_app.routers.ReplicaRouter). Statement, reporting and
+# rescoring reads go to one of DATABASE_REPLICAS, picked once per block of
+# reads; a client that writes (by cookie), and any loan that was written (in
+# the REPLICA_PIN_CACHE_ALIAS cache), read from the primary for
+# REPLICA_PIN_SECONDS, which must exceed the replication lag. Loans are only
+# read from replicas when that cache is shared between processes. To try it
+# with two SQLite files, list the replica below in DATABASE_REPLICAS and copy
+# the primary into it with `manage.py sync_replica`; tests mirror it onto the
+# default test database.
+DATABASES['replica'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': BASE_DIR / 'db-replica.sqlite3',
+    'TEST': {'MIRROR': 'default'},
+}
+DATABASE_REPLICAS = ()
+REPLICA_PIN_SECONDS = 5
+REPLICA_PIN_CACHE_ALIAS = 'default'
+
+# Transaction sharding (credit_app.sharding). Transaction and CustomerBalance
+# rows live on the alias in TRANSACTION_SHARDS picked by a hash of their
+# aadhar_id; empty keeps them on the default database. The list can't change
+# without moving existing rows. The two shards below are unused until listed,
+# e.g. TRANSACTION_SHARDS = ('transactions_0', 'transactions_1'); each shard is
+# then migrated on its own with `manage.py migrate --database transactions_0`.
+DATABASES['transactions_0'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': BASE_DIR / 'db-transactions-0.sqlite3',
+}
+DATABASES['transactions_1'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': BASE_DIR / 'db-transactions-1.sqlite3',
+}
+TRANSACTION_SHARDS = ()
+# Threads running one query per shard for population-wide reads
+SHARD_POOL_SIZE = 8
+
+DATABASE_ROUTERS = ['credit_app.routers.ShardRouter', 'credit_app.routers.ReplicaRouter']
+
+# Caches
+# The statement and eligibility caches hold shared state; point them at a
+# Redis-compatible backend (e.g. django_redis.cache.RedisCache) when running
+# more than one process. `manage.py check --deploy` reports aliases that
+# are still per-process LocMemCaches.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'statements': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'statements',
+        'TIMEOUT': 3600,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'eligibility': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'eligibility',
+        'TIMEOUT': 3600,
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+STATEMENT_CACHE_ALIAS = 'statements'
+# Lifetime of a loan's statement version (and so of its ETag); also the
+# longest a process can miss another process's invalidation
+STATEMENT_VERSION_TTL = 300
+
+# Underwriting verdicts for ApplyLoanView: a per-process LRU whose entries
+# live ELIGIBILITY_LOCAL_TTL seconds, in front of the shared 'eligibility'
+# cache. The shared tier is skipped while that cache is a LocMemCache.
+ELIGIBILITY_CACHE_ALIAS = 'eligibility'
+ELIGIBILITY_LOCAL_MAX_ENTRIES = 10000
+ELIGIBILITY_LOCAL_TTL = 5
+
 # Static files (CSS, JavaScript, Images)
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
@@ -81,4 +155,29 @@ CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
-CELERY_TIMEZONE = 'UTC'
\ No newline at end of file
+CELERY_TIMEZONE = 'UTC'
+
+# Inline credit scoring in ApplyLoanView when the Celery task hasn't run yet
+CREDIT_SCORE_INLINE_BUDGET_MS = 200
+CREDIT_SCORE_TASK_WAIT_SECONDS = 2
+CREDIT_SCORE_INLINE_WORKERS = 4
+
+# Coalesced credit scoring: requests within the window collapse into one
+# pending row per customer, scored in batches by flush_credit_scores. The
+# flush flag lives in the default cache, which must be shared between
+# processes in production. The counters are one CreditScoreCounter row: every
+# registration commit then runs one UPDATE of it, in autocommit, so concurrent
+# registrations queue on that row only for the length of the statement.
+CREDIT_SCORE_COALESCE_SECONDS = 5
+CREDIT_SCORE_BATCH_SIZE = 500
+
+# Async views (credit_app.async_db): threads running ORM work for one ASGI
+# process, and threads publishing to the broker in the background
+ASYNC_DB_POOL_SIZE = 8
+ASYNC_PUBLISH_POOL_SIZE = 2
+
+# Request instrumentation (credit_app.middleware.PerformanceMiddleware).
+# Set SLOW_REQUEST_MS to log the SQL of requests slower than that many ms.
+SLOW_REQUEST_MS = None
+SLOW_REQUEST_MAX_STATEMENTS = 100
+PERFORMANCE_EXCLUDED_PATHS = ('/metrics/',)